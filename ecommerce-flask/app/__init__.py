@@ -1,32 +1,107 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from flask_migrate import Migrate
 from config import Config
+from app.services.database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
 login_manager = LoginManager()
 
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    from app.services.database import configure_database
+    configure_database(app.config)
     db.init_app(app)
+    migrate.init_app(app, db, render_as_batch=True)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     
+    from app.services.cart_store import create_cart_store
+    from app.services.catalog import create_catalog_cache
+    from app.services.facets import create_facet_index
+    from app.services.suggest import create_suggest_index
+    from app.services.mpesa import create_daraja_client
+    from app.services.notifications import create_pubsub
+    from app.services.identity import create_identity_cache, load_user
+    from app.services.passwords import create_password_hasher
+    app.extensions['cart_store'] = create_cart_store(app.config)
+    app.extensions['catalog_cache'] = create_catalog_cache(app.config)
+    app.extensions['facet_index'] = create_facet_index(app.config)
+    app.extensions['suggest_index'] = create_suggest_index(app.config)
+    app.extensions['mpesa'] = create_daraja_client(app.config)
+    app.extensions['pubsub'] = create_pubsub(app.config)
+    app.extensions['identity_cache'] = create_identity_cache(app.config)
+    login_manager.user_loader(load_user)
+    app.extensions['password_hasher'] = create_password_hasher(app.config)
+    
+    from app.services.http_cache import cache_fragment
+    from app.services.money import format_money
+    app.jinja_env.globals['cache_fragment'] = cache_fragment
+    app.jinja_env.filters['money'] = format_money
+    
     from app.blueprints.main import main_bp
     from app.blueprints.auth import auth_bp
     from app.blueprints.products import products_bp
     from app.blueprints.cart import cart_bp
     from app.blueprints.payments import payments_bp
+    from app.blueprints.admin import admin_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(products_bp, url_prefix='/products')
     app.register_blueprint(cart_bp, url_prefix='/cart')
     app.register_blueprint(payments_bp, url_prefix='/payments')
+    app.register_blueprint(admin_bp, url_prefix='/admin')
+    
+    from app.commands import reservations_cli, search_cli, webhooks_cli, orders_cli, catalog_cli, profile_cli, passwords_cli, recommendations_cli
+    app.cli.add_command(reservations_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(webhooks_cli)
+    app.cli.add_command(orders_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(profile_cli)
+    app.cli.add_command(passwords_cli)
+    app.cli.add_command(recommendations_cli)
+    
+    if app.config['WEBHOOK_WORKER_THREADS'] and not app.testing:
+        _start_webhook_workers(app)
     
+    from app.services.database import tune_engine, replica_binds, init_routing
+    from app.services.search import init_search_index, attach_search_replica
+    from app.services.query_budget import init_query_budget
+    from app.services.metrics import init_metrics
+    from app.services.profiler import init_profiler
+    
+    # Schema is managed by migrations: run `flask db upgrade` to create it
     with app.app_context():
-        db.create_all()
+        for engine in db.engines.values():
+            tune_engine(engine, app.config)
+        init_search_index(db.engine)
+        for bind in replica_binds(app.config):
+            attach_search_replica(db.engines[bind])
+        init_query_budget(app, db.engines.values())
+        init_metrics(app, db.engines.values())
+        init_profiler(app)
+        init_routing(app)
     
     return app
+
+def _start_webhook_workers(app):
+    """Drain payment webhooks from inside the web process, starting with the first request"""
+    import threading
+    from app.services.webhooks import WebhookWorkerPool
+    lock = threading.Lock()
+    
+    @app.before_request
+    def start_webhook_workers():
+        if 'webhook_workers' in app.extensions:
+            return
+        with lock:
+            if 'webhook_workers' not in app.extensions:
+                app.extensions['webhook_workers'] = WebhookWorkerPool(
+                    app, threads=app.config['WEBHOOK_WORKER_THREADS']
+                ).start()
@@ -0,0 +1,27 @@
+from flask import Blueprint, Response, abort, jsonify, request
+from app.services.profiler import check_profile_token, get_profiler
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.before_request
+def require_profile_token():
+    """Admin endpoints take the token printed by `flask profile token`"""
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer ') or not check_profile_token(auth[len('Bearer '):]):
+        abort(401)
+
+@admin_bp.route('/profile')
+def profile_summary():
+    """Profiled requests and samples per endpoint"""
+    return jsonify(get_profiler().summary())
+
+@admin_bp.route('/profile/stacks')
+def profile_stacks():
+    """Collapsed stacks, ready for flamegraph.pl or speedscope"""
+    lines = get_profiler().collapsed(request.args.get('endpoint'))
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain')
+
+@admin_bp.route('/profile/reset', methods=['POST'])
+def reset_profile():
+    get_profiler().reset()
+    return jsonify({'success': True})
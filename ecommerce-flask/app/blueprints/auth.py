@@ -2,6 +2,9 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models import User
+from app.blueprints.cart import merge_guest_cart
+from app.services.order_summary import get_order_summary
+from app.services.passwords import HasherBusyError
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -25,7 +28,11 @@ def register():
             return redirect(url_for('auth.register'))
         
         user = User(username=username, email=email, phone=phone)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HasherBusyError:
+            flash('We are busy right now, please try again in a moment', 'error')
+            return render_template('auth/register.html'), 503
         db.session.add(user)
         db.session.commit()
         
@@ -44,8 +51,17 @@ def login():
         password = request.form.get('password')
         user = User.query.filter_by(email=email).first()
         
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except HasherBusyError:
+            flash('We are busy right now, please try again in a moment', 'error')
+            return render_template('auth/login.html'), 503
+        
+        if valid:
+            # Persists a hash upgraded by check_password
+            db.session.commit()
             login_user(user)
+            merge_guest_cart(user.id)
             next_page = request.args.get('next')
             return redirect(next_page or url_for('main.index'))
         
@@ -63,4 +79,4 @@ def logout():
 @auth_bp.route('/profile')
 @login_required
 def profile():
-    return render_template('auth/profile.html')
+    return render_template('auth/profile.html', summary=get_order_summary(current_user.id))
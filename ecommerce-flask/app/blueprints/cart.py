@@ -1,35 +1,49 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_login import login_required, current_user
+from uuid import uuid4
 from app import db
 from app.models import Product, Order, OrderItem
+from app.services.cart import resolve_cart
+from app.services.cart_store import get_cart_store
 
 cart_bp = Blueprint('cart', __name__)
 
+def _cart_id(create=False):
+    """Cart key for the current visitor; signed-in users share one cart across devices"""
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    
+    guest_id = session.get('cart_id')
+    if guest_id is None and create:
+        guest_id = session['cart_id'] = uuid4().hex
+    return f'guest:{guest_id}' if guest_id else None
+
 def get_cart():
-    """Get cart from session"""
-    return session.get('cart', {})
+    """Get cart from the cart store"""
+    cart_id = _cart_id()
+    return get_cart_store().get(cart_id) if cart_id else {}
 
 def save_cart(cart):
-    """Save cart to session"""
-    session['cart'] = cart
-    session.modified = True
+    """Replace the whole cart in the cart store"""
+    get_cart_store().replace(_cart_id(create=True), cart)
+
+def merge_guest_cart(user_id):
+    """Fold the guest cart from this session into a user's cart after login"""
+    guest_id = session.pop('cart_id', None)
+    if not guest_id:
+        return
+    
+    store = get_cart_store()
+    guest_key = f'guest:{guest_id}'
+    for product_id, quantity in store.get(guest_key).items():
+        if quantity > 0:
+            store.add(f'user:{user_id}', product_id, quantity)
+    store.clear(guest_key)
 
 @cart_bp.route('/')
 def view_cart():
     cart = get_cart()
-    cart_items = []
-    total = 0
-    
-    for product_id, quantity in cart.items():
-        product = Product.query.get(int(product_id))
-        if product:
-            subtotal = product.price * quantity
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'subtotal': subtotal
-            })
-            total += subtotal
+    cart_items, total = resolve_cart(cart)
     
     return render_template('cart/view.html', cart_items=cart_items, total=total)
 
@@ -38,43 +52,41 @@ def add_to_cart(product_id):
     product = Product.query.get_or_404(product_id)
     quantity = request.form.get('quantity', 1, type=int)
     
+    if quantity < 1:
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'success': False, 'error': 'Quantity must be at least 1'}), 400
+        flash('Quantity must be at least 1', 'error')
+        return redirect(url_for('products.product_detail', slug=product.slug))
+    
     if product.stock < quantity:
         flash('Not enough stock available', 'error')
         return redirect(url_for('products.product_detail', slug=product.slug))
     
-    cart = get_cart()
-    product_key = str(product_id)
-    
-    if product_key in cart:
-        cart[product_key] += quantity
-    else:
-        cart[product_key] = quantity
-    
-    save_cart(cart)
+    store = get_cart_store()
+    cart_id = _cart_id(create=True)
+    store.add(cart_id, product_id, quantity)
     flash(f'{product.name} added to cart!', 'success')
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({'success': True, 'cart_count': sum(cart.values())})
+        return jsonify({'success': True, 'cart_count': store.count(cart_id)})
     
     return redirect(url_for('cart.view_cart'))
 
 @cart_bp.route('/update/<int:product_id>', methods=['POST'])
 def update_cart(product_id):
     quantity = request.form.get('quantity', 1, type=int)
-    cart = get_cart()
-    product_key = str(product_id)
+    store = get_cart_store()
+    cart_id = _cart_id(create=True)
     
     if quantity <= 0:
-        cart.pop(product_key, None)
+        store.remove(cart_id, product_id)
     else:
         product = Product.query.get_or_404(product_id)
         if product.stock >= quantity:
-            cart[product_key] = quantity
+            store.set(cart_id, product_id, quantity)
         else:
             flash('Not enough stock', 'error')
     
-    save_cart(cart)
-    
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({'success': True})
     
@@ -82,9 +94,9 @@ def update_cart(product_id):
 
 @cart_bp.route('/remove/<int:product_id>', methods=['POST'])
 def remove_from_cart(product_id):
-    cart = get_cart()
-    cart.pop(str(product_id), None)
-    save_cart(cart)
+    cart_id = _cart_id()
+    if cart_id:
+        get_cart_store().remove(cart_id, product_id)
     flash('Item removed from cart', 'success')
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -94,7 +106,9 @@ def remove_from_cart(product_id):
 
 @cart_bp.route('/clear', methods=['POST'])
 def clear_cart():
-    save_cart({})
+    cart_id = _cart_id()
+    if cart_id:
+        get_cart_store().clear(cart_id)
     flash('Cart cleared', 'success')
     return redirect(url_for('cart.view_cart'))
 
@@ -106,23 +120,11 @@ def checkout():
         flash('Your cart is empty', 'error')
         return redirect(url_for('cart.view_cart'))
     
-    cart_items = []
-    total = 0
-    
-    for product_id, quantity in cart.items():
-        product = Product.query.get(int(product_id))
-        if product:
-            subtotal = product.price * quantity
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'subtotal': subtotal
-            })
-            total += subtotal
+    cart_items, total = resolve_cart(cart)
     
     return render_template('cart/checkout.html', cart_items=cart_items, total=total)
 
 @cart_bp.route('/count')
 def cart_count():
-    cart = get_cart()
-    return jsonify({'count': sum(cart.values())})
+    cart_id = _cart_id()
+    return jsonify({'count': get_cart_store().count(cart_id) if cart_id else 0})
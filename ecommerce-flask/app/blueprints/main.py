@@ -1,12 +1,14 @@
 from flask import Blueprint, render_template
-from app.models import Product, Category
+from app.services.catalog import get_categories, get_featured_products
+from app.services.http_cache import cache_page
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
+@cache_page
 def index():
-    featured_products = Product.query.filter_by(is_active=True).limit(8).all()
-    categories = Category.query.all()
+    featured_products = get_featured_products()
+    categories = get_categories()
     return render_template('index.html', products=featured_products, categories=categories)
 
 @main_bp.route('/about')
@@ -1,40 +1,35 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify, current_app
 from flask_login import login_required, current_user
 import stripe
-import requests
-from datetime import datetime
-import base64
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
 from app import db
-from app.models import Product, Order, OrderItem
+from app.models import Order, OrderItem
 from app.blueprints.cart import get_cart, save_cart
+from app.services.cart import resolve_cart
+from app.services.cart_store import SessionCartStore, get_cart_store
+from app.services.mpesa import get_daraja_client
+from app.services.inventory import (reserve_stock, reserve_late_payment, release_reservations, commit_reservations,
+                                    InsufficientStockError)
+from app.services.notifications import get_pubsub, publish_order_status, order_status_token, check_order_status_token
+from app.services.webhooks import record_webhook_event
+from app.services.metrics import track_http
+from app.services.order_summary import get_order_summary, STATUSES
+from app.services.pagination import keyset_paginate
+from app.services.money import to_major_ceil
+from app.services.database import pin_primary
+from app.services.recommendations import queue_recommendation_refresh
 
 payments_bp = Blueprint('payments', __name__)
 
-def get_mpesa_access_token():
-    """Get M-Pesa access token from Safaricom Daraja API"""
-    consumer_key = current_app.config['MPESA_CONSUMER_KEY']
-    consumer_secret = current_app.config['MPESA_CONSUMER_SECRET']
-    
-    api_url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    if current_app.config['MPESA_ENVIRONMENT'] == 'production':
-        api_url = "https://api.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
-    
-    credentials = base64.b64encode(f"{consumer_key}:{consumer_secret}".encode()).decode()
-    headers = {"Authorization": f"Basic {credentials}"}
-    
-    response = requests.get(api_url, headers=headers)
-    return response.json().get('access_token')
+@payments_bp.before_request
+def read_orders_from_primary():
+    # Order pages follow checkouts and payment callbacks; a lagging replica
+    # would show a paid order as pending
+    pin_primary()
 
-def generate_mpesa_password():
-    """Generate M-Pesa password for STK push"""
-    shortcode = current_app.config['MPESA_SHORTCODE']
-    passkey = current_app.config['MPESA_PASSKEY']
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    
-    password_str = f"{shortcode}{passkey}{timestamp}"
-    password = base64.b64encode(password_str.encode()).decode()
-    
-    return password, timestamp
+# Order pages render every item with its product: load both in two IN queries
+ORDER_WITH_ITEMS = selectinload(Order.items).selectinload(OrderItem.product)
 
 @payments_bp.route('/process', methods=['POST'])
 @login_required
@@ -48,17 +43,16 @@ def process_payment():
         flash('Your cart is empty', 'error')
         return redirect(url_for('cart.view_cart'))
     
-    # Calculate total
-    total = 0
-    for product_id, quantity in cart.items():
-        product = Product.query.get(int(product_id))
-        if product:
-            total += product.price * quantity
+    # Resolve products and total in a single query
+    cart_items, total = resolve_cart(cart)
+    if not cart_items:
+        flash('The products in your cart are no longer available', 'error')
+        return redirect(url_for('cart.view_cart'))
     
     # Create order
     order = Order(
         user_id=current_user.id,
-        total=total,
+        total_cents=total,
         status='pending',
         payment_method=payment_method,
         shipping_address=shipping_address,
@@ -67,19 +61,28 @@ def process_payment():
     db.session.add(order)
     db.session.flush()
     
-    # Create order items
-    for product_id, quantity in cart.items():
-        product = Product.query.get(int(product_id))
-        if product:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=product.id,
-                quantity=quantity,
-                price=product.price
-            )
-            db.session.add(order_item)
-            # Update stock
-            product.stock -= quantity
+    # Create order items in one executemany rather than one INSERT per line;
+    # an empty executemany would run INSERT ... DEFAULT VALUES
+    rows = [
+        {
+            'order_id': order.id,
+            'product_id': item['product'].id,
+            'quantity': item['quantity'],
+            'price_cents': item['product'].price_cents
+        }
+        for item in cart_items
+    ]
+    if rows:
+        db.session.execute(insert(OrderItem), rows)
+    
+    # Hold stock for the whole cart in one conditional batch
+    try:
+        reserve_stock(order, cart_items)
+    except InsufficientStockError as e:
+        db.session.rollback()
+        names = [item['product'].name for item in cart_items if item['product'].id in e.product_ids]
+        flash(f'Not enough stock available for {", ".join(names)}', 'error')
+        return redirect(url_for('cart.view_cart'))
     
     db.session.commit()
     
@@ -97,7 +100,7 @@ def process_payment():
 @payments_bp.route('/stripe/checkout/<int:order_id>')
 @login_required
 def stripe_checkout(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(ORDER_WITH_ITEMS).get_or_404(order_id)
     
     if order.user_id != current_user.id:
         flash('Unauthorized', 'error')
@@ -114,20 +117,21 @@ def stripe_checkout(order_id):
                     'name': item.product.name,
                     'images': [item.product.image_url] if item.product.image_url else [],
                 },
-                'unit_amount': int(item.price * 100),  # Stripe uses cents
+                'unit_amount': item.price_cents,
             },
             'quantity': item.quantity,
         })
     
     try:
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=line_items,
-            mode='payment',
-            success_url=url_for('payments.payment_success', order_id=order.id, _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
-            cancel_url=url_for('payments.payment_cancel', order_id=order.id, _external=True),
-            metadata={'order_id': order.id}
-        )
+        with track_http('stripe'):
+            checkout_session = stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                line_items=line_items,
+                mode='payment',
+                success_url=url_for('payments.payment_success', order_id=order.id, _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
+                cancel_url=url_for('payments.payment_cancel', order_id=order.id, _external=True),
+                metadata={'order_id': order.id}
+            )
         return redirect(checkout_session.url)
     except Exception as e:
         flash(f'Payment error: {str(e)}', 'error')
@@ -142,7 +146,8 @@ def mpesa_checkout(order_id):
         flash('Unauthorized', 'error')
         return redirect(url_for('main.index'))
     
-    return render_template('payments/mpesa_checkout.html', order=order)
+    return render_template('payments/mpesa_checkout.html', order=order,
+                           status_token=order_status_token(order))
 
 @payments_bp.route('/mpesa/stk-push', methods=['POST'])
 @login_required
@@ -157,98 +162,66 @@ def mpesa_stk_push():
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
     try:
-        access_token = get_mpesa_access_token()
-        password, timestamp = generate_mpesa_password()
+        # Daraja takes whole KES (assuming prices are in KES); round up so the
+        # order is never underpaid
+        amount = to_major_ceil(order.total_cents)
         
-        api_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-        if current_app.config['MPESA_ENVIRONMENT'] == 'production':
-            api_url = "https://api.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
-        
-        # Amount in KES (convert from USD if needed, here assuming direct KES)
-        amount = int(order.total)
-        
-        # Format phone number (remove leading 0 or +, ensure starts with 254)
-        phone = phone.strip().replace('+', '')
-        if phone.startswith('0'):
-            phone = '254' + phone[1:]
-        elif not phone.startswith('254'):
-            phone = '254' + phone
-        
-        payload = {
-            "BusinessShortCode": current_app.config['MPESA_SHORTCODE'],
-            "Password": password,
-            "Timestamp": timestamp,
-            "TransactionType": "CustomerPayBillOnline",
-            "Amount": amount,
-            "PartyA": phone,
-            "PartyB": current_app.config['MPESA_SHORTCODE'],
-            "PhoneNumber": phone,
-            "CallBackURL": current_app.config['MPESA_CALLBACK_URL'],
-            "AccountReference": f"Order{order.id}",
-            "TransactionDesc": f"Payment for Order #{order.id}"
-        }
-        
-        response = requests.post(api_url, json=payload, headers=headers)
-        result = response.json()
+        with track_http('mpesa'):
+            result = get_daraja_client().stk_push(
+                phone=phone,
+                amount=amount,
+                reference=f"Order{order.id}",
+                description=f"Payment for Order #{order.id}",
+                callback_url=current_app.config['MPESA_CALLBACK_URL']
+            )
         
         if result.get('ResponseCode') == '0':
             # Store checkout request ID for verification
             order.payment_id = result.get('CheckoutRequestID')
+            # A retry after a failed attempt is pending again, so a second
+            # failure is a change the checkout page gets told about
+            if order.status == 'failed':
+                order.status = 'pending'
             db.session.commit()
+            publish_order_status(order.id, order.status)
             
             return jsonify({
                 'success': True,
                 'message': 'Please check your phone and enter M-Pesa PIN',
-                'checkout_request_id': result.get('CheckoutRequestID')
+                'checkout_request_id': result.get('CheckoutRequestID'),
+                'status': order.status
             })
         else:
             return jsonify({
                 'success': False,
                 'message': result.get('CustomerMessage', 'Failed to initiate payment')
             })
-            
+    
     except Exception as e:
         return jsonify({'success': False, 'message': str(e)})
 
 @payments_bp.route('/mpesa/callback', methods=['POST'])
 def mpesa_callback():
     """Handle M-Pesa callback"""
-    data = request.get_json()
+    payload = request.get_data(as_text=True)
+    data = request.get_json(silent=True) or {}
     
-    result_code = data['Body']['stkCallback']['ResultCode']
-    checkout_request_id = data['Body']['stkCallback']['CheckoutRequestID']
+    try:
+        checkout_request_id = data['Body']['stkCallback']['CheckoutRequestID']
+    except (KeyError, TypeError):
+        return jsonify({'ResultCode': 1, 'ResultDesc': 'Malformed callback'}), 400
     
-    order = Order.query.filter_by(payment_id=checkout_request_id).first()
-    
-    if order:
-        if result_code == 0:
-            # Payment successful
-            order.status = 'paid'
-            
-            # Extract transaction details
-            callback_metadata = data['Body']['stkCallback'].get('CallbackMetadata', {})
-            items = callback_metadata.get('Item', [])
-            
-            for item in items:
-                if item.get('Name') == 'MpesaReceiptNumber':
-                    order.payment_id = item.get('Value')
-                    break
-            
-            # Clear cart
-            cart_key = f'cart_{order.user_id}'
-            session.pop(cart_key, None)
-        else:
-            order.status = 'failed'
-        
-        db.session.commit()
+    # Persist and acknowledge; the webhook workers apply it to the order
+    record_webhook_event('mpesa', checkout_request_id, payload)
     
     return jsonify({'ResultCode': 0, 'ResultDesc': 'Accepted'})
 
+def _clear_paid_cart():
+    # The webhook worker empties a paid user's cart in a shared store, but
+    # cannot reach one kept in this browser's session cookie
+    if isinstance(get_cart_store(), SessionCartStore):
+        save_cart({})
+
 @payments_bp.route('/mpesa/check-status/<int:order_id>')
 @login_required
 def mpesa_check_status(order_id):
@@ -258,11 +231,46 @@ def mpesa_check_status(order_id):
     if order.user_id != current_user.id:
         return jsonify({'success': False, 'message': 'Unauthorized'}), 403
     
+    if order.status == 'paid':
+        _clear_paid_cart()
+    
     return jsonify({
         'status': order.status,
         'paid': order.status == 'paid'
     })
 
+@payments_bp.route('/orders/<int:order_id>/wait-status')
+def wait_order_status(order_id):
+    """Long-poll until an order's status differs from `since` or the wait times out.
+    
+    Waiters are woken by the pub/sub fed from the payment handlers, so a
+    wait only reads the database once, on timeout, in case the change was
+    published where this process could not hear it. Access is checked with
+    the signed token handed out on the checkout page.
+    """
+    if not check_order_status_token(request.args.get('token'), order_id):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    since = request.args.get('since')
+    timeout = min(request.args.get('timeout', current_app.config['ORDER_STATUS_WAIT_TIMEOUT'], type=int),
+                  current_app.config['ORDER_STATUS_WAIT_TIMEOUT'])
+    message = get_pubsub().wait(f'order:{order_id}', timeout, since={'status': since} if since else None)
+    
+    if message is None:
+        status = db.session.query(Order.status).filter_by(id=order_id).scalar()
+        if status is None or status == since:
+            return jsonify({'status': since, 'paid': since == 'paid', 'timeout': True})
+        message = {'status': status}
+    
+    if message['status'] == 'paid':
+        _clear_paid_cart()
+    
+    return jsonify({
+        'status': message['status'],
+        'paid': message['status'] == 'paid',
+        'timeout': False
+    })
+
 @payments_bp.route('/success/<int:order_id>')
 @login_required
 def payment_success(order_id):
@@ -277,18 +285,45 @@ def payment_success(order_id):
     if session_id and order.payment_method == 'stripe':
         stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
         try:
-            checkout_session = stripe.checkout.Session.retrieve(session_id)
+            with track_http('stripe'):
+                checkout_session = stripe.checkout.Session.retrieve(session_id)
             if checkout_session.payment_status == 'paid':
-                order.status = 'paid'
-                order.payment_id = checkout_session.payment_intent
-                db.session.commit()
-                # Clear cart
-                save_cart({})
+                _settle_stripe_payment(order, checkout_session.payment_intent)
         except Exception as e:
             flash(f'Error verifying payment: {str(e)}', 'warning')
     
     return render_template('payments/success.html', order=order)
 
+def _settle_stripe_payment(order, payment_intent):
+    """Mark an order paid once Stripe confirms it, keeping its stock.
+    
+    Stripe sessions outlive STOCK_RESERVATION_TTL, so the sweeper may have
+    cancelled the order and released its stock first. The stock is then
+    reserved again; if it has sold out meanwhile the order stays cancelled
+    with the payment recorded, for a refund or restock by hand.
+    """
+    # Lock the order against a concurrent sweep while deciding
+    db.session.refresh(order, with_for_update=True)
+    if order.status == 'cancelled':
+        if not reserve_late_payment(order, payment_intent):
+            db.session.commit()
+            flash('Your payment was received, but some items sold out while you were paying. '
+                  'We will contact you about a refund.', 'warning')
+            return
+    elif order.status not in ('pending', 'failed'):
+        # Already settled, e.g. by the webhook or an earlier visit to this page
+        db.session.rollback()
+        return
+    
+    order.status = 'paid'
+    order.payment_id = payment_intent
+    commit_reservations(order)
+    queue_recommendation_refresh([order.id])
+    db.session.commit()
+    publish_order_status(order.id, order.status)
+    # Clear cart
+    save_cart({})
+
 @payments_bp.route('/cancel/<int:order_id>')
 @login_required
 def payment_cancel(order_id):
@@ -298,12 +333,16 @@ def payment_cancel(order_id):
         flash('Unauthorized', 'error')
         return redirect(url_for('main.index'))
     
+    if order.status not in ('pending', 'failed'):
+        flash('This order can no longer be cancelled', 'warning')
+        return redirect(url_for('payments.order_detail', order_id=order.id))
+    
     # Restore stock
-    for item in order.items:
-        item.product.stock += item.quantity
+    release_reservations(order)
     
     order.status = 'cancelled'
     db.session.commit()
+    publish_order_status(order.id, 'cancelled')
     
     flash('Payment was cancelled', 'warning')
     return redirect(url_for('cart.view_cart'))
@@ -323,29 +362,64 @@ def stripe_webhook():
     except stripe.error.SignatureVerificationError:
         return jsonify({'error': 'Invalid signature'}), 400
     
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        order_id = session.metadata.get('order_id')
-        
-        if order_id:
-            order = Order.query.get(order_id)
-            if order:
-                order.status = 'paid'
-                order.payment_id = session.payment_intent
-                db.session.commit()
+    # Persist and acknowledge; the webhook workers apply it to the order
+    record_webhook_event('stripe', event['id'], payload.decode('utf-8'))
     
     return jsonify({'status': 'success'})
 
+def _order_history_page():
+    """Keyset-paginate the current user's orders, newest first"""
+    return keyset_paginate(
+        Order.query.filter_by(user_id=current_user.id).options(ORDER_WITH_ITEMS),
+        [(Order.created_at, True), (Order.id, True)],
+        cursor=request.args.get('cursor'),
+        per_page=current_app.config['ORDERS_PER_PAGE'],
+        scope=f'orders:{current_user.id}'
+    )
+
 @payments_bp.route('/orders')
 @login_required
 def order_history():
-    orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
-    return render_template('payments/orders.html', orders=orders)
+    orders = _order_history_page()
+    summary = get_order_summary(current_user.id)
+    return render_template('payments/orders.html', orders=orders, summary=summary)
+
+@payments_bp.route('/api/orders')
+@login_required
+def order_history_json():
+    """JSON order history sharing the HTML page's cursors"""
+    orders = _order_history_page()
+    summary = get_order_summary(current_user.id)
+    
+    return jsonify({
+        'orders': [{
+            'id': order.id,
+            'status': order.status,
+            'total_cents': order.total_cents,
+            'payment_method': order.payment_method,
+            'created_at': order.created_at.isoformat(),
+            'items': [{
+                'product_id': item.product_id,
+                'name': item.product.name,
+                'quantity': item.quantity,
+                'price_cents': item.price_cents
+            } for item in order.items],
+            'url': url_for('payments.order_detail', order_id=order.id)
+        } for order in orders.items],
+        'summary': {
+            'order_count': summary.order_count,
+            'total_spent_cents': summary.total_spent_cents,
+            'last_order_at': summary.last_order_at.isoformat() if summary.last_order_at else None,
+            'status_counts': {s: getattr(summary, f'{s}_count') for s in STATUSES}
+        },
+        'next_cursor': orders.next_cursor,
+        'prev_cursor': orders.prev_cursor
+    })
 
 @payments_bp.route('/orders/<int:order_id>')
 @login_required
 def order_detail(order_id):
-    order = Order.query.get_or_404(order_id)
+    order = Order.query.options(ORDER_WITH_ITEMS).get_or_404(order_id)
     
     if order.user_id != current_user.id:
         flash('Unauthorized', 'error')
@@ -1,48 +1,176 @@
-from flask import Blueprint, render_template, request
-from app.models import Product, Category
+from functools import partial
+from flask import Blueprint, render_template, request, jsonify, current_app, url_for, abort
+from app.models import Product
+from app.services.catalog import get_categories, get_product_by_slug, get_related_products
+from app.services.facets import get_facet_index
+from app.services.http_cache import cache_page
+from app.services.search import search_products
+from app.services.suggest import get_suggest_index
+from app.services.pagination import keyset_paginate
 
 products_bp = Blueprint('products', __name__)
 
-@products_bp.route('/')
-def list_products():
-    page = request.args.get('page', 1, type=int)
-    category_slug = request.args.get('category')
-    search = request.args.get('search')
-    sort = request.args.get('sort', 'newest')
-    
+PER_PAGE = 12
+
+def _listing_query(args):
+    """Build the filtered product query and its keyset ordering for a listing"""
     query = Product.query.filter_by(is_active=True)
     
-    if category_slug:
-        category = Category.query.filter_by(slug=category_slug).first()
-        if category:
-            query = query.filter_by(category_id=category.id)
+    if args['category_id'] is not None:
+        query = query.filter_by(category_id=args['category_id'])
+    if args['price'] is not None:
+        _, low, high = args['price']
+        query = query.filter(Product.price_cents >= low)
+        if high is not None:
+            query = query.filter(Product.price_cents < high)
+    if args['in_stock']:
+        query = query.filter(Product.stock > 0)
     
-    if search:
-        query = query.filter(Product.name.ilike(f'%{search}%'))
+    rank = None
+    if args['search']:
+        query, rank = search_products(query, args['search'])
     
-    if sort == 'price_low':
-        query = query.order_by(Product.price.asc())
+    sort = args['sort']
+    if sort == 'relevance' and rank is not None:
+        order = [(rank, False), (Product.id, False)]
+    elif sort == 'price_low':
+        order = [(Product.price_cents, False), (Product.id, False)]
     elif sort == 'price_high':
-        query = query.order_by(Product.price.desc())
+        order = [(Product.price_cents, True), (Product.id, True)]
     else:
-        query = query.order_by(Product.created_at.desc())
+        order = [(Product.created_at, True), (Product.id, True)]
     
-    products = query.paginate(page=page, per_page=12)
-    categories = Category.query.all()
+    return query, order
+
+def _listing_args():
+    """The listing's filters and sort from the query string; unknown values are ignored"""
+    search = request.args.get('search')
+    category = request.args.get('category')
+    category_id = next((c.id for c in get_categories() if c.slug == category), None) if category else None
+    price = next((b for b in get_facet_index().buckets if b[0] == request.args.get('price')), None)
+    return {
+        'category': category if category_id is not None else None,
+        'category_id': category_id,
+        'price': price,
+        'in_stock': request.args.get('in_stock', type=int) == 1,
+        'search': search,
+        'sort': request.args.get('sort', 'relevance' if search else 'newest')
+    }
+
+def _facet_counts(args):
+    return get_facet_index().counts(
+        category_id=args['category_id'],
+        price=args['price'][0] if args['price'] else None,
+        in_stock=args['in_stock'],
+        search=args['search']
+    )
+
+def _filter_url(args, **changes):
+    """Listing URL keeping the current filters except those changed; paging restarts"""
+    params = {
+        'category': args['category'],
+        'price': args['price'][0] if args['price'] else None,
+        'in_stock': 1 if args['in_stock'] else None,
+        'search': args['search'],
+        'sort': request.args.get('sort'),
+        **changes
+    }
+    return url_for('products.list_products', **params)
+
+def _paginate_listing(query, order, args):
+    scope = ':'.join(str(args[k]) for k in ('sort', 'category_id', 'price', 'in_stock', 'search'))
+    return keyset_paginate(
+        query, order,
+        cursor=request.args.get('cursor'),
+        per_page=PER_PAGE,
+        scope=scope
+    )
+
+@products_bp.route('/')
+@cache_page
+def list_products():
+    args = _listing_args()
+    query, order = _listing_query(args)
+    facets = _facet_counts(args)
+    
+    if current_app.config['PRODUCT_PAGINATION'] == 'offset':
+        page = request.args.get('page', 1, type=int)
+        products = query.order_by(*[
+            column.desc() if descending else column.asc() for column, descending in order
+        ]).paginate(page=page, per_page=PER_PAGE, count=False)
+    else:
+        products = _paginate_listing(query, order, args)
+    products.total = facets['total']
+    
+    categories = get_categories()
     
     return render_template('products/list.html', 
                          products=products, 
                          categories=categories,
-                         current_category=category_slug,
-                         search=search,
-                         sort=sort)
+                         facets=facets,
+                         price_buckets=get_facet_index().buckets,
+                         current_category=args['category'],
+                         current_price=args['price'][0] if args['price'] else None,
+                         in_stock=args['in_stock'],
+                         search=args['search'],
+                         sort=args['sort'],
+                         filter_url=partial(_filter_url, args))
+
+@products_bp.route('/api/list')
+def list_products_json():
+    """JSON product listing sharing the HTML listing's filters and cursors"""
+    args = _listing_args()
+    query, order = _listing_query(args)
+    products = _paginate_listing(query, order, args)
+    
+    payload = {
+        'products': [{
+            'id': product.id,
+            'name': product.name,
+            'slug': product.slug,
+            'price_cents': product.price_cents,
+            'image_url': product.image_url,
+            'stock': product.stock,
+            'url': url_for('products.product_detail', slug=product.slug)
+        } for product in products.items],
+        'next_cursor': products.next_cursor,
+        'prev_cursor': products.prev_cursor
+    }
+    include_total = request.args.get('include_total', type=int) == 1
+    include_facets = request.args.get('include_facets', type=int) == 1
+    if include_total or include_facets:
+        facets = _facet_counts(args)
+        if include_total:
+            payload['total'] = facets['total']
+        if include_facets:
+            payload['facets'] = {
+                'categories': {c.slug: facets['categories'].get(c.id, 0) for c in get_categories()},
+                'prices': facets['prices'],
+                'in_stock': facets['in_stock']
+            }
+    return jsonify(payload)
+
+@products_bp.route('/suggest')
+def suggest():
+    """Search-box completions from the in-memory name index; runs no SQL"""
+    query = request.args.get('q', '')
+    entries = get_suggest_index().suggest(query, request.args.get('limit', type=int))
+    return jsonify({
+        'query': query,
+        'suggestions': [{
+            'type': entry.kind,
+            'name': entry.name,
+            'price_cents': entry.price_cents,
+            'url': url_for('products.product_detail', slug=entry.slug) if entry.kind == 'product'
+                   else url_for('products.list_products', category=entry.slug)
+        } for entry in entries]
+    })
 
 @products_bp.route('/<slug>')
+@cache_page(scopes=('related',))
 def product_detail(slug):
-    product = Product.query.filter_by(slug=slug, is_active=True).first_or_404()
-    related_products = Product.query.filter(
-        Product.category_id == product.category_id,
-        Product.id != product.id,
-        Product.is_active == True
-    ).limit(4).all()
+    product = get_product_by_slug(slug)
+    if product is None:
+        abort(404)
+    related_products = get_related_products(product)
     return render_template('products/detail.html', product=product, related_products=related_products)
@@ -0,0 +1,141 @@
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from app import db
+from app.services.inventory import sweep_expired_reservations
+from app.services.order_summary import rebuild_order_summaries
+from app.services.money import format_money, order_total_mismatches
+from app.services.catalog_io import FORMATS, import_catalog, export_catalog
+from app.services.passwords import calibrate_scrypt
+from app.services.profiler import create_profile_token
+from app.services.recommendations import rebuild_recommendations, refresh_recommendations
+from app.services.search import reindex_products
+from app.services.webhooks import drain_webhook_events, WebhookWorkerPool
+
+reservations_cli = AppGroup('reservations', help='Manage checkout stock reservations.')
+search_cli = AppGroup('search', help='Manage the product full-text index.')
+webhooks_cli = AppGroup('webhooks', help='Process queued payment webhooks.')
+orders_cli = AppGroup('orders', help='Maintain order data.')
+catalog_cli = AppGroup('catalog', help='Bulk import and export products.')
+profile_cli = AppGroup('profile', help='Profile live requests.')
+passwords_cli = AppGroup('passwords', help='Tune password hashing.')
+recommendations_cli = AppGroup('recommendations', help='Maintain the co-purchase recommendation index.')
+
+@reservations_cli.command('sweep')
+def sweep_reservations():
+    """Release stock held by abandoned pending orders."""
+    swept = sweep_expired_reservations()
+    click.echo(f'Released reservations for {swept} abandoned order(s)')
+
+@search_cli.command('reindex')
+def reindex_search():
+    """Rebuild the product full-text index from scratch."""
+    reindex_products()
+    db.session.commit()
+    click.echo('Product search index rebuilt')
+
+@orders_cli.command('rebuild-summaries')
+def rebuild_summaries():
+    """Recompute every customer's order summary from the order table."""
+    rebuild_order_summaries()
+    db.session.commit()
+    click.echo('Order summaries rebuilt')
+
+@orders_cli.command('check-totals')
+def check_order_totals():
+    """List orders whose total does not match the sum of their items."""
+    mismatches = order_total_mismatches()
+    for order_id, total, items in mismatches:
+        click.echo(f'Order {order_id}: total {format_money(total)}, items {format_money(items)}')
+    click.echo(f'{len(mismatches)} mismatched order(s)')
+
+def _file_format(file, fmt):
+    if fmt:
+        return fmt
+    return 'jsonl' if getattr(file, 'name', '').endswith(('.jsonl', '.ndjson')) else 'csv'
+
+def _report_progress(rows, elapsed):
+    rate = rows / elapsed if elapsed else 0
+    click.echo(f'  {rows} row(s), {rate:,.0f} rows/s', err=True)
+
+@catalog_cli.command('import')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True)
+def import_products(file, fmt, chunk_size):
+    """Upsert products from a CSV or JSON Lines file, keyed on slug."""
+    result = import_catalog(file, _file_format(file, fmt), chunk_size, _report_progress)
+    for line, message in result.errors:
+        click.echo(f'Line {line}: {message}', err=True)
+    rate = result.rows / result.elapsed if result.elapsed else 0
+    click.echo(f'Imported {result.upserted} product(s), skipped {result.skipped} '
+               f'in {result.elapsed:.1f}s ({rate:,.0f} rows/s)')
+
+@catalog_cli.command('export')
+@click.argument('file', type=click.File('w', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True)
+def export_products(file, fmt, chunk_size):
+    """Write every product to a CSV or JSON Lines file in import format."""
+    count = export_catalog(file, _file_format(file, fmt), chunk_size, _report_progress)
+    click.echo(f'Exported {count} product(s)', err=True)
+
+def _require_shared_order_events():
+    # Waiting checkout pages live in the web processes and would only learn
+    # of orders settled here when their waits time out
+    if current_app.config['ORDER_EVENTS_BACKEND'] == 'memory':
+        raise click.ClickException('Webhook workers outside the web process need a shared '
+                                   'ORDER_EVENTS_BACKEND such as redis')
+
+@webhooks_cli.command('drain')
+@click.option('--batch-size', default=100, show_default=True)
+def drain_webhooks(batch_size):
+    """Process every queued webhook event, then exit."""
+    handled = drain_webhook_events(batch_size)
+    click.echo(f'Processed {handled} webhook event(s)')
+
+@webhooks_cli.command('work')
+@click.option('--threads', default=4, show_default=True)
+@click.option('--batch-size', default=100, show_default=True)
+@click.option('--poll-interval', default=1.0, show_default=True)
+@with_appcontext
+def work_webhooks(threads, batch_size, poll_interval):
+    """Run a pool of webhook workers until interrupted."""
+    _require_shared_order_events()
+    pool = WebhookWorkerPool(current_app._get_current_object(), threads, batch_size, poll_interval).start()
+    click.echo(f'Started {threads} webhook worker(s); press Ctrl+C to stop')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+
+@profile_cli.command('token')
+def profile_token():
+    """Print a token for the X-Profile header and the /admin/profile endpoints."""
+    click.echo(create_profile_token())
+
+@passwords_cli.command('calibrate')
+@click.option('--target-ms', default=50.0, show_default=True, help='Time one hash may take.')
+def calibrate_passwords(target_ms):
+    """Suggest the strongest scrypt parameters that hash within --target-ms."""
+    method, elapsed = calibrate_scrypt(target_ms)
+    click.echo(f'{method} takes {elapsed:.0f} ms here (current: {current_app.config["PASSWORD_HASH_METHOD"]})')
+    if elapsed > target_ms:
+        click.echo('That is the weakest setting allowed, and it is still over the target.')
+    click.echo(f'Set PASSWORD_HASH_METHOD={method}; existing hashes are upgraded as users log in')
+
+@recommendations_cli.command('rebuild')
+def rebuild_recommendation_index():
+    """Recompute every product's recommendations from all paid orders."""
+    products = rebuild_recommendations()
+    db.session.commit()
+    click.echo(f'Recommendations rebuilt for {products} product(s)')
+
+@recommendations_cli.command('refresh')
+def refresh_recommendation_index():
+    """Fold orders paid since the last run into the recommendations."""
+    products = refresh_recommendations()
+    db.session.commit()
+    click.echo(f'Recommendations refreshed for {products} product(s)')
@@ -1,11 +1,7 @@
-from app import db, login_manager
+from app import db
 from flask_login import UserMixin
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-
-@login_manager.user_loader
-def load_user(id):
-    return User.query.get(int(id))
+from app.services.passwords import get_password_hasher
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,10 +13,16 @@ class User(UserMixin, db.Model):
     orders = db.relationship('Order', backref='customer', lazy='dynamic')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_hasher().hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a password, upgrading the stored hash if its parameters are outdated"""
+        hasher = get_password_hasher()
+        if not hasher.verify(self.password_hash, password):
+            return False
+        if hasher.needs_rehash(self.password_hash):
+            self.password_hash = hasher.hash(password)
+        return True
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -33,29 +35,109 @@ class Product(db.Model):
     name = db.Column(db.String(128), nullable=False)
     slug = db.Column(db.String(128), unique=True, nullable=False)
     description = db.Column(db.Text)
-    price = db.Column(db.Float, nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)  # minor units
     image_url = db.Column(db.String(256))
     stock = db.Column(db.Integer, default=0)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_active = db.Column(db.Boolean, default=True)
+    
+    __table_args__ = (
+        # Listings: active products, optionally by category, newest or by price
+        db.Index('ix_product_active_created', 'is_active', 'created_at', 'id'),
+        db.Index('ix_product_active_price', 'is_active', 'price_cents', 'id'),
+        db.Index('ix_product_active_category_created', 'is_active', 'category_id', 'created_at', 'id'),
+        db.Index('ix_product_active_category_price', 'is_active', 'category_id', 'price_cents', 'id'),
+    )
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    total = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, paid, shipped, delivered, cancelled
+    total_cents = db.Column(db.Integer, nullable=False)  # minor units
+    # pending, paid, shipped, delivered, cancelled, failed. The previous value is
+    # loaded on change so order summaries can move the order between counters
+    status = db.column_property(db.Column(db.String(20), default='pending'), active_history=True)
     payment_method = db.Column(db.String(20))  # stripe, mpesa
     payment_id = db.Column(db.String(128))
     shipping_address = db.Column(db.Text)
     phone = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    items = db.relationship('OrderItem', backref='order', lazy='dynamic')
+    # A plain list so order pages can eager-load items and their products
+    # in one go instead of querying once per order and once per item
+    items = db.relationship('OrderItem', backref='order')
+    reservations = db.relationship('StockReservation', backref='order', lazy='dynamic')
+    
+    __table_args__ = (
+        # Order history: a user's orders, newest first
+        db.Index('ix_order_user_created', 'user_id', 'created_at'),
+        # Payment callbacks look orders up by provider reference
+        db.Index('ix_order_payment_id', 'payment_id'),
+    )
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'))
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), index=True)
     quantity = db.Column(db.Integer, nullable=False)
-    price = db.Column(db.Float, nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)  # unit price at purchase, minor units
     product = db.relationship('Product')
+
+class OrderSummary(db.Model):
+    # Per-user order totals maintained incrementally by app.services.order_summary
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    total_spent_cents = db.Column(db.Integer, nullable=False, default=0)  # paid, shipped and delivered orders
+    last_order_at = db.Column(db.DateTime)
+    pending_count = db.Column(db.Integer, nullable=False, default=0)
+    paid_count = db.Column(db.Integer, nullable=False, default=0)
+    shipped_count = db.Column(db.Integer, nullable=False, default=0)
+    delivered_count = db.Column(db.Integer, nullable=False, default=0)
+    cancelled_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+
+class ProductRecommendation(db.Model):
+    # Top co-purchased products per product, built by app.services.recommendations
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)  # 1 is the strongest
+    recommended_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    score = db.Column(db.Integer, nullable=False)  # paid orders containing both products
+
+class RecommendationQueue(db.Model):
+    # Paid orders whose products' recommendations have not been refreshed yet
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), primary_key=True)
+    queued_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class StockReservation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), default='held')  # held, committed, released
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Sweeper: held reservations past their expiry
+        db.Index('ix_stock_reservation_status_expires', 'status', 'expires_at'),
+    )
+
+class WebhookEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(20), nullable=False)  # mpesa, stripe
+    event_key = db.Column(db.String(128), nullable=False)  # CheckoutRequestID or Stripe event id
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, processing, processed, ignored, failed
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text)
+    claim_token = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime)
+    
+    __table_args__ = (
+        # Duplicate deliveries collapse onto the first row
+        db.UniqueConstraint('provider', 'event_key', name='uq_webhook_event_provider_key'),
+        # Workers claim the oldest pending events
+        db.Index('ix_webhook_event_status_id', 'status', 'id'),
+        db.Index('ix_webhook_event_claim_token', 'claim_token'),
+    )
@@ -0,0 +1,131 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+class CacheBackend:
+    """Minimal key/value cache interface shared by the caching layers.
+    
+    Every backend keeps a monotonically increasing version per namespace so
+    callers can invalidate whole families of keys by bumping it instead of
+    enumerating them.
+    """
+    
+    def get(self, key):
+        raise NotImplementedError
+    
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+    
+    def delete(self, key):
+        raise NotImplementedError
+    
+    def version(self, namespace):
+        raise NotImplementedError
+    
+    def bump(self, namespace):
+        raise NotImplementedError
+
+class NullCache(CacheBackend):
+    """Cache that never stores anything, for disabling caching"""
+    
+    def get(self, key):
+        return None
+    
+    def set(self, key, value, ttl=None):
+        pass
+    
+    def delete(self, key):
+        pass
+    
+    def version(self, namespace):
+        return 0
+    
+    def bump(self, namespace):
+        return 0
+
+class MemoryCache(CacheBackend):
+    """Per-process TTL cache with least-recently-used eviction"""
+    
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def version(self, namespace):
+        return self._versions.get(namespace, 0)
+    
+    def bump(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            return self._versions[namespace]
+
+class RedisCache(CacheBackend):
+    """Cache shared by every worker through a Redis-protocol server"""
+    
+    def __init__(self, client, prefix='cache:', default_ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+    
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return pickle.loads(data) if data is not None else None
+    
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        ex=ttl or self.default_ttl)
+    
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+    
+    def version(self, namespace):
+        return int(self.client.get(f'{self.prefix}version:{namespace}') or 0)
+    
+    def bump(self, namespace):
+        return self.client.incr(f'{self.prefix}version:{namespace}')
+
+def create_cache(backend, redis_url=None, prefix='cache:', max_entries=1024, default_ttl=300):
+    """Build a cache backend by name: 'memory', 'redis' or 'null'"""
+    if backend == 'redis':
+        if redis is None:
+            raise RuntimeError('A redis cache backend requires the redis package')
+        return RedisCache(redis.Redis.from_url(redis_url), prefix=prefix, default_ttl=default_ttl)
+    
+    if backend == 'memory':
+        return MemoryCache(max_entries=max_entries, default_ttl=default_ttl)
+    
+    if backend == 'null':
+        return NullCache()
+    
+    raise ValueError(f'Unknown cache backend: {backend}')
@@ -0,0 +1,32 @@
+from app.models import Product
+
+def resolve_cart(cart):
+    """Resolve a cart dict of {product_id: quantity} into priced line items.
+    
+    All products are loaded with a single IN (...) query so the cost of
+    viewing or checking out a cart does not grow with the number of lines.
+    Returns a (cart_items, total) tuple with amounts in integer minor
+    units; unknown products and lines below one unit are skipped.
+    """
+    if not cart:
+        return [], 0
+    
+    product_ids = [int(product_id) for product_id in cart]
+    products = Product.query.filter(Product.id.in_(product_ids)).all()
+    products_by_id = {product.id: product for product in products}
+    
+    cart_items = []
+    total = 0
+    
+    for product_id, quantity in cart.items():
+        product = products_by_id.get(int(product_id))
+        if product and quantity > 0:
+            subtotal = product.price_cents * quantity
+            cart_items.append({
+                'product': product,
+                'quantity': quantity,
+                'subtotal': subtotal
+            })
+            total += subtotal
+    
+    return cart_items, total
@@ -0,0 +1,262 @@
+import threading
+from collections import OrderedDict
+from flask import current_app, has_request_context, session
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+def _check_quantity(quantity):
+    # A negative line would lower the order total and, once reserved, add stock
+    if quantity < 1:
+        raise ValueError(f'Cannot add {quantity} of a product to a cart')
+
+class CartStore:
+    """Server-side cart storage keyed by an opaque cart id.
+    
+    Carts map product ids (as strings) to quantities. Every backend keeps
+    a running item counter alongside the lines so count() never has to
+    sum the cart.
+    """
+    
+    def get(self, cart_id):
+        raise NotImplementedError
+    
+    def add(self, cart_id, product_id, quantity):
+        """Atomically add quantity (at least 1) to a line and return the new line quantity"""
+        raise NotImplementedError
+    
+    def set(self, cart_id, product_id, quantity):
+        """Set a line to quantity, removing it when quantity <= 0"""
+        raise NotImplementedError
+    
+    def remove(self, cart_id, product_id):
+        self.set(cart_id, product_id, 0)
+    
+    def replace(self, cart_id, cart):
+        raise NotImplementedError
+    
+    def clear(self, cart_id):
+        raise NotImplementedError
+    
+    def count(self, cart_id):
+        raise NotImplementedError
+
+class SessionCartStore(CartStore):
+    """Carts kept in the signed session cookie; the default.
+    
+    Needs no shared backend, so carts survive restarts and any number of
+    worker processes. A cart only exists in the browser that filled it and
+    can only be changed by that browser's own requests: outside a request,
+    such as in a webhook worker, every call is a no-op. Two requests from
+    the same browser racing to change the cart keep the last one's cookie.
+    """
+    
+    key = 'carts'
+    
+    def _entry(self, cart_id):
+        if not has_request_context():
+            return None
+        return session.get(self.key, {}).get(cart_id)
+    
+    def _save(self, cart_id, lines):
+        if not has_request_context():
+            return
+        carts = dict(session.get(self.key, {}))
+        if lines:
+            carts[cart_id] = {'lines': lines, 'count': sum(lines.values())}
+        else:
+            carts.pop(cart_id, None)
+        session[self.key] = carts
+    
+    def get(self, cart_id):
+        entry = self._entry(cart_id)
+        return dict(entry['lines']) if entry else {}
+    
+    def add(self, cart_id, product_id, quantity):
+        _check_quantity(quantity)
+        key = str(product_id)
+        lines = self.get(cart_id)
+        lines[key] = lines.get(key, 0) + quantity
+        self._save(cart_id, lines)
+        return lines[key]
+    
+    def set(self, cart_id, product_id, quantity):
+        lines = self.get(cart_id)
+        lines.pop(str(product_id), None)
+        if quantity > 0:
+            lines[str(product_id)] = quantity
+        self._save(cart_id, lines)
+    
+    def replace(self, cart_id, cart):
+        self._save(cart_id, {str(k): v for k, v in cart.items() if v > 0})
+    
+    def clear(self, cart_id):
+        self._save(cart_id, {})
+    
+    def count(self, cart_id):
+        entry = self._entry(cart_id)
+        return entry['count'] if entry else 0
+
+class _MemoryCart:
+    __slots__ = ('lines', 'count')
+    
+    def __init__(self):
+        self.lines = {}
+        self.count = 0
+
+class MemoryCartStore(CartStore):
+    """In-process LRU cart store for a single worker process.
+    
+    Carts are only visible to the worker process that created them, are
+    lost on restart, and the least recently used carts are evicted once
+    max_carts is reached.
+    """
+    
+    def __init__(self, max_carts=10000):
+        self.max_carts = max_carts
+        self._carts = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _cart(self, cart_id, create=False):
+        cart = self._carts.get(cart_id)
+        if cart is not None:
+            self._carts.move_to_end(cart_id)
+        elif create:
+            cart = self._carts[cart_id] = _MemoryCart()
+            while len(self._carts) > self.max_carts:
+                self._carts.popitem(last=False)
+        return cart
+    
+    def get(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return dict(cart.lines) if cart else {}
+    
+    def add(self, cart_id, product_id, quantity):
+        _check_quantity(quantity)
+        key = str(product_id)
+        with self._lock:
+            cart = self._cart(cart_id, create=True)
+            cart.lines[key] = cart.lines.get(key, 0) + quantity
+            cart.count += quantity
+            return cart.lines[key]
+    
+    def set(self, cart_id, product_id, quantity):
+        key = str(product_id)
+        with self._lock:
+            cart = self._cart(cart_id, create=quantity > 0)
+            if cart is None:
+                return
+            cart.count -= cart.lines.pop(key, 0)
+            if quantity > 0:
+                cart.lines[key] = quantity
+                cart.count += quantity
+    
+    def replace(self, cart_id, cart):
+        with self._lock:
+            entry = self._cart(cart_id, create=True)
+            entry.lines = {str(k): v for k, v in cart.items() if v > 0}
+            entry.count = sum(entry.lines.values())
+    
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+    
+    def count(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return cart.count if cart else 0
+
+class RedisCartStore(CartStore):
+    """Cart store on any Redis-protocol server.
+    
+    Each cart is a hash of product id -> quantity plus a companion counter
+    key; both are updated in the same MULTI/EXEC so they never drift.
+    """
+    
+    def __init__(self, client, prefix='cart:', ttl=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+    
+    def _keys(self, cart_id):
+        key = f'{self.prefix}{cart_id}'
+        return key, f'{key}:count'
+    
+    def _touch(self, pipe, keys):
+        if self.ttl:
+            for key in keys:
+                pipe.expire(key, self.ttl)
+    
+    def get(self, cart_id):
+        lines, _ = self._keys(cart_id)
+        return {
+            (k.decode() if isinstance(k, bytes) else k): int(v)
+            for k, v in self.client.hgetall(lines).items()
+        }
+    
+    def add(self, cart_id, product_id, quantity):
+        _check_quantity(quantity)
+        keys = self._keys(cart_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hincrby(keys[0], str(product_id), quantity)
+        pipe.incrby(keys[1], quantity)
+        self._touch(pipe, keys)
+        return int(pipe.execute()[0])
+    
+    def set(self, cart_id, product_id, quantity):
+        keys = self._keys(cart_id)
+        field = str(product_id)
+        
+        def update(pipe):
+            old = int(pipe.hget(keys[0], field) or 0)
+            pipe.multi()
+            if quantity > 0:
+                pipe.hset(keys[0], field, quantity)
+            else:
+                pipe.hdel(keys[0], field)
+            pipe.incrby(keys[1], max(quantity, 0) - old)
+            self._touch(pipe, keys)
+        
+        self.client.transaction(update, keys[0])
+    
+    def replace(self, cart_id, cart):
+        keys = self._keys(cart_id)
+        lines = {str(k): v for k, v in cart.items() if v > 0}
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(*keys)
+        if lines:
+            pipe.hset(keys[0], mapping=lines)
+            pipe.set(keys[1], sum(lines.values()))
+            self._touch(pipe, keys)
+        pipe.execute()
+    
+    def clear(self, cart_id):
+        self.client.delete(*self._keys(cart_id))
+    
+    def count(self, cart_id):
+        return int(self.client.get(self._keys(cart_id)[1]) or 0)
+
+def create_cart_store(config):
+    """Build the cart store selected by the CART_STORE setting"""
+    backend = config.get('CART_STORE', 'session')
+    
+    if backend == 'session':
+        return SessionCartStore()
+    
+    if backend == 'redis':
+        if redis is None:
+            raise RuntimeError('CART_STORE=redis requires the redis package')
+        client = redis.Redis.from_url(config['CART_REDIS_URL'])
+        return RedisCartStore(client, ttl=config.get('CART_TTL'))
+    
+    if backend == 'memory':
+        return MemoryCartStore(max_carts=config.get('CART_MEMORY_MAX_CARTS', 10000))
+    
+    raise ValueError(f'Unknown CART_STORE backend: {backend}')
+
+def get_cart_store():
+    """Return the cart store bound to the current app"""
+    return current_app.extensions['cart_store']
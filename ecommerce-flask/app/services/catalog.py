@@ -0,0 +1,201 @@
+import threading
+from flask import current_app, g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+from app import db
+from app.models import Product, Category, ProductRecommendation
+from app.services.cache import create_cache
+from app.services.database import reading_primary
+
+NAMESPACE = 'catalog'
+
+class CategorySnapshot:
+    """Detached, picklable copy of a Category for cached pages"""
+    __slots__ = ('id', 'name', 'slug')
+    
+    def __init__(self, category):
+        self.id = category.id
+        self.name = category.name
+        self.slug = category.slug
+
+class ProductSnapshot:
+    """Detached, picklable copy of a Product and its category for cached pages"""
+    __slots__ = ('id', 'name', 'slug', 'description', 'price_cents', 'image_url',
+                 'stock', 'category_id', 'is_active', 'created_at', 'category')
+    
+    def __init__(self, product):
+        self.id = product.id
+        self.name = product.name
+        self.slug = product.slug
+        self.description = product.description
+        self.price_cents = product.price_cents
+        self.image_url = product.image_url
+        self.stock = product.stock
+        self.category_id = product.category_id
+        self.is_active = product.is_active
+        self.created_at = product.created_at
+        self.category = CategorySnapshot(product.category) if product.category else None
+
+class CatalogCache:
+    """Read-through cache for rarely changing catalog queries.
+    
+    Keys embed a catalog version that is bumped whenever a transaction
+    touching Product or Category commits, so a single increment invalidates
+    every cached entry across all workers sharing the backend. Entries
+    derived from data outside the catalog also name a scope with its own
+    version, such as 'related' for recommendations, so that data can be
+    invalidated without dropping the rest. Stock changed by checkout
+    reservations bypasses the ORM and is only refreshed when entries expire.
+    """
+    
+    def __init__(self, backend, ttl=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+    
+    def _namespace(self, scope):
+        return NAMESPACE if scope is None else f'{NAMESPACE}:{scope}'
+    
+    def version(self, scope=None):
+        # One lookup per version per request keeps shared backends to few round trips
+        if has_app_context():
+            versions = g.setdefault('catalog_versions', {})
+            if scope not in versions:
+                versions[scope] = self.backend.version(self._namespace(scope))
+            return versions[scope]
+        return self.backend.version(self._namespace(scope))
+    
+    def invalidate(self, scope=None):
+        """Drop every entry, or only those keyed on scope"""
+        self.backend.bump(self._namespace(scope))
+        if has_app_context():
+            g.pop('catalog_versions', None)
+    
+    def _count(self, counter, name):
+        with self._lock:
+            counter[name] = counter.get(name, 0) + 1
+    
+    def _key(self, name, key, scopes):
+        versions = ':'.join(str(self.version(scope)) for scope in (None, *scopes))
+        return f'{NAMESPACE}:{versions}:{name}:{key}'
+    
+    def get(self, name, key, scopes=()):
+        """Return the cached value for key in the current catalog version, or None"""
+        value = self.backend.get(self._key(name, key, scopes))
+        self._count(self.hits if value is not None else self.misses, name)
+        return value
+    
+    def set(self, name, key, value, scopes=()):
+        self.backend.set(self._key(name, key, scopes), value, self.ttl)
+    
+    def fetch(self, name, key, loader, scopes=()):
+        """Return the cached value for key, calling loader() on a miss.
+        
+        The loader reads from the primary so a lagging replica cannot cache
+        stale rows under the current version.
+        """
+        value = self.get(name, key, scopes)
+        if value is None:
+            with reading_primary():
+                value = loader()
+            self.set(name, key, value, scopes)
+        return value
+    
+    def stats(self):
+        with self._lock:
+            return {
+                name: {'hits': self.hits.get(name, 0), 'misses': self.misses.get(name, 0)}
+                for name in set(self.hits) | set(self.misses)
+            }
+
+def create_catalog_cache(config):
+    """Build the catalog cache selected by the CATALOG_CACHE setting"""
+    backend = create_cache(
+        config.get('CATALOG_CACHE', 'memory'),
+        redis_url=config.get('CATALOG_CACHE_REDIS_URL'),
+        prefix='shop:',
+        max_entries=config.get('CATALOG_CACHE_MAX_ENTRIES', 1024),
+        default_ttl=config.get('CATALOG_CACHE_TTL', 300)
+    )
+    return CatalogCache(backend, ttl=config.get('CATALOG_CACHE_TTL', 300))
+
+def get_catalog_cache():
+    """Return the catalog cache bound to the current app"""
+    return current_app.extensions['catalog_cache']
+
+def get_categories():
+    """All categories, for navigation"""
+    return get_catalog_cache().fetch(
+        'categories', 'all',
+        lambda: [CategorySnapshot(c) for c in Category.query.order_by(Category.id).all()]
+    )
+
+def get_featured_products(limit=8):
+    """The first active products shown on the home page"""
+    return get_catalog_cache().fetch(
+        'featured', limit,
+        lambda: [ProductSnapshot(p) for p in Product.query.options(joinedload(Product.category))
+                 .filter_by(is_active=True).limit(limit).all()]
+    )
+
+def get_product_by_slug(slug):
+    """An active product by slug, or None"""
+    def load():
+        product = Product.query.options(joinedload(Product.category)).filter_by(slug=slug, is_active=True).first()
+        # Cache misses too, so unknown slugs do not hit the database every time
+        return ProductSnapshot(product) if product else False
+    
+    return get_catalog_cache().fetch('product', slug, load) or None
+
+def get_related_products(product, limit=4):
+    """Products most often bought with this one, topped up from the same category"""
+    def load():
+        related = Product.query.options(joinedload(Product.category)).join(
+            ProductRecommendation, ProductRecommendation.recommended_id == Product.id
+        ).filter(
+            ProductRecommendation.product_id == product.id,
+            Product.is_active == True
+        ).order_by(ProductRecommendation.rank).limit(limit).all()
+        
+        # New or rarely bought products have few co-purchases to show
+        if len(related) < limit:
+            related += Product.query.options(joinedload(Product.category)).filter(
+                Product.category_id == product.category_id,
+                Product.id.notin_([product.id, *[p.id for p in related]]),
+                Product.is_active == True
+            ).limit(limit - len(related)).all()
+        return [ProductSnapshot(p) for p in related]
+    
+    return get_catalog_cache().fetch('related', f'{product.id}:{limit}', load, scopes=('related',))
+
+def invalidate_on_commit(scope):
+    """Drop the catalog cache entries keyed on scope once this transaction commits"""
+    db.session.info.setdefault('catalog_scopes_changed', set()).add(scope)
+
+@event.listens_for(Session, 'after_flush')
+def _track_catalog_changes(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (Product, Category)):
+            session.info['catalog_changed'] = True
+            return
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_catalog(session):
+    changed = session.info.pop('catalog_changed', False)
+    scopes = session.info.pop('catalog_scopes_changed', ())
+    if (changed or scopes) and has_app_context():
+        cache = current_app.extensions.get('catalog_cache')
+        if cache is None:
+            return
+        if changed:
+            cache.invalidate()
+        else:
+            for scope in scopes:
+                cache.invalidate(scope)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_changes(session):
+    session.info.pop('catalog_changed', None)
+    session.info.pop('catalog_scopes_changed', None)
@@ -0,0 +1,172 @@
+import csv
+import json
+import time
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import select
+from app import db
+from app.models import Category, Product
+from app.services.catalog import get_catalog_cache
+from app.services.database import upsert_rows
+from app.services.money import format_money, to_minor
+from app.services.search import reindex_products
+
+FORMATS = ('csv', 'jsonl')
+FIELDS = ['slug', 'name', 'description', 'price', 'image_url', 'stock', 'category', 'is_active']
+# Columns an import overwrites on existing products; created_at is kept
+UPDATE_COLUMNS = ['name', 'description', 'price_cents', 'image_url', 'stock', 'category_id', 'is_active']
+MAX_REPORTED_ERRORS = 50
+
+class ImportResult:
+    """Counters for one catalog import"""
+    
+    def __init__(self):
+        self.rows = 0
+        self.upserted = 0
+        self.skipped = 0
+        self.errors = []  # (line, message), capped at MAX_REPORTED_ERRORS
+        self.elapsed = 0.0
+    
+    def error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'n', '')
+
+def _records(stream, fmt):
+    """Yield (line number, raw record) pairs without reading the whole stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                yield number, line
+
+def _to_row(record, categories, now):
+    """Validate one raw record and map it onto product table columns"""
+    if isinstance(record, str):
+        record = json.loads(record)
+    
+    slug = (record.get('slug') or '').strip()
+    name = (record.get('name') or '').strip()
+    if not slug or not name:
+        raise ValueError('slug and name are required')
+    
+    category = record.get('category') or None
+    if category is not None and category not in categories:
+        raise ValueError(f'unknown category {category!r}')
+    
+    if record.get('price_cents') not in (None, ''):
+        price_cents = int(record['price_cents'])
+    elif record.get('price') not in (None, ''):
+        try:
+            price_cents = to_minor(record['price'])
+        except ArithmeticError:
+            raise ValueError(f"invalid price {record['price']!r}")
+    else:
+        raise ValueError('price is required')
+    
+    return {
+        'slug': slug,
+        'name': name,
+        'description': record.get('description') or None,
+        'price_cents': price_cents,
+        'image_url': record.get('image_url') or None,
+        'stock': int(record.get('stock') or 0),
+        'category_id': categories.get(category),
+        'is_active': _flag(record.get('is_active', True)),
+        'created_at': now
+    }
+
+def _upsert(connection, rows):
+    """Insert or update a chunk of product rows keyed on slug"""
+    upsert_rows(connection, Product.__table__, rows, ['slug'], UPDATE_COLUMNS)
+
+def import_catalog(stream, fmt='csv', chunk_size=1000, progress=None):
+    """Stream products from CSV or JSON Lines into the catalog.
+    
+    Rows are upserted on slug in chunks of chunk_size, each in its own
+    transaction, so memory use is bounded by the chunk rather than the
+    file. Categories are referenced by slug and resolved from a map loaded
+    once up front. Invalid rows are skipped and reported. The bulk
+    statements bypass the ORM, so the search index is refreshed for each
+    chunk and the catalog cache is invalidated at the end.
+    
+    progress, if given, is called as progress(rows_read, elapsed_seconds)
+    after every chunk.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    categories = dict(db.session.execute(select(Category.slug, Category.id)).all())
+    records = _records(stream, fmt)
+    
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        
+        now = datetime.utcnow()
+        rows = {}
+        for line, record in chunk:
+            result.rows += 1
+            try:
+                row = _to_row(record, categories, now)
+            except (ValueError, TypeError, AttributeError) as e:
+                result.error(line, str(e))
+                continue
+            # A slug repeated within a chunk keeps its last occurrence
+            rows[row['slug']] = row
+        
+        if rows:
+            connection = db.session.connection()
+            _upsert(connection, list(rows.values()))
+            ids = connection.scalars(select(Product.id).where(Product.slug.in_(list(rows)))).all()
+            reindex_products(ids)
+            db.session.commit()
+            result.upserted += len(rows)
+        
+        if progress:
+            progress(result.rows, time.perf_counter() - started)
+    
+    if result.upserted:
+        get_catalog_cache().invalidate()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+def export_catalog(stream, fmt='csv', chunk_size=1000, progress=None):
+    """Stream every product to CSV or JSON Lines in import format.
+    
+    Rows are fetched through a server-side cursor chunk_size at a time,
+    so the export never holds the whole catalog in memory. Returns the
+    number of products written.
+    """
+    started = time.perf_counter()
+    stmt = select(
+        Product.slug, Product.name, Product.description, Product.price_cents,
+        Product.image_url, Product.stock, Category.slug, Product.is_active
+    ).outerjoin(Category, Product.category_id == Category.id).order_by(Product.id)
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=chunk_size))
+    
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        write = writer.writerow
+    else:
+        def write(values):
+            stream.write(json.dumps(dict(zip(FIELDS, values))) + '\n')
+    
+    count = 0
+    for partition in result.partitions():
+        for slug, name, description, price_cents, image_url, stock, category, is_active in partition:
+            write([slug, name, description or '', format_money(price_cents), image_url or '',
+                   stock or 0, category or '', int(bool(is_active))])
+        count += len(partition)
+        if progress:
+            progress(count, time.perf_counter() - started)
+    return count
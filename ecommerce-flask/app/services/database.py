@@ -0,0 +1,292 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import and_, bindparam, event, insert, select, text, tuple_, update
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND_PREFIX = 'replica_'
+# Requests with these methods may read from a replica; anything else is a write flow
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_SESSION_KEY = '_db_primary_until'
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+def engine_options(url, config):
+    """Pool and driver options for one database URL from the DB_* settings"""
+    url = make_url(url)
+    if _is_memory_sqlite(url):
+        # Flask-SQLAlchemy gives in-memory SQLite a StaticPool, which takes no sizing
+        return {}
+    
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    if url.get_backend_name() == 'sqlite':
+        return options
+    
+    options['pool_recycle'] = config['DB_POOL_RECYCLE']
+    options['pool_pre_ping'] = config['DB_POOL_PRE_PING']
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    return options
+
+def configure_database(config):
+    """Fill in engine options and the replica bind before db.init_app.
+    
+    Options already present in SQLALCHEMY_ENGINE_OPTIONS win over the
+    computed ones.
+    """
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **engine_options(config['SQLALCHEMY_DATABASE_URI'], config),
+        **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
+    replica_urls = config.get('REPLICA_DATABASE_URLS') or []
+    if replica_urls:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        for number, url in enumerate(replica_urls, 1):
+            binds.setdefault(f'{REPLICA_BIND_PREFIX}{number}', {'url': url, **engine_options(url, config)})
+        config['SQLALCHEMY_BINDS'] = binds
+
+def replica_binds(config):
+    """Bind keys of the configured read replicas"""
+    return [f'{REPLICA_BIND_PREFIX}{number}' for number in range(1, len(config.get('REPLICA_DATABASE_URLS') or []) + 1)]
+
+def _sqlite_pragmas(config):
+    pragmas = []
+    if config['SQLITE_JOURNAL_MODE']:
+        pragmas.append(f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+    if config['SQLITE_SYNCHRONOUS']:
+        pragmas.append(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+    if config['SQLITE_MMAP_SIZE']:
+        pragmas.append(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+    if config['SQLITE_BUSY_TIMEOUT_MS']:
+        pragmas.append(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    return pragmas
+
+def tune_engine(engine, config):
+    """Run per-connection setup: SQLite pragmas, MySQL statement timeout"""
+    name = engine.dialect.name
+    if name == 'sqlite':
+        if _is_memory_sqlite(engine.url):
+            return
+        statements = _sqlite_pragmas(config)
+    elif name == 'mysql' and config['DB_STATEMENT_TIMEOUT_MS']:
+        statements = [f"SET SESSION max_execution_time = {int(config['DB_STATEMENT_TIMEOUT_MS'])}"]
+    else:
+        return
+    if not statements:
+        return
+    
+    @event.listens_for(engine, 'connect')
+    def apply_connection_settings(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+def replica_lag(engine):
+    """Seconds the replica is behind its primary, or 0 where that cannot be measured"""
+    name = engine.dialect.name
+    with engine.connect() as connection:
+        if name == 'postgresql':
+            return connection.execute(text(
+                'SELECT COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)'
+            )).scalar()
+        if name == 'mysql':
+            row = connection.execute(text('SHOW REPLICA STATUS')).mappings().first()
+            if row is None:
+                return 0
+            lag = row.get('Seconds_Behind_Source')
+            return float('inf') if lag is None else lag
+    return 0
+
+class ReplicaRouter:
+    """Load-balances reads over the replicas that are not lagging too far.
+    
+    Each replica's lag is probed at most every check_interval seconds; the
+    probe runs on whichever request finds the reading stale while the
+    others keep using the previous one. A replica that cannot be probed is
+    skipped until the next successful check.
+    """
+    
+    def __init__(self, binds, max_lag=5, check_interval=5):
+        self.binds = binds
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._lag = {}  # bind -> (checked at, seconds behind)
+    
+    def _lag_of(self, bind, engine):
+        checked_at, lag = self._lag.get(bind, (0, 0))
+        if time.monotonic() - checked_at < self.check_interval or not self._lock.acquire(blocking=False):
+            return lag
+        try:
+            try:
+                lag = float(replica_lag(engine))
+            except Exception as e:
+                logger.warning('Could not check lag of replica %s: %s', bind, e)
+                lag = float('inf')
+            self._lag[bind] = (time.monotonic(), lag)
+            return lag
+        finally:
+            self._lock.release()
+    
+    def choose(self, engines):
+        """A replica engine fit to serve reads, or None to use the primary"""
+        healthy = [engines[bind] for bind in self.binds
+                   if bind in engines and self._lag_of(bind, engines[bind]) <= self.max_lag]
+        return random.choice(healthy) if healthy else None
+
+def _may_read_replica():
+    if request.method not in READ_METHODS or g.get('db_primary'):
+        return False
+    # Users who just wrote read from the primary until replicas catch up
+    return session.get(STICKY_SESSION_KEY, 0) <= time.time()
+
+def _request_replica(engines):
+    """The replica this request reads from, chosen once per request"""
+    if 'db_replica' not in g:
+        router = current_app.extensions.get('db_router')
+        g.db_replica = router.choose(engines) if router is not None and _may_read_replica() else None
+    return g.db_replica
+
+class RoutingSession(Session):
+    """Session that serves SELECTs in read-only requests from a replica.
+    
+    Writes, flushes and anything that is not a SELECT go to the primary, as
+    does every statement outside a request (CLI commands, webhook workers)
+    or in a non-GET request. Once a request writes, it and the user's
+    requests for the next DB_STICKY_SECONDS read from the primary so they
+    see their own changes. Without replicas every statement uses the
+    primary.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and getattr(clause, 'is_select', False)
+                and has_request_context()):
+            replica = _request_replica(self._db.engines)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _mark_write():
+    if has_request_context():
+        pin_primary()
+        g.db_wrote = True
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _pin_after_flush(db_session, flush_context):
+    _mark_write()
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _pin_on_bulk_write(orm_execute_state):
+    # Bulk insert/update/delete statements bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _mark_write()
+
+def pin_primary():
+    """Send the rest of this request's reads to the primary"""
+    g.db_primary = True
+    g.db_replica = None
+
+@contextmanager
+def reading_primary():
+    """Send the reads inside the block to the primary, then restore the request's routing.
+    
+    Anything cached under the catalog version is loaded this way, since a
+    lagging replica could store rows older than the version keying them.
+    """
+    if not has_request_context():
+        yield
+        return
+    saved = {key: g.pop(key) for key in ('db_primary', 'db_replica') if key in g}
+    g.db_primary = True
+    g.db_replica = None
+    try:
+        yield
+    finally:
+        # A write inside the block keeps the rest of the request on the primary
+        if not g.get('db_wrote'):
+            g.pop('db_primary', None)
+            g.pop('db_replica', None)
+            for key, value in saved.items():
+                setattr(g, key, value)
+
+def init_routing(app):
+    """Route reads to the configured replicas and make writers sticky to the primary"""
+    binds = replica_binds(app.config)
+    if not binds:
+        return
+    app.extensions['db_router'] = ReplicaRouter(
+        binds,
+        max_lag=app.config['DB_REPLICA_MAX_LAG_SECONDS'],
+        check_interval=app.config['DB_REPLICA_LAG_CHECK_SECONDS']
+    )
+    window = app.config['DB_STICKY_SECONDS']
+    
+    @app.after_request
+    def stick_writers_to_primary(response):
+        if window and g.get('db_wrote'):
+            session[STICKY_SESSION_KEY] = time.time() + window
+        return response
+
+def upsert_rows(connection, table, rows, keys, update_columns=()):
+    """Insert rows into a table, resolving clashes on the unique columns in keys.
+    
+    A row whose keys already exist is skipped, or has its update_columns
+    overwritten when any are given. SQLite and PostgreSQL settle this in a
+    single INSERT ... ON CONFLICT. Elsewhere the existing keys are looked up
+    first, so a concurrent insert of the same keys can still raise an
+    IntegrityError. Returns the number of rows written, as far as the
+    driver reports it.
+    """
+    dialect = connection.dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        if update_columns:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=keys,
+                set_={column: stmt.excluded[column] for column in update_columns}
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+        return connection.execute(stmt, rows).rowcount
+    
+    key_columns = [table.c[key] for key in keys]
+    values = [tuple(row[key] for key in keys) for row in rows]
+    if len(keys) == 1:
+        condition = key_columns[0].in_([value[0] for value in values])
+    else:
+        condition = tuple_(*key_columns).in_(values)
+    existing = set(tuple(row) for row in connection.execute(select(*key_columns).where(condition)))
+    clashes = [row for row, value in zip(rows, values) if value in existing]
+    inserts = [row for row, value in zip(rows, values) if value not in existing]
+    written = len(inserts)
+    if clashes and update_columns:
+        connection.execute(
+            update(table).where(and_(*[c == bindparam(f'v_{c.name}') for c in key_columns])).values(
+                **{column: bindparam(f'v_{column}') for column in update_columns}
+            ),
+            [{f'v_{k}': v for k, v in row.items()} for row in clashes]
+        )
+        written += len(clashes)
+    if inserts:
+        connection.execute(insert(table), inserts)
+    return written
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import select
+from app import db
+from app.models import Product
+from app.services.catalog import get_catalog_cache
+from app.services.database import reading_primary
+from app.services.search import search_products
+
+logger = logging.getLogger(__name__)
+
+def price_buckets(bounds):
+    """(key, low, high) price ranges in cents split at bounds; high is None for the last"""
+    edges = [0, *sorted(bounds), None]
+    return [
+        (f"{low}-{high if high is not None else ''}", low, high)
+        for low, high in zip(edges, edges[1:])
+    ]
+
+def _bitmap(ids):
+    """An int with bit n set for every id n"""
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, 'little')
+
+class FacetSnapshot:
+    """Bitmaps of the active products, built for one catalog version"""
+    __slots__ = ('version', 'built_at', 'active', 'categories', 'prices', 'in_stock', 'searches')
+    
+    def __init__(self, version, active, categories, prices, in_stock):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.active = active
+        self.categories = categories  # category id -> bitmap
+        self.prices = prices  # bucket key -> bitmap
+        self.in_stock = in_stock
+        self.searches = OrderedDict()  # search string -> bitmap of matches
+
+class FacetIndex:
+    """Per-facet bitmaps of active products for listing filters and counts.
+    
+    Every facet value (category, price bucket, in stock) has a bitmap with
+    bit n set when product n has it, so a count is an AND of a few ints and
+    a popcount, however large the catalog. The bitmaps are built from one
+    scan of the product table, and rebuilt in the background when the
+    catalog version changes or at least every ttl seconds to pick up stock
+    sold through checkout. Each search string costs one id query per
+    snapshot.
+    """
+    
+    def __init__(self, buckets, ttl=300, max_searches=256):
+        self.buckets = buckets
+        self.ttl = ttl
+        self.max_searches = max_searches
+        self._bounds = [low for _, low, _ in buckets[1:]]
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._snapshot = None
+    
+    def _bucket_key(self, price_cents):
+        return self.buckets[bisect_right(self._bounds, price_cents)][0]
+    
+    def _build(self, version):
+        active, in_stock = [], []
+        categories, prices = {}, {key: [] for key, _, _ in self.buckets}
+        with reading_primary():
+            rows = db.session.execute(
+                select(Product.id, Product.category_id, Product.price_cents, Product.stock)
+                .where(Product.is_active == True)
+            ).all()
+        for product_id, category_id, price_cents, stock in rows:
+            active.append(product_id)
+            if category_id is not None:
+                categories.setdefault(category_id, []).append(product_id)
+            prices[self._bucket_key(price_cents)].append(product_id)
+            if stock and stock > 0:
+                in_stock.append(product_id)
+        return FacetSnapshot(
+            version, _bitmap(active),
+            {category_id: _bitmap(ids) for category_id, ids in categories.items()},
+            {key: _bitmap(ids) for key, ids in prices.items()},
+            _bitmap(in_stock)
+        )
+    
+    def _rebuild_in_background(self, app):
+        try:
+            with app.app_context():
+                self._snapshot = self._build(get_catalog_cache().version())
+        except Exception:
+            logger.exception('Rebuilding the facet index failed')
+        finally:
+            self._rebuilding = False
+    
+    def snapshot(self):
+        """The bitmaps, built on first use.
+        
+        Once stale they are rebuilt in a background thread while requests
+        keep counting on the previous snapshot.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = self._build(get_catalog_cache().version())
+            return self._snapshot
+        
+        stale = (snapshot.version != get_catalog_cache().version()
+                 or time.monotonic() - snapshot.built_at > self.ttl)
+        if stale and not self._rebuilding:
+            with self._lock:
+                if self._rebuilding:
+                    return snapshot
+                self._rebuilding = True
+            app = current_app._get_current_object()
+            threading.Thread(target=self._rebuild_in_background, args=(app,),
+                             name='facet-index', daemon=True).start()
+        return snapshot
+    
+    def _search(self, snapshot, search):
+        with self._lock:
+            bits = snapshot.searches.get(search)
+            if bits is not None:
+                snapshot.searches.move_to_end(search)
+                return bits
+        query, _ = search_products(Product.query.with_entities(Product.id).filter_by(is_active=True), search)
+        with reading_primary():
+            bits = _bitmap([product_id for product_id, in query])
+        with self._lock:
+            snapshot.searches[search] = bits
+            while len(snapshot.searches) > self.max_searches:
+                snapshot.searches.popitem(last=False)
+        return bits
+    
+    def counts(self, category_id=None, price=None, in_stock=False, search=None):
+        """Matching products for a filter, and per facet value.
+        
+        Each facet's counts apply every other active filter but not its own,
+        so they show what picking another value of that facet would return.
+        """
+        snapshot = self.snapshot()
+        base = snapshot.active
+        if search:
+            base &= self._search(snapshot, search)
+        
+        category = snapshot.categories.get(category_id, 0) if category_id is not None else None
+        bucket = snapshot.prices.get(price) if price is not None else None
+        stock = snapshot.in_stock if in_stock else None
+        
+        def matching(*filters):
+            bits = base
+            for f in filters:
+                if f is not None:
+                    bits &= f
+            return bits
+        
+        without_category = matching(bucket, stock)
+        without_price = matching(category, stock)
+        return {
+            'total': (without_category if category is None else without_category & category).bit_count(),
+            'categories': {cid: (without_category & bits).bit_count() for cid, bits in snapshot.categories.items()},
+            'prices': {key: (without_price & bits).bit_count() for key, bits in snapshot.prices.items()},
+            'in_stock': (matching(category, bucket) & snapshot.in_stock).bit_count()
+        }
+
+def create_facet_index(config):
+    """Build the facet index from the FACET_* settings"""
+    return FacetIndex(
+        price_buckets(config.get('FACET_PRICE_BUCKETS', [2500, 5000, 10000, 25000])),
+        ttl=config.get('FACET_INDEX_TTL', 300)
+    )
+
+def get_facet_index():
+    """Return the facet index bound to the current app"""
+    return current_app.extensions['facet_index']
@@ -0,0 +1,70 @@
+import hashlib
+from functools import partial, wraps
+from flask import current_app, request, session
+from flask_login import current_user
+from markupsafe import Markup
+from app.services.catalog import get_catalog_cache
+from app.services.database import reading_primary
+
+def _args_key():
+    """Stable key for the request's query args, ignoring order and empty values"""
+    args = sorted((k, v) for k, v in request.args.items(multi=True) if v)
+    return hashlib.sha1(repr(args).encode()).hexdigest()
+
+def cache_page(view=None, scopes=()):
+    """Serve anonymous GETs of a catalog page from the page cache.
+    
+    Pages are keyed on endpoint, view arguments, normalized query args and
+    the catalog version, and carry a strong ETag of the rendered body so
+    browsers revalidate with If-None-Match and get a 304. Signed-in users
+    and requests with pending flash messages always render fresh, since
+    those pages contain per-user markup. A page showing separately
+    versioned data names its catalog cache scopes, as in
+    @cache_page(scopes=('related',)).
+    """
+    if view is None:
+        return partial(cache_page, scopes=scopes)
+    
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if (request.method != 'GET' or current_user.is_authenticated
+                or '_flashes' in session):
+            return view(*args, **kwargs)
+        
+        cache = get_catalog_cache()
+        key = f'{request.endpoint}:{sorted(kwargs.items())}:{_args_key()}'
+        entry = cache.get('page', key, scopes)
+        
+        if entry is None:
+            # Rendered from the primary, as it is cached under the current version
+            with reading_primary():
+                response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            body = response.get_data()
+            entry = (hashlib.sha1(body).hexdigest(), body, response.mimetype)
+            cache.set('page', key, entry, scopes)
+        else:
+            response = current_app.response_class(entry[1], mimetype=entry[2])
+        
+        response.set_etag(entry[0])
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Cookie')
+        return response.make_conditional(request)
+    
+    return wrapper
+
+def cache_fragment(name, *key_parts, caller):
+    """Jinja helper caching a rendered template block per catalog version.
+    
+    Used as {% call cache_fragment('product-grid', ...) %}...{% endcall %};
+    the block must not contain per-user markup.
+    """
+    cache = get_catalog_cache()
+    key = f'{name}:{hashlib.sha1(repr(key_parts).encode()).hexdigest()}'
+    html = cache.get('fragment', key)
+    if html is None:
+        with reading_primary():
+            html = str(caller())
+        cache.set('fragment', key, html)
+    return Markup(html)
@@ -0,0 +1,112 @@
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from app.models import User
+from app.services.cache import MemoryCache, create_cache
+
+class UserSnapshot:
+    """Detached, picklable copy of a signed-in User for Flask-Login.
+    
+    Carries the columns pages read from current_user and the Flask-Login
+    interface, but not the password hash. Views that change the account
+    load the User row themselves.
+    """
+    __slots__ = ('id', 'username', 'email', 'phone', 'created_at')
+    
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.phone = user.phone
+        self.created_at = user.created_at
+    
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+    
+    def get_id(self):
+        return str(self.id)
+
+class IdentityCache:
+    """User snapshots in a per-process LRU, optionally backed by a shared cache.
+    
+    The local tier answers most requests without a network round trip; the
+    shared tier lets a new worker skip the database too. Changes to a user
+    delete both tiers in the committing process, while other processes'
+    local copies expire within local_ttl.
+    """
+    
+    def __init__(self, local, shared=None, ttl=300):
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+    
+    def get(self, user_id):
+        key = f'user:{user_id}'
+        snapshot = self.local.get(key)
+        if snapshot is None and self.shared is not None:
+            snapshot = self.shared.get(key)
+            if snapshot is not None:
+                self.local.set(key, snapshot)
+        return snapshot
+    
+    def set(self, user_id, snapshot):
+        key = f'user:{user_id}'
+        self.local.set(key, snapshot)
+        if self.shared is not None:
+            self.shared.set(key, snapshot, self.ttl)
+    
+    def invalidate(self, user_ids):
+        for user_id in user_ids:
+            key = f'user:{user_id}'
+            self.local.delete(key)
+            if self.shared is not None:
+                self.shared.delete(key)
+
+def create_identity_cache(config):
+    """Build the user cache selected by the USER_CACHE setting"""
+    backend = config.get('USER_CACHE', 'memory')
+    ttl = config.get('USER_CACHE_TTL', 300)
+    max_entries = config.get('USER_CACHE_MAX_ENTRIES', 10000)
+    
+    if backend == 'redis':
+        shared = create_cache('redis', redis_url=config.get('USER_CACHE_REDIS_URL'), prefix='shop:', default_ttl=ttl)
+        local = MemoryCache(max_entries=max_entries, default_ttl=config.get('USER_CACHE_LOCAL_TTL', 30))
+        return IdentityCache(local, shared, ttl)
+    return IdentityCache(create_cache(backend, max_entries=max_entries, default_ttl=ttl), ttl=ttl)
+
+def get_identity_cache():
+    """Return the user cache bound to the current app"""
+    return current_app.extensions['identity_cache']
+
+def load_user(user_id):
+    """Flask-Login user loader: a cached UserSnapshot, reading the database only on a miss"""
+    user_id = int(user_id)
+    cache = get_identity_cache()
+    snapshot = cache.get(user_id)
+    if snapshot is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        snapshot = UserSnapshot(user)
+        cache.set(user_id, snapshot)
+    return snapshot
+
+@event.listens_for(Session, 'after_flush')
+def _track_user_changes(session, flush_context):
+    changed = {obj.id for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('users_changed', set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_users(session):
+    changed = session.info.pop('users_changed', None)
+    if changed and has_app_context():
+        cache = current_app.extensions.get('identity_cache')
+        if cache is not None:
+            cache.invalidate(changed)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_user_changes(session):
+    session.info.pop('users_changed', None)
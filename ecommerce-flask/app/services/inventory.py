@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import bindparam, insert
+from app import db
+from app.models import Product, Order, StockReservation
+from app.services.notifications import publish_order_status
+
+class InsufficientStockError(Exception):
+    """Raised when a reservation cannot be satisfied from current stock"""
+    
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f'Insufficient stock for products {product_ids}')
+
+_products = Product.__table__
+
+_decrement_stmt = _products.update().where(
+    _products.c.id == bindparam('pid'),
+    _products.c.stock >= bindparam('qty')
+).values(stock=_products.c.stock - bindparam('qty'))
+
+_increment_stmt = _products.update().where(
+    _products.c.id == bindparam('pid')
+).values(stock=_products.c.stock + bindparam('qty'))
+
+def _aggregate(lines):
+    """Collapse (product_id, quantity) pairs into sorted bind parameters.
+    
+    Rows are always touched in primary key order so concurrent batches
+    acquire row locks in the same order and cannot deadlock each other.
+    Raises ValueError for a quantity below 1, which the conditional
+    decrement would otherwise turn into a stock increase.
+    """
+    quantities = {}
+    for product_id, quantity in lines:
+        if quantity < 1:
+            raise ValueError(f'Cannot reserve {quantity} of product {product_id}')
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return [{'pid': pid, 'qty': qty} for pid, qty in sorted(quantities.items())]
+
+def _decrement(params):
+    """Run the conditional decrement batch, returning True if every row was reserved"""
+    if db.engine.dialect.supports_sane_multi_rowcount:
+        return db.session.execute(_decrement_stmt, params).rowcount == len(params)
+    
+    for p in params:
+        if db.session.execute(_decrement_stmt, p).rowcount != 1:
+            return False
+    return True
+
+def reserve_stock(order, cart_items, ttl=None):
+    """Atomically hold stock for every cart line of a pending order.
+    
+    Stock is decremented in the database with a conditional UPDATE so two
+    concurrent checkouts can never both take the last unit. Raises
+    InsufficientStockError if any line cannot be satisfied; the caller is
+    expected to roll back the session in that case.
+    """
+    if ttl is None:
+        ttl = current_app.config['STOCK_RESERVATION_TTL']
+    
+    params = _aggregate((item['product'].id, item['quantity']) for item in cart_items)
+    if not params:
+        return []
+    
+    if not _decrement(params):
+        # Name the lines the loaded snapshot already knows are short; if the
+        # shortfall came from a concurrent checkout, blame the whole cart.
+        reserved = {p['pid']: p['qty'] for p in params}
+        short = [item['product'].id for item in cart_items
+                 if item['product'].stock < reserved[item['product'].id]]
+        raise InsufficientStockError(short or list(reserved))
+    
+    expires_at = datetime.utcnow() + timedelta(seconds=ttl)
+    # One executemany rather than a flush-time INSERT per line
+    rows = [
+        {'order_id': order.id, 'product_id': p['pid'], 'quantity': p['qty'], 'expires_at': expires_at}
+        for p in params
+    ]
+    db.session.execute(insert(StockReservation), rows)
+    return rows
+
+def reserve_late_payment(order, payment_id):
+    """Hold stock again for a cancelled order whose payment arrived after the sweep.
+    
+    Returns True once the stock is reserved; the caller then settles the
+    order. If an item has sold out meanwhile the session is rolled back,
+    the payment is recorded on the still cancelled order for a refund or
+    restock by hand, an error is logged and False is returned. The caller
+    commits in both cases.
+    """
+    lines = [{'product': item.product, 'quantity': item.quantity} for item in order.items]
+    try:
+        reserve_stock(order, lines)
+    except InsufficientStockError:
+        db.session.rollback()
+        order.payment_id = payment_id
+        current_app.logger.error('Order %s was paid after its stock was released and some items are sold out; '
+                                 'it needs a refund or restock (payment %s)', order.id, payment_id)
+        return False
+    return True
+
+def _release(reservations):
+    """Return held stock for the given reservations and mark them released"""
+    held = [r for r in reservations if r.status == 'held']
+    if not held:
+        return 0
+    
+    db.session.execute(_increment_stmt, _aggregate((r.product_id, r.quantity) for r in held))
+    for reservation in held:
+        reservation.status = 'released'
+    return len(held)
+
+def release_reservations(order):
+    """Give back the stock held by an order that will not be paid"""
+    return _release(order.reservations.filter_by(status='held').all())
+
+def commit_reservations(order):
+    """Make an order's held stock permanent once payment is confirmed"""
+    order.reservations.filter_by(status='held').update(
+        {'status': 'committed'}, synchronize_session=False
+    )
+
+def commit_reservations_for(order_ids):
+    """Batch form of commit_reservations for many orders at once"""
+    if not order_ids:
+        return
+    StockReservation.query.filter(
+        StockReservation.order_id.in_(order_ids),
+        StockReservation.status == 'held'
+    ).update({'status': 'committed'}, synchronize_session=False)
+
+def sweep_expired_reservations(now=None):
+    """Release stock held by unpaid orders whose reservations have expired.
+    
+    The abandoned orders (pending, or failed and never retried) are marked
+    cancelled. Returns the number of orders swept.
+    """
+    now = now or datetime.utcnow()
+    
+    reservations = StockReservation.query.join(Order).filter(
+        StockReservation.status == 'held',
+        StockReservation.expires_at < now,
+        Order.status.in_(('pending', 'failed'))
+    ).with_for_update(of=StockReservation, skip_locked=True).all()
+    
+    if not reservations:
+        return 0
+    
+    _release(reservations)
+    order_ids = {r.order_id for r in reservations}
+    # Cancel through the unit of work so order summaries see the transition
+    orders = Order.query.filter(
+        Order.id.in_(order_ids), Order.status.in_(('pending', 'failed'))
+    ).with_for_update().all()
+    cancelled = []
+    for order in orders:
+        order.status = 'cancelled'
+        cancelled.append(order.id)
+    db.session.commit()
+    
+    for order_id in cancelled:
+        publish_order_status(order_id, 'cancelled')
+    return len(order_ids)
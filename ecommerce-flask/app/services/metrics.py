@@ -0,0 +1,268 @@
+import heapq
+import hmac
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from flask import (Response, abort, before_render_template, current_app, g, has_app_context,
+                   has_request_context, request, template_rendered)
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+# Slowest statements a slow-request log line shows
+SLOW_LOG_STATEMENTS = 5
+MAX_LOGGED_SQL = 500
+_WHITESPACE = re.compile(r'\s+')
+
+# name -> (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Time from before_request to after_request'),
+    'db_queries_per_request': ('histogram', 'SQL statements run per request'),
+    'db_query_seconds_total': ('counter', 'Time spent executing SQL inside requests'),
+    'db_queries_total': ('counter', 'SQL statements run inside requests'),
+    'template_render_seconds_total': ('counter', 'Time spent rendering templates'),
+    'outbound_http_seconds_total': ('counter', 'Time requests spent waiting on Stripe and Daraja'),
+    'outbound_http_duration_seconds': ('histogram', 'Outbound API calls, by service and outcome'),
+}
+
+class Histogram:
+    """Cumulative bucket counts, sum and count for one label set"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms kept in process memory.
+    
+    Every worker process has its own registry, so Prometheus should scrape
+    each process (or sum per instance) rather than expect global totals.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+    
+    def inc(self, name, labels, value=1):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+    
+    def render(self):
+        """Everything recorded so far in Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.counts), h.sum, h.count, h.buckets))
+                                for key, h in self.histograms.items())
+        
+        lines = []
+        seen = set()
+        
+        def header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, help_text = METRICS.get(name, ('untyped', name))
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+        
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        for (name, labels), (counts, total, count, buckets) in histograms:
+            header(name)
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {bucket_count}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+        return lines
+
+class RequestTimings:
+    """What one request spent its time on, collected while it runs"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.http_seconds = 0.0
+        self.template_starts = []
+        self.slowest = []  # min-heap of (seconds, statement)
+    
+    def add_query(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        if len(self.slowest) < SLOW_LOG_STATEMENTS:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+def _current_timings():
+    return g.get('request_timings') if has_request_context() else None
+
+def get_metrics():
+    """Return the metrics registry bound to the current app, or None if disabled"""
+    return current_app.extensions.get('metrics') if has_app_context() else None
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # A connection runs one cursor execution at a time, so one slot is enough
+    conn.info['metrics_query_started'] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('metrics_query_started', None)
+    timings = _current_timings()
+    if started is not None and timings is not None:
+        timings.add_query(statement, time.perf_counter() - started)
+
+def _before_render(sender, template, context, **extra):
+    timings = _current_timings()
+    if timings is not None:
+        timings.template_starts.append(time.perf_counter())
+
+def _rendered(sender, template, context, **extra):
+    timings = _current_timings()
+    if timings is None or not timings.template_starts:
+        return
+    timings.template_seconds += time.perf_counter() - timings.template_starts.pop()
+
+@contextmanager
+def track_http(service):
+    """Time an outbound API call: `with track_http('stripe'): ...`"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        elapsed = time.perf_counter() - started
+        registry = get_metrics()
+        if registry is not None:
+            registry.observe('outbound_http_duration_seconds', {'service': service, 'outcome': outcome}, elapsed)
+        timings = _current_timings()
+        if timings is not None:
+            timings.http_seconds += elapsed
+
+def _catalog_cache_lines():
+    cache = current_app.extensions.get('catalog_cache')
+    if cache is None:
+        return []
+    stats = cache.stats()
+    lines = []
+    for result in ('hits', 'misses'):
+        name = f'catalog_cache_{result}_total'
+        lines.append(f'# HELP {name} Catalog cache lookups that {"found" if result == "hits" else "missed"} a value')
+        lines.append(f'# TYPE {name} counter')
+        for cache_name, counts in sorted(stats.items()):
+            lines.append(f'{name}{_format_labels([("cache", cache_name)])} {counts[result]}')
+    return lines
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        # Endpoint names and timings are only served unauthenticated to a debug server
+        if not current_app.debug:
+            abort(404)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+    lines = get_metrics().render() + _catalog_cache_lines()
+    return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _log_slow_request(endpoint, elapsed, timings):
+    statements = [
+        f'    {seconds * 1000:.1f} ms  {_WHITESPACE.sub(" ", statement).strip()[:MAX_LOGGED_SQL]}'
+        for seconds, statement in sorted(timings.slowest, reverse=True)
+    ]
+    logger.warning(
+        'Slow request %s %s (%s): %.0f ms total, %d queries in %.0f ms, templates %.0f ms, '
+        'outbound HTTP %.0f ms%s',
+        request.method, request.path, endpoint, elapsed * 1000, timings.queries,
+        timings.db_seconds * 1000, timings.template_seconds * 1000, timings.http_seconds * 1000,
+        ''.join('\n' + line for line in statements)
+    )
+
+def init_metrics(app, engines):
+    """Record per-endpoint latency, SQL, template and outbound HTTP time.
+    
+    Serves the totals in Prometheus text format at /metrics and logs any
+    request slower than SLOW_REQUEST_MS along with its slowest statements.
+    SQL run outside a request (webhook workers, CLI commands) is not
+    recorded.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    
+    registry = app.extensions['metrics'] = MetricsRegistry()
+    slow_seconds = app.config.get('SLOW_REQUEST_MS', 500) / 1000
+    
+    for engine in engines:
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    
+    @app.before_request
+    def start_request_timer():
+        g.request_timings = RequestTimings()
+    
+    @app.after_request
+    def record_request(response):
+        timings = g.pop('request_timings', None)
+        if timings is None:
+            return response
+        elapsed = time.perf_counter() - timings.started
+        endpoint = request.endpoint or 'unmatched'
+        labels = {'endpoint': endpoint, 'method': request.method}
+        
+        registry.inc('http_requests_total', {**labels, 'status': str(response.status_code)})
+        registry.observe('http_request_duration_seconds', labels, elapsed)
+        registry.observe('db_queries_per_request', labels, timings.queries, QUERY_BUCKETS)
+        registry.inc('db_queries_total', labels, timings.queries)
+        registry.inc('db_query_seconds_total', labels, timings.db_seconds)
+        registry.inc('template_render_seconds_total', labels, timings.template_seconds)
+        registry.inc('outbound_http_seconds_total', labels, timings.http_seconds)
+        
+        if slow_seconds and elapsed >= slow_seconds:
+            _log_slow_request(endpoint, elapsed, timings)
+        return response
+    
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
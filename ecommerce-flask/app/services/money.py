@@ -0,0 +1,38 @@
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import func
+from app import db
+from app.models import Order, OrderItem
+
+# Amounts are stored and computed as integer minor units (cents); only
+# input parsing and display deal in major units
+MINOR_UNITS = 100
+
+def to_minor(value):
+    """Convert a major-unit amount such as '19.99' or 19.99 to integer minor units"""
+    return int((Decimal(str(value)) * MINOR_UNITS).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def to_major_ceil(minor):
+    """Whole major units covering a minor-unit amount, for gateways without decimals"""
+    return -(-minor // MINOR_UNITS)
+
+def format_money(minor):
+    """Render minor units as a fixed two-decimal string, e.g. 1999 -> '19.99'"""
+    if minor is None:
+        return ''
+    sign = '-' if minor < 0 else ''
+    major, cents = divmod(abs(minor), MINOR_UNITS)
+    return f'{sign}{major}.{cents:02d}'
+
+def order_total_mismatches(order_ids=None):
+    """Orders whose stored total differs from the sum of their line items.
+    
+    Line totals are summed as integers in a single grouped query. Returns
+    (order_id, total_cents, items_cents) tuples.
+    """
+    items_cents = func.sum(OrderItem.price_cents * OrderItem.quantity)
+    query = db.session.query(Order.id, Order.total_cents, items_cents).join(
+        OrderItem, OrderItem.order_id == Order.id
+    ).group_by(Order.id, Order.total_cents).having(items_cents != Order.total_cents)
+    if order_ids is not None:
+        query = query.filter(Order.id.in_(order_ids))
+    return query.order_by(Order.id).all()
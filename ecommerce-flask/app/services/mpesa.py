@@ -0,0 +1,238 @@
+import asyncio
+import base64
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+BASE_URLS = {
+    'sandbox': 'https://sandbox.safaricom.co.ke',
+    'production': 'https://api.safaricom.co.ke',
+}
+
+TOKEN_PATH = '/oauth/v1/generate?grant_type=client_credentials'
+STK_PUSH_PATH = '/mpesa/stkpush/v1/processrequest'
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class DarajaError(Exception):
+    """Raised when the Daraja API cannot be reached or rejects a request"""
+
+def normalize_phone(phone):
+    """Format a phone number as 2547XXXXXXXX, the form Daraja expects"""
+    phone = phone.strip().replace('+', '')
+    if phone.startswith('0'):
+        return '254' + phone[1:]
+    if not phone.startswith('254'):
+        return '254' + phone
+    return phone
+
+class _DarajaBase:
+    """Configuration, token bookkeeping and payload building shared by both clients"""
+    
+    def __init__(self, consumer_key, consumer_secret, shortcode, passkey,
+                 environment='sandbox', base_url=None, timeout=10, retries=3,
+                 backoff=0.5, token_skew=60):
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.shortcode = shortcode
+        self.passkey = passkey
+        # As before the client existed, anything but 'production' is the sandbox
+        environment = 'production' if environment == 'production' else 'sandbox'
+        self.base_url = (base_url or BASE_URLS[environment]).rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.token_skew = token_skew
+        self._token = None
+        self._token_expires = 0
+    
+    def _cached_token(self):
+        if self._token and time.monotonic() < self._token_expires:
+            return self._token
+        return None
+    
+    def _store_token(self, data):
+        token = data.get('access_token')
+        if not token:
+            raise DarajaError('Daraja did not return an access token')
+        # Refresh a little before Daraja expires it so in-flight calls never
+        # carry a token that dies on the way
+        expires_in = int(data.get('expires_in', 3599))
+        self._token = token
+        self._token_expires = time.monotonic() + max(expires_in - self.token_skew, 0)
+        return token
+    
+    def _basic_auth(self):
+        credentials = f'{self.consumer_key}:{self.consumer_secret}'.encode()
+        return {'Authorization': f'Basic {base64.b64encode(credentials).decode()}'}
+    
+    def _stk_payload(self, phone, amount, reference, description, callback_url):
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        password = base64.b64encode(f'{self.shortcode}{self.passkey}{timestamp}'.encode()).decode()
+        phone = normalize_phone(phone)
+        return {
+            'BusinessShortCode': self.shortcode,
+            'Password': password,
+            'Timestamp': timestamp,
+            'TransactionType': 'CustomerPayBillOnline',
+            'Amount': amount,
+            'PartyA': phone,
+            'PartyB': self.shortcode,
+            'PhoneNumber': phone,
+            'CallBackURL': callback_url,
+            'AccountReference': reference,
+            'TransactionDesc': description
+        }
+
+class DarajaClient(_DarajaBase):
+    """Thread-safe Daraja client with a pooled session and a cached OAuth token.
+    
+    One instance is shared per app. Concurrent callers that find the token
+    expired wait on a lock while a single caller refreshes it. Token
+    requests are retried with exponential backoff; STK pushes are only
+    retried when the connection could not be established, so a customer
+    is never prompted twice for one order.
+    """
+    
+    def __init__(self, *args, pool_size=10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({'GET'}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def access_token(self):
+        token = self._cached_token()
+        if token:
+            return token
+        
+        with self._lock:
+            token = self._cached_token()
+            if token:
+                return token
+            try:
+                response = self.session.get(self.base_url + TOKEN_PATH, headers=self._basic_auth(),
+                                            timeout=self.timeout)
+                response.raise_for_status()
+                return self._store_token(response.json())
+            except requests.RequestException as e:
+                raise DarajaError(f'Could not obtain M-Pesa access token: {e}') from e
+    
+    def stk_push(self, phone, amount, reference, description, callback_url):
+        """Prompt the customer's phone for payment and return Daraja's response"""
+        headers = {'Authorization': f'Bearer {self.access_token()}'}
+        payload = self._stk_payload(phone, amount, reference, description, callback_url)
+        try:
+            response = self.session.post(self.base_url + STK_PUSH_PATH, json=payload,
+                                         headers=headers, timeout=self.timeout)
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise DarajaError(f'STK push failed: {e}') from e
+
+class AsyncDarajaClient(_DarajaBase):
+    """asyncio Daraja client built on httpx, for use outside the WSGI workers"""
+    
+    def __init__(self, *args, pool_size=10, **kwargs):
+        if httpx is None:
+            raise RuntimeError('AsyncDarajaClient requires the httpx package')
+        super().__init__(*args, **kwargs)
+        self._lock = asyncio.Lock()
+        # Retries live in _with_backoff only; a retrying transport under it
+        # would multiply the attempts
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+    
+    async def _with_backoff(self, request, retry_on=None, retry_status=True):
+        """Run request() with exponential backoff between attempts.
+        
+        Retries retry_on errors (any transport error by default) and, if
+        retry_status, 429 and 5xx responses.
+        """
+        retry_on = retry_on or httpx.TransportError
+        for attempt in range(self.retries + 1):
+            try:
+                response = await request()
+                if not retry_status or response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+            except retry_on:
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt))
+    
+    async def access_token(self):
+        token = self._cached_token()
+        if token:
+            return token
+        
+        async with self._lock:
+            token = self._cached_token()
+            if token:
+                return token
+            try:
+                response = await self._with_backoff(
+                    lambda: self.client.get(self.base_url + TOKEN_PATH, headers=self._basic_auth())
+                )
+                response.raise_for_status()
+                return self._store_token(response.json())
+            except httpx.HTTPError as e:
+                raise DarajaError(f'Could not obtain M-Pesa access token: {e}') from e
+    
+    async def stk_push(self, phone, amount, reference, description, callback_url):
+        """Prompt the customer's phone for payment and return Daraja's response"""
+        headers = {'Authorization': f'Bearer {await self.access_token()}'}
+        payload = self._stk_payload(phone, amount, reference, description, callback_url)
+        try:
+            # Only retried when the request never reached Daraja
+            response = await self._with_backoff(
+                lambda: self.client.post(self.base_url + STK_PUSH_PATH, json=payload, headers=headers),
+                retry_on=(httpx.ConnectError, httpx.ConnectTimeout), retry_status=False
+            )
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            raise DarajaError(f'STK push failed: {e}') from e
+    
+    async def aclose(self):
+        await self.client.aclose()
+
+def _client_kwargs(config):
+    return dict(
+        consumer_key=config['MPESA_CONSUMER_KEY'],
+        consumer_secret=config['MPESA_CONSUMER_SECRET'],
+        shortcode=config['MPESA_SHORTCODE'],
+        passkey=config['MPESA_PASSKEY'],
+        environment=config['MPESA_ENVIRONMENT'],
+        base_url=config.get('MPESA_BASE_URL'),
+        timeout=config.get('MPESA_TIMEOUT', 10),
+        retries=config.get('MPESA_RETRIES', 3)
+    )
+
+def create_daraja_client(config):
+    """Build the shared Daraja client from app configuration"""
+    return DarajaClient(**_client_kwargs(config))
+
+def create_async_daraja_client(config):
+    """Build an asyncio Daraja client from app configuration"""
+    return AsyncDarajaClient(**_client_kwargs(config))
+
+def get_daraja_client():
+    """Return the Daraja client bound to the current app"""
+    return current_app.extensions['mpesa']
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, session
+from itsdangerous import URLSafeSerializer, BadSignature
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+class PubSub:
+    """Publish/subscribe channel carrying small JSON-able messages.
+    
+    Backends remember the last message per channel so a subscriber that
+    arrives just after a publish still sees it instead of waiting for the
+    next one.
+    """
+    
+    def publish(self, channel, message):
+        raise NotImplementedError
+    
+    def last(self, channel):
+        raise NotImplementedError
+    
+    def wait(self, channel, timeout, since=None):
+        """Block until a message other than `since` is on the channel, or timeout.
+        
+        Returns the message, or None on timeout.
+        """
+        raise NotImplementedError
+
+class MemoryPubSub(PubSub):
+    """Pub/sub between threads of one process"""
+    
+    def __init__(self, max_channels=10000):
+        self.max_channels = max_channels
+        self._last = OrderedDict()
+        self._cond = threading.Condition()
+    
+    def publish(self, channel, message):
+        with self._cond:
+            self._last[channel] = message
+            self._last.move_to_end(channel)
+            while len(self._last) > self.max_channels:
+                self._last.popitem(last=False)
+            self._cond.notify_all()
+    
+    def last(self, channel):
+        with self._cond:
+            return self._last.get(channel)
+    
+    def wait(self, channel, timeout, since=None):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                message = self._last.get(channel)
+                if message is not None and message != since:
+                    return message
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+class RedisPubSub(PubSub):
+    """Pub/sub shared by every process through a Redis-protocol server"""
+    
+    def __init__(self, client, prefix='events:', retention=3600):
+        self.client = client
+        self.prefix = prefix
+        self.retention = retention
+    
+    def publish(self, channel, message):
+        data = json.dumps(message)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(f'{self.prefix}last:{channel}', data, ex=self.retention)
+        pipe.publish(f'{self.prefix}{channel}', data)
+        pipe.execute()
+    
+    def last(self, channel):
+        data = self.client.get(f'{self.prefix}last:{channel}')
+        return json.loads(data) if data else None
+    
+    def wait(self, channel, timeout, since=None):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            # Subscribe before reading the last value so nothing published
+            # in between can slip past
+            pubsub.subscribe(f'{self.prefix}{channel}')
+            message = self.last(channel)
+            if message is not None and message != since:
+                return message
+            
+            deadline = time.monotonic() + timeout
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                raw = pubsub.get_message(timeout=remaining)
+                if raw and raw['type'] == 'message':
+                    message = json.loads(raw['data'])
+                    if message != since:
+                        return message
+        finally:
+            pubsub.close()
+
+def create_pubsub(config):
+    """Build the pub/sub selected by the ORDER_EVENTS_BACKEND setting"""
+    backend = config.get('ORDER_EVENTS_BACKEND', 'memory')
+    
+    if backend == 'redis':
+        if redis is None:
+            raise RuntimeError('ORDER_EVENTS_BACKEND=redis requires the redis package')
+        return RedisPubSub(redis.Redis.from_url(config['ORDER_EVENTS_REDIS_URL']))
+    
+    if backend == 'memory':
+        return MemoryPubSub()
+    
+    raise ValueError(f'Unknown ORDER_EVENTS_BACKEND: {backend}')
+
+def get_pubsub():
+    """Return the pub/sub bound to the current app"""
+    return current_app.extensions['pubsub']
+
+def publish_order_status(order_id, status):
+    """Tell anyone waiting on an order that its status changed"""
+    get_pubsub().publish(f'order:{order_id}', {'status': status})
+
+def _token_serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='order-status')
+
+def order_status_token(order):
+    """Token letting the order's owner wait on its status without a DB lookup"""
+    return _token_serializer().dumps([order.id, order.user_id])
+
+def check_order_status_token(token, order_id):
+    """True if the token was issued for this order to the signed-in user.
+    
+    Reads the user id straight from the session so the check needs no
+    database access.
+    """
+    try:
+        token_order_id, user_id = _token_serializer().loads(token or '')
+    except (BadSignature, ValueError, TypeError):
+        return False
+    return token_order_id == order_id and session.get('_user_id') == str(user_id)
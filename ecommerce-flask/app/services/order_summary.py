@@ -0,0 +1,114 @@
+from sqlalchemy import bindparam, case, event, func, inspect, insert, select, update, delete
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Order, OrderSummary
+from app.services.database import upsert_rows
+
+STATUSES = ('pending', 'paid', 'shipped', 'delivered', 'cancelled', 'failed')
+# Orders in these states count towards a customer's lifetime spend
+SPENT_STATUSES = ('paid', 'shipped', 'delivered')
+
+def get_order_summary(user_id):
+    """A user's order summary, or an all-zero one if they have never ordered"""
+    summary = db.session.get(OrderSummary, user_id)
+    if summary is None:
+        summary = OrderSummary(user_id=user_id, order_count=0, total_spent_cents=0,
+                               **{f'{s}_count': 0 for s in STATUSES})
+    return summary
+
+def _deltas(changes):
+    """Fold (user_id, old_status, new_status, total_cents, created_at) changes into per-user deltas.
+    
+    old_status is None for a newly placed order.
+    """
+    deltas = {}
+    for user_id, old, new, total, created_at in changes:
+        if user_id is None or old == new:
+            continue
+        d = deltas.setdefault(user_id, {
+            'order_count': 0, 'total_spent_cents': 0, 'last_order_at': None,
+            **{f'{s}_count': 0 for s in STATUSES}
+        })
+        if old is None:
+            d['order_count'] += 1
+            if d['last_order_at'] is None or created_at > d['last_order_at']:
+                d['last_order_at'] = created_at
+        else:
+            d[f'{old}_count'] -= 1
+        d[f'{new}_count'] += 1
+        d['total_spent_cents'] += total * ((new in SPENT_STATUSES) - (old in SPENT_STATUSES))
+    return deltas
+
+def _ensure_rows(conn, user_ids):
+    table = OrderSummary.__table__
+    zeros = {'order_count': 0, 'total_spent_cents': 0, **{f'{s}_count': 0 for s in STATUSES}}
+    upsert_rows(conn, table, [{'user_id': user_id, **zeros} for user_id in user_ids], ['user_id'])
+
+def apply_order_changes(changes, conn=None):
+    """Fold order placements and status changes into the per-user summaries.
+    
+    Runs in the caller's transaction, so summaries commit or roll back with
+    the orders themselves. Every affected user is handled by one batched
+    upsert and one batched UPDATE of relative increments, so concurrent
+    changes for the same user do not overwrite each other.
+    """
+    deltas = _deltas(changes)
+    if not deltas:
+        return
+    
+    conn = conn if conn is not None else db.session.connection()
+    table = OrderSummary.__table__
+    _ensure_rows(conn, list(deltas))
+    
+    counters = ['order_count', 'total_spent_cents', *[f'{s}_count' for s in STATUSES]]
+    last = bindparam('d_last_order_at', type_=table.c.last_order_at.type)
+    stmt = update(table).where(table.c.user_id == bindparam('d_user_id')).values(
+        **{column: table.c[column] + bindparam(f'd_{column}') for column in counters},
+        last_order_at=case(
+            (last.is_(None), table.c.last_order_at),
+            (table.c.last_order_at.is_(None), last),
+            (last > table.c.last_order_at, last),
+            else_=table.c.last_order_at
+        )
+    )
+    conn.execute(stmt, [
+        {'d_user_id': user_id, **{f'd_{k}': v for k, v in d.items()}}
+        for user_id, d in deltas.items()
+    ])
+
+def rebuild_order_summaries():
+    """Recompute every summary from the order table, e.g. after a manual data fix"""
+    table = OrderSummary.__table__
+    spent = func.coalesce(func.sum(case((Order.status.in_(SPENT_STATUSES), Order.total_cents), else_=0)), 0)
+    source = select(
+        Order.user_id,
+        func.count(Order.id),
+        spent,
+        func.max(Order.created_at),
+        *[func.sum(case((Order.status == s, 1), else_=0)) for s in STATUSES]
+    ).where(Order.user_id.isnot(None)).group_by(Order.user_id)
+    
+    db.session.execute(delete(table))
+    db.session.execute(insert(table).from_select(
+        ['user_id', 'order_count', 'total_spent_cents', 'last_order_at', *[f'{s}_count' for s in STATUSES]],
+        source
+    ))
+
+@event.listens_for(Session, 'after_flush')
+def _track_order_changes(session, flush_context):
+    """Keep summaries in step with orders placed or updated through the ORM.
+    
+    Bulk UPDATE statements bypass the unit of work; callers issuing them
+    report their changes with apply_order_changes themselves.
+    """
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, Order):
+            changes.append((obj.user_id, None, obj.status, obj.total_cents, obj.created_at))
+    for obj in session.dirty:
+        if isinstance(obj, Order):
+            history = inspect(obj).attrs.status.history
+            if history.added and history.deleted:
+                changes.append((obj.user_id, history.deleted[0], history.added[0], obj.total_cents, obj.created_at))
+    if changes:
+        apply_order_changes(changes, session.connection())
@@ -0,0 +1,96 @@
+from datetime import datetime
+from flask import current_app
+from itsdangerous import URLSafeSerializer, BadSignature
+from sqlalchemy import and_, or_
+
+class KeysetPage:
+    """One page of a keyset (seek) paginated query"""
+    
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='keyset-cursor')
+
+def _dump(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+def _load(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+def encode_cursor(scope, values, direction):
+    """Build an opaque, tamper-proof cursor token for a row's sort key"""
+    return _serializer().dumps({'s': scope, 'k': [_dump(v) for v in values], 'd': direction})
+
+def decode_cursor(token, scope):
+    """Return (values, direction) for a cursor, or None if it is invalid or stale"""
+    if not token:
+        return None
+    try:
+        data = _serializer().loads(token)
+    except BadSignature:
+        return None
+    if data.get('s') != scope or data.get('d') not in ('next', 'prev'):
+        return None
+    return [_load(v) for v in data['k']], data['d']
+
+def _seek(order, values, backwards):
+    """Condition selecting rows strictly after the given key in traversal order"""
+    clauses = []
+    for i, ((column, descending), value) in enumerate(zip(order, values)):
+        beyond = column < value if descending != backwards else column > value
+        clauses.append(and_(*[c == v for (c, _), v in zip(order[:i], values[:i])], beyond))
+    return or_(*clauses)
+
+def keyset_paginate(query, order, cursor=None, per_page=12, scope=''):
+    """Paginate a query by seeking past the last seen sort key.
+    
+    order is a list of (column, descending) pairs whose combined values are
+    unique, e.g. [(Product.created_at, True), (Product.id, True)]. Unlike
+    OFFSET pagination the cost of a page does not grow with its depth and
+    no COUNT(*) is issued. scope ties cursors to one sort so a cursor from
+    another ordering is ignored rather than misapplied.
+    """
+    decoded = decode_cursor(cursor, scope)
+    values, direction = decoded if decoded else (None, 'next')
+    backwards = direction == 'prev'
+    
+    columns = [column for column, _ in order]
+    query = query.add_columns(*columns).order_by(None).order_by(*[
+        column.desc() if descending != backwards else column.asc()
+        for column, descending in order
+    ])
+    if values is not None:
+        query = query.filter(_seek(order, values, backwards))
+    
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    
+    has_next = more if not backwards else True
+    has_prev = values is not None if not backwards else more
+    
+    return KeysetPage(
+        items=[row[0] for row in rows],
+        per_page=per_page,
+        next_cursor=encode_cursor(scope, list(rows[-1][1:]), 'next') if rows and has_next else None,
+        prev_cursor=encode_cursor(scope, list(rows[0][1:]), 'prev') if rows and has_prev else None
+    )
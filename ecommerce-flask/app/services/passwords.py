@@ -0,0 +1,131 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+class HasherBusyError(Exception):
+    """Raised when the hashing pool is saturated and cannot take another hash"""
+
+def hash_method(pwhash):
+    """The method and parameters a stored hash was made with, e.g. 'scrypt:32768:8:1'"""
+    return (pwhash or '').split('$', 1)[0]
+
+class PasswordHasher:
+    """Hashes and verifies passwords on a bounded pool of worker processes.
+    
+    Keeping scrypt off the web worker stops a burst of logins from starving
+    every other request on the process. At most workers + queue_depth
+    hashes may be pending; beyond that, and when a hash takes longer than
+    timeout seconds, HasherBusyError is raised so the caller can shed load.
+    If a worker dies the pool is replaced and the hash in flight also fails
+    with HasherBusyError.
+    With workers=0 hashes run inline, which suits tests and CLI scripts.
+    
+    Workers are spawned rather than forked, since forking a threaded web
+    worker can deadlock the child; as with any spawned pool, scripts that
+    hash passwords need an `if __name__ == '__main__'` guard.
+    """
+    
+    def __init__(self, method=DEFAULT_METHOD, workers=2, queue_depth=32, timeout=10):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_depth) if workers else None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+    
+    def _executor(self):
+        # A pool inherited across fork (e.g. gunicorn --preload) is unusable
+        pid = os.getpid()
+        if self._pool is None or self._pid != pid:
+            with self._lock:
+                if self._pool is None or self._pid != pid:
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._pid = pid
+        return self._pool
+    
+    def _discard(self, pool):
+        # A pool stays broken once a worker dies; the next hash starts a new one
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusyError('Too many password hashes queued')
+        try:
+            pool = self._executor()
+            future = pool.submit(fn, *args)
+        except BaseException as e:
+            self._slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard(pool)
+                raise HasherBusyError('Password hashing pool was broken; restarting it') from e
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HasherBusyError('Password hashing timed out')
+        except BrokenProcessPool as e:
+            self._discard(pool)
+            raise HasherBusyError('A password hashing worker died') from e
+    
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+    
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+    
+    def needs_rehash(self, pwhash):
+        """True if pwhash was made with other parameters than the configured method"""
+        return hash_method(pwhash) != self.method
+    
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+def create_password_hasher(config):
+    """Build the password hasher from the PASSWORD_HASH_* settings"""
+    return PasswordHasher(
+        method=config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        workers=config.get('PASSWORD_HASH_WORKERS', 2),
+        queue_depth=config.get('PASSWORD_HASH_QUEUE_DEPTH', 32),
+        timeout=config.get('PASSWORD_HASH_TIMEOUT', 10)
+    )
+
+_inline_hasher = PasswordHasher(workers=0)
+
+def get_password_hasher():
+    """Return the hasher bound to the current app, or an inline one outside the app"""
+    if has_app_context():
+        return current_app.extensions['password_hasher']
+    return _inline_hasher
+
+def calibrate_scrypt(target_ms, r=8, p=1, max_n=2 ** 20):
+    """Largest power-of-two scrypt N whose hash takes at most target_ms on this machine.
+    
+    Returns (method, measured milliseconds).
+    """
+    n = 2 ** 14
+    while True:
+        started = time.perf_counter()
+        generate_password_hash('calibration', f'scrypt:{n}:{r}:{p}')
+        elapsed = (time.perf_counter() - started) * 1000
+        # Doubling N doubles the time; stop before overshooting the target
+        if elapsed * 2 > target_ms or n * 2 > max_n:
+            return f'scrypt:{n}:{r}:{p}', elapsed
+        n *= 2
@@ -0,0 +1,163 @@
+import random
+import sys
+import threading
+import time
+from flask import current_app, g, request
+from itsdangerous import BadSignature, TimestampSigner
+
+PROFILE_HEADER = 'X-Profile'
+MAX_DEPTH = 128
+# Distinct stacks kept per endpoint; rarer stacks beyond this are lumped together
+MAX_STACKS = 5000
+OVERFLOW_STACK = '[other stacks]'
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', '?')
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def collapse_stack(frame):
+    """A frame's call stack in collapsed form, outermost call first"""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class StackSampler:
+    """Samples the stacks of the threads serving profiled requests.
+    
+    One daemon thread wakes every `interval` seconds while any request is
+    being profiled, reads the threads' current frames and counts each
+    collapsed stack under the request's endpoint. It sleeps while nothing
+    is profiled, so requests outside the sample cost nothing.
+    """
+    
+    def __init__(self, interval=0.005, max_stacks=MAX_STACKS):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._active = {}  # thread id -> endpoint
+        self._thread = None
+        self.stacks = {}  # endpoint -> {collapsed stack: samples}
+        self.requests = {}  # endpoint -> profiled requests
+    
+    def start(self, endpoint):
+        """Start sampling the calling thread under endpoint"""
+        with self._lock:
+            self._active[threading.get_ident()] = endpoint
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+            self._wake.set()
+    
+    def stop(self):
+        """Stop sampling the calling thread"""
+        with self._lock:
+            endpoint = self._active.pop(threading.get_ident(), None)
+            if endpoint is not None:
+                self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+    
+    def _record(self, endpoint, stack):
+        stacks = self.stacks.setdefault(endpoint, {})
+        if stack not in stacks and len(stacks) >= self.max_stacks:
+            stack = OVERFLOW_STACK
+        stacks[stack] = stacks.get(stack, 0) + 1
+    
+    def _run(self):
+        while True:
+            with self._lock:
+                active = dict(self._active)
+                if not active:
+                    self._wake.clear()
+            if not active:
+                self._wake.wait()
+                continue
+            
+            frames = sys._current_frames()
+            sampled = [(endpoint, collapse_stack(frames[tid])) for tid, endpoint in active.items() if tid in frames]
+            with self._lock:
+                for endpoint, stack in sampled:
+                    self._record(endpoint, stack)
+            time.sleep(self.interval)
+    
+    def summary(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': self.requests.get(endpoint, 0),
+                    'samples': sum(self.stacks.get(endpoint, {}).values()),
+                    'stacks': len(self.stacks.get(endpoint, {}))
+                }
+                for endpoint in set(self.requests) | set(self.stacks)
+            }
+    
+    def collapsed(self, endpoint=None):
+        """Collapsed stacks as 'frame;frame;frame count' lines for flamegraph tools.
+        
+        Without an endpoint every endpoint is included, each as the root frame.
+        """
+        with self._lock:
+            if endpoint is not None:
+                stacks = dict(self.stacks.get(endpoint, {}))
+            else:
+                stacks = {f'{e};{stack}': n for e, s in self.stacks.items() for stack, n in s.items()}
+        return [f'{stack} {n}' for stack, n in sorted(stacks.items(), key=lambda item: -item[1])]
+    
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.requests.clear()
+
+def _signer():
+    return TimestampSigner(current_app.config['SECRET_KEY'], salt='profile')
+
+def create_profile_token():
+    """A token that forces profiling via the X-Profile header and reads the results"""
+    return _signer().sign('profile').decode()
+
+def check_profile_token(token):
+    try:
+        _signer().unsign(token or '', max_age=current_app.config.get('PROFILE_TOKEN_MAX_AGE', 3600))
+        return True
+    except BadSignature:
+        return False
+
+def get_profiler():
+    """Return the stack sampler bound to the current app"""
+    return current_app.extensions['profiler']
+
+def _should_profile(app):
+    token = request.headers.get(PROFILE_HEADER)
+    if token:
+        return check_profile_token(token)
+    rate = app.config.get('PROFILE_SAMPLE_RATE', 0)
+    if not rate or request.endpoint is None:
+        return False
+    endpoints = app.config.get('PROFILE_ENDPOINTS')
+    if endpoints and request.endpoint not in endpoints:
+        return False
+    return random.random() < rate
+
+def init_profiler(app):
+    """Sample stacks for a fraction of requests, or those carrying a profile token.
+    
+    PROFILE_SAMPLE_RATE picks the fraction, optionally limited to the
+    endpoints in PROFILE_ENDPOINTS. Results accumulate in memory per process
+    and are read from the admin blueprint.
+    """
+    sampler = app.extensions['profiler'] = StackSampler(
+        interval=app.config.get('PROFILE_INTERVAL_MS', 5) / 1000
+    )
+    
+    @app.before_request
+    def start_profiling():
+        if _should_profile(app):
+            g.profiling = True
+            sampler.start(request.endpoint or 'unmatched')
+    
+    @app.teardown_request
+    def stop_profiling(exc):
+        if g.pop('profiling', False):
+            sampler.stop()
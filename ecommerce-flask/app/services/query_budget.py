@@ -0,0 +1,50 @@
+import logging
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+class QueryCounter:
+    """Count the SQL statements an engine runs inside a `with` block"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+    
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+    
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+    
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+    
+    @property
+    def count(self):
+        return len(self.statements)
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def init_query_budget(app, engines):
+    """Count statements per request in g.query_count and log requests over budget.
+    
+    Per-view limits are asserted by the test suite, not checked here.
+    """
+    budget = app.config.get('QUERY_BUDGET')
+    if not budget:
+        return
+    
+    for engine in engines:
+        if not event.contains(engine, 'before_cursor_execute', _count_statement):
+            event.listen(engine, 'before_cursor_execute', _count_statement)
+    
+    @app.after_request
+    def check_query_budget(response):
+        count = g.get('query_count', 0)
+        if count > budget:
+            logger.warning('%s %s ran %d queries (budget %d)', request.method, request.path, count, budget)
+        return response
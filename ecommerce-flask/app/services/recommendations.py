@@ -0,0 +1,171 @@
+import heapq
+from array import array
+from itertools import groupby, permutations
+from operator import itemgetter
+from flask import current_app, has_app_context
+from sqlalchemy import delete, insert, select
+from app import db
+from app.models import Order, OrderItem, ProductRecommendation, RecommendationQueue
+from app.services.catalog import invalidate_on_commit
+from app.services.database import upsert_rows
+from app.services.order_summary import SPENT_STATUSES
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None  # pragma: no cover - optional dependency
+
+DEFAULT_TOP_K = 10
+# Products recounted, and queue rows deleted, per statement
+CHUNK_SIZE = 500
+# Order items fetched per round trip while streaming baskets
+STREAM_BATCH = 10000
+
+def _top_k(top_k):
+    if top_k is not None:
+        return top_k
+    return current_app.config.get('RECOMMENDATIONS_TOP_K', DEFAULT_TOP_K) if has_app_context() else DEFAULT_TOP_K
+
+def _chunks(values, size=CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _basket_items(product_ids=None):
+    """Stream (order_id, product_id) for paid orders, grouped by order.
+    
+    With product_ids, only orders containing one of those products are read.
+    """
+    stmt = select(OrderItem.order_id, OrderItem.product_id).join(
+        Order, Order.id == OrderItem.order_id
+    ).where(Order.status.in_(SPENT_STATUSES))
+    if product_ids is not None:
+        stmt = stmt.where(OrderItem.order_id.in_(
+            select(OrderItem.order_id).where(OrderItem.product_id.in_(product_ids))
+        ))
+    stmt = stmt.order_by(OrderItem.order_id).execution_options(yield_per=STREAM_BATCH)
+    return db.session.execute(stmt)
+
+def _ranked(candidates, top_k):
+    # Highest score first; ties go to the older (lower id) product
+    return heapq.nsmallest(top_k, candidates, key=lambda item: (-item[1], item[0]))
+
+def count_copurchases_sparse(rows, targets, top_k):
+    """Top co-purchased products per target as {product_id: [(other_id, orders)]}.
+    
+    Baskets become a sparse order x product incidence matrix X; X.T @ X then
+    holds, for every pair of products, the number of orders containing both.
+    Only the rows for targets (every product when None) are multiplied out.
+    """
+    orders, products = array('q'), array('q')
+    for order_id, product_id in rows:
+        orders.append(order_id)
+        products.append(product_id)
+    if not orders:
+        return {}
+    
+    _, row_index = np.unique(np.frombuffer(orders, dtype=np.int64), return_inverse=True)
+    product_ids, column_index = np.unique(np.frombuffer(products, dtype=np.int64), return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(column_index), dtype=np.int32), (row_index, column_index)),
+        shape=(row_index.max() + 1, len(product_ids))
+    )
+    # Duplicates were summed on construction; a product counts once per order
+    baskets.data[:] = 1
+    
+    if targets is None:
+        columns = np.arange(len(product_ids))
+    else:
+        columns = np.flatnonzero(np.isin(product_ids, np.asarray(list(targets), dtype=np.int64)))
+    counts = (baskets[:, columns].T @ baskets).tocsr()
+    
+    result = {}
+    for row, column in enumerate(columns):
+        start, end = counts.indptr[row], counts.indptr[row + 1]
+        others, scores = counts.indices[start:end], counts.data[start:end]
+        keep = others != column
+        others, scores = product_ids[others[keep]], scores[keep]
+        if not len(others):
+            continue
+        order = np.lexsort((others, -scores))[:top_k]
+        result[int(product_ids[column])] = [(int(o), int(s)) for o, s in zip(others[order], scores[order])]
+    return result
+
+def count_copurchases_python(rows, targets, top_k):
+    """Pure-Python equivalent of count_copurchases_sparse, used without scipy"""
+    targets = set(targets) if targets is not None else None
+    counts = {}
+    for _, basket in groupby(rows, key=itemgetter(0)):
+        products = {product_id for _, product_id in basket}
+        for product_id, other_id in permutations(products, 2):
+            if targets is None or product_id in targets:
+                pairs = counts.setdefault(product_id, {})
+                pairs[other_id] = pairs.get(other_id, 0) + 1
+    return {product_id: _ranked(pairs.items(), top_k) for product_id, pairs in counts.items()}
+
+def count_copurchases(rows, targets, top_k):
+    if sparse is not None:
+        return count_copurchases_sparse(rows, targets, top_k)
+    return count_copurchases_python(rows, targets, top_k)
+
+def _store(recommendations):
+    rows = [
+        {'product_id': product_id, 'rank': rank, 'recommended_id': other_id, 'score': score}
+        for product_id, ranked in recommendations.items()
+        for rank, (other_id, score) in enumerate(ranked, 1)
+    ]
+    if rows:
+        db.session.execute(insert(ProductRecommendation), rows)
+
+def _dequeue(order_ids):
+    for chunk in _chunks(order_ids):
+        db.session.execute(delete(RecommendationQueue).where(RecommendationQueue.order_id.in_(chunk)))
+    # Only the cached related products depend on recommendations
+    invalidate_on_commit('related')
+
+def queue_recommendation_refresh(order_ids):
+    """Queue newly paid orders for the next refresh_recommendations().
+    
+    Runs in the caller's transaction; an order already queued is left as is.
+    """
+    if not order_ids:
+        return
+    upsert_rows(db.session.connection(), RecommendationQueue.__table__,
+                [{'order_id': order_id} for order_id in order_ids], ['order_id'])
+
+def rebuild_recommendations(top_k=None):
+    """Recompute every product's recommendations from all paid orders.
+    
+    Returns the number of products that have recommendations.
+    """
+    queued = db.session.scalars(select(RecommendationQueue.order_id)).all()
+    recommendations = count_copurchases(_basket_items(), None, _top_k(top_k))
+    db.session.execute(delete(ProductRecommendation))
+    _store(recommendations)
+    _dequeue(queued)
+    return len(recommendations)
+
+def refresh_recommendations(top_k=None):
+    """Recompute recommendations for the products in queued orders.
+    
+    A new order only changes the co-purchase counts between the products it
+    contains, so recounting their baskets keeps every product's list exact.
+    Returns the number of products recomputed.
+    """
+    queued = db.session.scalars(select(RecommendationQueue.order_id)).all()
+    if not queued:
+        return 0
+    
+    affected = set()
+    for chunk in _chunks(queued):
+        affected.update(db.session.scalars(
+            select(OrderItem.product_id).where(OrderItem.order_id.in_(chunk)).distinct()
+        ))
+    affected = sorted(affected)
+    
+    for chunk in _chunks(affected):
+        recommendations = count_copurchases(_basket_items(chunk), chunk, _top_k(top_k))
+        db.session.execute(delete(ProductRecommendation).where(ProductRecommendation.product_id.in_(chunk)))
+        _store(recommendations)
+    _dequeue(queued)
+    return len(affected)
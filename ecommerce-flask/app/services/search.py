@@ -0,0 +1,177 @@
+import re
+import weakref
+from sqlalchemy import event, text, select, table, column, literal_column, bindparam, func, or_
+from app import db
+from app.models import Product, Category
+
+# Engines whose database has a product_search index we keep in sync
+_indexed_engines = weakref.WeakSet()
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_SQLITE_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+    name, description, category, tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+_SQLITE_UPSERT = """
+INSERT INTO product_search (rowid, name, description, category)
+SELECT p.id, p.name, coalesce(p.description, ''), coalesce(c.name, '')
+FROM product p LEFT JOIN category c ON c.id = p.category_id
+WHERE {where}
+"""
+
+_POSTGRES_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS product_search (
+        product_id INTEGER PRIMARY KEY REFERENCES product (id) ON DELETE CASCADE,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_product_search_document ON product_search USING GIN (document)",
+]
+
+_POSTGRES_UPSERT = """
+INSERT INTO product_search (product_id, document)
+SELECT p.id,
+       setweight(to_tsvector('simple', p.name), 'A') ||
+       setweight(to_tsvector('simple', coalesce(c.name, '')), 'B') ||
+       setweight(to_tsvector('simple', coalesce(p.description, '')), 'C')
+FROM product p LEFT JOIN category c ON c.id = p.category_id
+WHERE {where}
+ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document
+"""
+
+def _dialect(bind):
+    return bind.dialect.name
+
+def _sqlite_has_fts5(connection):
+    options = connection.exec_driver_sql('PRAGMA compile_options').scalars().all()
+    return 'ENABLE_FTS5' in options
+
+def init_search_index(engine):
+    """Create the full-text index for this database and backfill it if empty.
+    
+    SQLite gets an FTS5 virtual table and PostgreSQL a tsvector table with a
+    GIN index. Other databases (or SQLite builds without FTS5) fall back to
+    LIKE matching in search_products().
+    """
+    name = _dialect(engine)
+    if not db.inspect(engine).has_table('product'):
+        return False
+    
+    with engine.begin() as connection:
+        if name == 'sqlite' and _sqlite_has_fts5(connection):
+            connection.exec_driver_sql(_SQLITE_DDL)
+        elif name == 'postgresql':
+            for ddl in _POSTGRES_DDL:
+                connection.exec_driver_sql(ddl)
+        else:
+            return False
+        
+        _indexed_engines.add(engine)
+        indexed = connection.execute(text('SELECT count(*) FROM product_search')).scalar()
+        if not indexed:
+            _reindex(connection, '1 = 1')
+    return True
+
+def _reindex(connection, where, params=None):
+    """Rewrite the index rows for products matching a SQL condition on p"""
+    params = params or {}
+    
+    def statement(sql):
+        stmt = text(sql)
+        if 'ids' in params:
+            stmt = stmt.bindparams(bindparam('ids', expanding=True))
+        return stmt
+    
+    if _dialect(connection) == 'sqlite':
+        connection.execute(statement(
+            f'DELETE FROM product_search WHERE rowid IN (SELECT p.id FROM product p WHERE {where})'
+        ), params)
+        connection.execute(statement(_SQLITE_UPSERT.format(where=where)), params)
+    else:
+        connection.execute(statement(_POSTGRES_UPSERT.format(where=where)), params)
+
+def attach_search_replica(engine):
+    """Search a read replica's copy of the index; replication keeps it in sync"""
+    with engine.connect() as connection:
+        if db.inspect(connection).has_table('product_search'):
+            _indexed_engines.add(engine)
+
+def reindex_products(product_ids=None):
+    """Rebuild index rows for the given product ids, or the whole catalog"""
+    connection = db.session.connection()
+    if connection.engine not in _indexed_engines:
+        return
+    if product_ids is None:
+        connection.execute(text('DELETE FROM product_search'))
+        _reindex(connection, '1 = 1')
+    elif product_ids:
+        _reindex(connection, 'p.id IN :ids', {'ids': list(product_ids)})
+
+def _delete_rows(connection, product_id):
+    key = 'rowid' if _dialect(connection) == 'sqlite' else 'product_id'
+    connection.execute(text(f'DELETE FROM product_search WHERE {key} = :id'), {'id': product_id})
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+def _sync_product(mapper, connection, target):
+    if connection.engine in _indexed_engines:
+        _reindex(connection, 'p.id = :id', {'id': target.id})
+
+@event.listens_for(Product, 'after_delete')
+def _drop_product(mapper, connection, target):
+    if connection.engine in _indexed_engines:
+        _delete_rows(connection, target.id)
+
+@event.listens_for(Category, 'after_update')
+def _sync_category(mapper, connection, target):
+    if connection.engine in _indexed_engines and db.inspect(target).attrs.name.history.has_changes():
+        _reindex(connection, 'p.category_id = :id', {'id': target.id})
+
+def _match_expression(dialect, terms):
+    """Turn user tokens into a prefix-matching full-text query"""
+    if dialect == 'sqlite':
+        return ' '.join(f'"{term}"*' for term in terms)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+def like_search(query, search):
+    """Restrict a Product query with LIKE on name and description, scanning every row"""
+    pattern = f'%{search}%'
+    return query.filter(or_(Product.name.ilike(pattern), Product.description.ilike(pattern)))
+
+def search_products(query, search):
+    """Restrict a Product query to matches for the search string.
+    
+    Returns (query, rank) where rank is a column to order by for relevance
+    (lower is better), or None when only LIKE matching is available.
+    """
+    terms = _TOKEN_RE.findall(search.lower())
+    if not terms:
+        return query, None
+    
+    bind = db.session.get_bind(mapper=Product)
+    dialect = _dialect(bind)
+    
+    if bind not in _indexed_engines:
+        return like_search(query, search), None
+    
+    match = _match_expression(dialect, terms)
+    index = table('product_search')
+    if dialect == 'sqlite':
+        hits = select(
+            column('rowid').label('product_id'),
+            literal_column('bm25(product_search, 10.0, 1.0, 4.0)').label('rank')
+        ).select_from(index).where(text('product_search MATCH :match').bindparams(match=match))
+    else:
+        tsquery = func.to_tsquery('simple', match)
+        document = column('document')
+        hits = select(
+            column('product_id'),
+            (-func.ts_rank(document, tsquery)).label('rank')
+        ).select_from(index).where(document.op('@@')(tsquery))
+    
+    hits = hits.subquery('search_hits')
+    return query.join(hits, hits.c.product_id == Product.id), hits.c.rank
@@ -0,0 +1,328 @@
+import heapq
+import logging
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from app import db
+from app.models import Category, Order, OrderItem, Product
+from app.services.database import reading_primary
+from app.services.order_summary import SPENT_STATUSES
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# Prefixes this short match too many words to merge on every keystroke;
+# their results are kept until a word starting with them changes
+SHORT_PREFIX = 2
+# Entries a multi-word lookup scans in rank order before it intersects sets
+SCAN_BUDGET = 200
+_AFTER_ALL = chr(0x10ffff)
+
+def normalize(text):
+    """Lowercase text with accents removed, so 'cafe' finds 'Café'"""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+class Suggestion:
+    """A product or category name the search box can complete to"""
+    __slots__ = ('kind', 'id', 'name', 'slug', 'price_cents', 'popularity', 'tokens', 'rank')
+    
+    def __init__(self, kind, id, name, slug, price_cents=None, popularity=0):
+        self.kind = kind  # product, category
+        self.id = id
+        self.name = name
+        self.slug = slug
+        self.price_cents = price_cents
+        self.popularity = popularity
+        self.tokens = frozenset(tokenize(name))
+        # Best sellers first, then alphabetically
+        self.rank = (-popularity, normalize(name), kind, id)
+    
+    @property
+    def key(self):
+        return (self.kind, self.id)
+    
+    def fields(self):
+        return (self.name, self.slug, self.price_cents)
+
+def _rank(entry):
+    return entry.rank
+
+class SuggestIndex:
+    """In-memory prefix index over product and category names.
+    
+    Each distinct word is kept in one sorted list, and maps to the entries
+    containing it in popularity order. A prefix is found by bisecting the
+    word list, and the posting lists of the words it covers are merged lazily
+    until enough matches are found. Several words typed that rarely occur
+    together are answered by intersecting per-word entry sets instead.
+    A lookup never touches the database.
+    
+    Products and categories changed through the ORM are updated in place
+    when their transaction commits. The whole index, including popularity
+    (units sold in paid orders), is rebuilt in the background every ttl
+    seconds, which also picks up changes made by other processes and bulk
+    imports.
+    """
+    
+    def __init__(self, ttl=300, limit=8):
+        self.ttl = ttl
+        self.limit = limit
+        self.built_at = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._entries = {}  # (kind, id) -> Suggestion
+        self._words = []  # sorted distinct words
+        self._postings = {}  # word -> entries sorted by rank
+        self._short = {}  # short prefix -> best entries
+        self._sets = {}  # word -> frozenset of its entries, made on demand
+        self._popularity = {}  # product id -> units sold
+        self._replay = None  # changes committed while a rebuild is loading
+    
+    def _load(self):
+        popularity = dict(db.session.execute(
+            select(OrderItem.product_id, func.sum(OrderItem.quantity))
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(Order.status.in_(SPENT_STATUSES))
+            .group_by(OrderItem.product_id)
+        ).all())
+        entries, category_popularity = [], {}
+        for product_id, name, slug, price_cents, category_id in db.session.execute(
+            select(Product.id, Product.name, Product.slug, Product.price_cents, Product.category_id)
+            .where(Product.is_active == True)
+        ):
+            sold = popularity.get(product_id, 0)
+            category_popularity[category_id] = category_popularity.get(category_id, 0) + sold
+            entries.append(Suggestion('product', product_id, name, slug, price_cents, sold))
+        for category_id, name, slug in db.session.execute(select(Category.id, Category.name, Category.slug)):
+            entries.append(Suggestion('category', category_id, name, slug, popularity=category_popularity.get(category_id, 0)))
+        return entries, popularity
+    
+    def rebuild(self):
+        """Reload every name and popularity from the database"""
+        with self._lock:
+            self._replay = {}
+        # The first build runs inside a request; changes applied since are
+        # replayed on top, so it must not start from a lagging replica
+        with reading_primary():
+            entries, popularity = self._load()
+        postings = {}
+        for entry in entries:
+            for word in entry.tokens:
+                postings.setdefault(word, []).append(entry)
+        for word_entries in postings.values():
+            word_entries.sort(key=_rank)
+        
+        with self._lock:
+            self._entries = {entry.key: entry for entry in entries}
+            self._words = sorted(postings)
+            self._postings = postings
+            self._short = {}
+            self._sets = {}
+            self._popularity = popularity
+            self.built_at = time.monotonic()
+            replay, self._replay = self._replay, None
+            self._apply(replay or {})
+        return len(entries)
+    
+    def _rebuild_in_background(self, app):
+        try:
+            with app.app_context():
+                self.rebuild()
+        except Exception:
+            logger.exception('Rebuilding the suggestion index failed')
+        finally:
+            self._rebuilding = False
+    
+    def ensure_fresh(self):
+        """Build the index on first use; refresh it in the background once stale"""
+        if self.built_at is None:
+            with self._lock:
+                first = self.built_at is None and not self._rebuilding
+                if first:
+                    self._rebuilding = True
+            if first:
+                try:
+                    self.rebuild()
+                finally:
+                    self._rebuilding = False
+            return
+        
+        if time.monotonic() - self.built_at > self.ttl and not self._rebuilding:
+            with self._lock:
+                if self._rebuilding:
+                    return
+                self._rebuilding = True
+            app = current_app._get_current_object()
+            threading.Thread(target=self._rebuild_in_background, args=(app,),
+                             name='suggest-index', daemon=True).start()
+    
+    def _forget(self, word):
+        self._sets.pop(word, None)
+        for length in range(1, SHORT_PREFIX + 1):
+            self._short.pop(word[:length], None)
+    
+    def _add(self, entry):
+        self._entries[entry.key] = entry
+        for word in entry.tokens:
+            word_entries = self._postings.get(word)
+            if word_entries is None:
+                word_entries = self._postings[word] = []
+                insort(self._words, word)
+            insort(word_entries, entry, key=_rank)
+            self._forget(word)
+    
+    def _remove(self, entry):
+        del self._entries[entry.key]
+        for word in entry.tokens:
+            word_entries = self._postings[word]
+            del word_entries[bisect_left(word_entries, entry.rank, key=_rank)]
+            if not word_entries:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+            self._forget(word)
+    
+    def _apply(self, changes):
+        for (kind, id), fields in changes.items():
+            previous = self._entries.get((kind, id))
+            if previous is not None and fields == previous.fields():
+                continue
+            if previous is not None:
+                self._remove(previous)
+            if fields is not None:
+                if previous is not None:
+                    popularity = previous.popularity
+                else:
+                    popularity = self._popularity.get(id, 0) if kind == 'product' else 0
+                self._add(Suggestion(kind, id, *fields, popularity=popularity))
+    
+    def apply(self, changes):
+        """Apply {(kind, id): (name, slug, price_cents) or None for removed} changes"""
+        with self._lock:
+            if self._replay is not None:
+                # A rebuild may have read the rows before this commit
+                self._replay.update(changes)
+            if self.built_at is not None:
+                self._apply(changes)
+    
+    def _covered(self, prefix):
+        """The indexed words starting with prefix"""
+        start = bisect_left(self._words, prefix)
+        return self._words[start:bisect_left(self._words, prefix + _AFTER_ALL, start)]
+    
+    def _word_sets(self, words):
+        sets = []
+        for word in words:
+            entries = self._sets.get(word)
+            if entries is None:
+                entries = self._sets[word] = frozenset(self._postings[word])
+            sets.append(entries)
+        return sets
+    
+    def _ranked_matches(self, words, limit, required=(), budget=None):
+        """The best entries containing one of words, and a word from each required set.
+        
+        Returns None if budget entries were read without finding limit matches.
+        """
+        groups = [self._postings[word] for word in words]
+        found, previous = [], None
+        # Each word's entries are already ranked; merging them yields the
+        # best matches first, so only the top of each list is ever read.
+        # An entry with several of the words comes up once per word,
+        # consecutively since ranks are unique
+        for scanned, entry in enumerate(groups[0] if len(groups) == 1 else heapq.merge(*groups, key=_rank)):
+            if scanned == budget:
+                return None
+            if entry is previous:
+                continue
+            previous = entry
+            if any(entry.tokens.isdisjoint(other) for other in required):
+                continue
+            found.append(entry)
+            if len(found) == limit:
+                break
+        return found
+    
+    def _combined_matches(self, prefixes, limit):
+        """The best entries with a word starting with each of several prefixes"""
+        covered = sorted((self._covered(prefix) for prefix in prefixes), key=len)
+        if not covered[0]:
+            return []
+        
+        # Words that often go together, like 'blue head', fill the list
+        # from the top of the narrowest word's ranking
+        found = self._ranked_matches(covered[0], limit, [set(words) for words in covered[1:]], SCAN_BUDGET)
+        if found is not None:
+            return found
+        
+        # Rare combinations would scan far; intersect entry sets instead
+        candidates = frozenset().union(*self._word_sets(covered[0]))
+        for words in covered[1:]:
+            candidates = frozenset().union(*[candidates & entries for entries in self._word_sets(words)])
+            if not candidates:
+                return []
+        return heapq.nsmallest(limit, candidates, key=_rank)
+    
+    def suggest(self, text, limit=None):
+        """The most popular entries whose words start with every word typed"""
+        limit = max(1, min(limit or self.limit, self.limit))
+        prefixes = list(dict.fromkeys(tokenize(text)))
+        if not prefixes:
+            return []
+        
+        with self._lock:
+            if len(prefixes) > 1:
+                return self._combined_matches(prefixes, limit)
+            prefix = prefixes[0]
+            if len(prefix) > SHORT_PREFIX:
+                return self._ranked_matches(self._covered(prefix), limit)
+            best = self._short.get(prefix)
+            if best is None:
+                best = self._short[prefix] = self._ranked_matches(self._covered(prefix), self.limit)
+            return best[:limit]
+
+def create_suggest_index(config):
+    """Build the suggestion index from the SUGGEST_* settings"""
+    return SuggestIndex(
+        ttl=config.get('SUGGEST_INDEX_TTL', 300),
+        limit=config.get('SUGGEST_LIMIT', 8)
+    )
+
+def get_suggest_index():
+    """Return the suggestion index bound to the current app, built if needed"""
+    index = current_app.extensions['suggest_index']
+    index.ensure_fresh()
+    return index
+
+@event.listens_for(Session, 'after_flush')
+def _track_name_changes(session, flush_context):
+    # Capture the new values now: no SQL may run once the transaction commits
+    changes = {}
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Product):
+            visible = obj not in session.deleted and obj.is_active is not False
+            changes[('product', obj.id)] = (obj.name, obj.slug, obj.price_cents) if visible else None
+        elif isinstance(obj, Category):
+            changes[('category', obj.id)] = (obj.name, obj.slug, None) if obj not in session.deleted else None
+    if changes:
+        session.info.setdefault('suggest_changes', {}).update(changes)
+
+@event.listens_for(Session, 'after_commit')
+def _update_suggestions(session):
+    changes = session.info.pop('suggest_changes', None)
+    if changes and has_app_context():
+        index = current_app.extensions.get('suggest_index')
+        if index is not None:
+            index.apply(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_name_changes(session):
+    session.info.pop('suggest_changes', None)
@@ -0,0 +1,282 @@
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import and_, or_, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Order, WebhookEvent
+from app.services.cart_store import get_cart_store
+from app.services.database import upsert_rows
+from app.services.inventory import commit_reservations, commit_reservations_for, reserve_late_payment
+from app.services.notifications import publish_order_status
+from app.services.order_summary import apply_order_changes
+from app.services.recommendations import queue_recommendation_refresh
+
+logger = logging.getLogger(__name__)
+
+# A claim older than this is assumed to belong to a crashed worker
+STALE_CLAIM = timedelta(minutes=5)
+MAX_ATTEMPTS = 5
+
+def record_webhook_event(provider, event_key, payload):
+    """Persist a raw webhook delivery for later processing.
+    
+    Returns False when the same (provider, event_key) was already
+    recorded, so duplicate deliveries are acknowledged without being
+    processed again.
+    """
+    values = {
+        'provider': provider,
+        'event_key': event_key,
+        'payload': payload,
+        'status': 'pending',
+        'attempts': 0,
+        'received_at': datetime.utcnow()
+    }
+    try:
+        created = upsert_rows(db.session.connection(), WebhookEvent.__table__, [values],
+                              ['provider', 'event_key']) == 1
+        db.session.commit()
+        return created
+    except IntegrityError:
+        # A concurrent delivery of the same event won the race
+        db.session.rollback()
+        return False
+
+def _claimable(now):
+    return or_(
+        WebhookEvent.status == 'pending',
+        and_(WebhookEvent.status == 'processing', WebhookEvent.claimed_at < now - STALE_CLAIM)
+    )
+
+def _claim(batch_size):
+    """Atomically take up to batch_size events for this worker"""
+    now = datetime.utcnow()
+    token = uuid4().hex
+    ids = db.session.execute(
+        db.select(WebhookEvent.id).where(_claimable(now)).order_by(WebhookEvent.id).limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return []
+    
+    # The status guard makes the claim safe against other workers racing
+    # for the same rows: whoever updates first owns them
+    db.session.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.id.in_(ids), _claimable(now))
+        .values(status='processing', claim_token=token, claimed_at=now,
+                attempts=WebhookEvent.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return WebhookEvent.query.filter_by(claim_token=token).all()
+
+def _parse(event):
+    """Reduce a raw event to (lookup, key, status, payment_id), or None to ignore it"""
+    data = json.loads(event.payload)
+    
+    if event.provider == 'mpesa':
+        callback = data['Body']['stkCallback']
+        receipt = None
+        for item in callback.get('CallbackMetadata', {}).get('Item', []):
+            if item.get('Name') == 'MpesaReceiptNumber':
+                receipt = item.get('Value')
+                break
+        if callback['ResultCode'] != 0:
+            return 'payment_id', callback['CheckoutRequestID'], 'failed', None
+        return 'payment_id', callback['CheckoutRequestID'], 'paid', receipt
+    
+    if event.provider == 'stripe':
+        if data['type'] != 'checkout.session.completed':
+            return None
+        session = data['data']['object']
+        order_id = (session.get('metadata') or {}).get('order_id')
+        if not order_id:
+            return None
+        return 'id', int(order_id), 'paid', session.get('payment_intent')
+    
+    return None
+
+def process_webhook_batch(batch_size=100):
+    """Claim and apply one batch of webhook events; returns the number claimed.
+    
+    All orders referenced by the batch are resolved with one query and
+    updated with one bulk UPDATE. Only pending (or, for a successful retry,
+    failed) orders change state, so late or replayed events cannot undo a
+    settled payment. Payments for orders the sweeper has cancelled are
+    settled one at a time afterwards, see _settle_late_payment().
+    """
+    events = _claim(batch_size)
+    if not events:
+        return 0
+    
+    now = datetime.utcnow()
+    outcomes = {}
+    
+    def settle(event, status, error=None):
+        outcomes[event.id] = {'id': event.id, 'status': status, 'error': error, 'processed_at': now}
+    
+    intents = []
+    for event in events:
+        try:
+            intent = _parse(event)
+        except (ValueError, KeyError, TypeError) as e:
+            settle(event, 'failed', f'Malformed payload: {e}')
+            continue
+        if intent is None:
+            settle(event, 'ignored')
+        else:
+            intents.append((event, intent))
+    
+    payment_ids = [key for _, (lookup, key, _, _) in intents if lookup == 'payment_id']
+    order_ids = [key for _, (lookup, key, _, _) in intents if lookup == 'id']
+    orders = Order.query.filter(or_(
+        Order.payment_id.in_(payment_ids), Order.id.in_(order_ids)
+    )).all() if intents else []
+    by_payment_id = {o.payment_id: o for o in orders if o.payment_id}
+    by_id = {o.id: o for o in orders}
+    
+    updates = {}
+    late = {}
+    changes = []
+    paid_users = []
+    for event, (lookup, key, status, payment_id) in intents:
+        order = by_payment_id.get(key) if lookup == 'payment_id' else by_id.get(key)
+        # A failed STK push can be retried from the checkout page, so a later
+        # success may still settle a failed order; nothing else moves back
+        settleable = ('pending', 'failed') if status == 'paid' else ('pending',)
+        if (order is not None and status == 'paid' and order.status == 'cancelled'
+                and order.id not in late):
+            late[order.id] = (event.id, payment_id or order.payment_id)
+            continue
+        if order is None or order.status not in settleable or order.id in updates:
+            settle(event, 'ignored')
+            continue
+        updates[order.id] = {
+            'id': order.id,
+            'status': status,
+            'payment_id': payment_id or order.payment_id
+        }
+        changes.append((order.user_id, order.status, status, order.total_cents, order.created_at))
+        if status == 'paid':
+            paid_users.append(order.user_id)
+        settle(event, 'processed')
+    
+    try:
+        if updates:
+            db.session.execute(update(Order), list(updates.values()))
+            # The bulk UPDATE bypasses the unit of work, so report it ourselves
+            apply_order_changes(changes)
+            # Failed attempts keep their stock held for a retry; the sweeper
+            # releases it if the order is never paid
+            paid = [oid for oid, u in updates.items() if u['status'] == 'paid']
+            commit_reservations_for(paid)
+            queue_recommendation_refresh(paid)
+        db.session.execute(update(WebhookEvent), list(outcomes.values()))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _requeue([e.id for e in events])
+        raise
+    
+    store = get_cart_store()
+    for user_id in set(paid_users):
+        store.clear(f'user:{user_id}')
+    
+    for order_id, change in updates.items():
+        publish_order_status(order_id, change['status'])
+    
+    late = list(late.items())
+    for i, (order_id, (event_id, payment_id)) in enumerate(late):
+        try:
+            _settle_late_payment(event_id, order_id, payment_id, now)
+        except Exception:
+            db.session.rollback()
+            _requeue([event_id for _, (event_id, _) in late[i:]])
+            raise
+    
+    return len(events)
+
+def _settle_late_payment(event_id, order_id, payment_id, now):
+    """Settle a payment that arrived after the sweeper cancelled its order.
+    
+    As on the Stripe return page, the order's stock is reserved again and
+    the order is paid. If some of it has sold out the order stays cancelled
+    with the payment recorded, and the event keeps a note for the refund.
+    """
+    # Lock the order against the sweeper and the return page while deciding
+    order = db.session.get(Order, order_id, with_for_update=True, populate_existing=True)
+    outcome = {'id': event_id, 'status': 'processed', 'error': None, 'processed_at': now}
+    if order.status != 'cancelled':
+        # Settled by another path since the batch looked
+        outcome['status'] = 'ignored'
+    elif reserve_late_payment(order, payment_id):
+        order.status = 'paid'
+        order.payment_id = payment_id
+        commit_reservations(order)
+        queue_recommendation_refresh([order.id])
+    else:
+        outcome['error'] = 'Paid after its stock sold out; the order needs a refund'
+    db.session.execute(update(WebhookEvent), [outcome])
+    db.session.commit()
+    
+    if order.status == 'paid':
+        get_cart_store().clear(f'user:{order.user_id}')
+        publish_order_status(order.id, order.status)
+
+def _requeue(event_ids):
+    """Hand a failed batch back to the queue, parking events that keep failing"""
+    db.session.execute(
+        update(WebhookEvent)
+        .where(WebhookEvent.id.in_(event_ids))
+        .values(status=db.case((WebhookEvent.attempts >= MAX_ATTEMPTS, 'failed'), else_='pending'),
+                claim_token=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+def drain_webhook_events(batch_size=100):
+    """Process batches until the queue is empty; returns events handled"""
+    handled = 0
+    while True:
+        claimed = process_webhook_batch(batch_size)
+        if not claimed:
+            return handled
+        handled += claimed
+
+class WebhookWorkerPool:
+    """Background threads that drain the webhook queue for an app"""
+    
+    def __init__(self, app, threads=1, batch_size=100, poll_interval=1.0):
+        self.app = app
+        self.threads = threads
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._workers = []
+    
+    def _run(self):
+        while not self._stop.is_set():
+            claimed = 0
+            with self.app.app_context():
+                try:
+                    claimed = process_webhook_batch(self.batch_size)
+                except Exception:
+                    logger.exception('Webhook batch failed')
+            if not claimed:
+                self._stop.wait(self.poll_interval)
+    
+    def start(self):
+        for i in range(self.threads):
+            worker = threading.Thread(target=self._run, name=f'webhook-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+    
+    def stop(self, timeout=None):
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
@@ -0,0 +1,2 @@
+# Benchmark suite: synthetic data, load scenarios and latency reports.
+# Run `python -m benchmarks --help` from the project root.
@@ -0,0 +1,97 @@
+import argparse
+import sys
+from benchmarks import report
+from benchmarks.datagen import SIZES, generate
+from benchmarks.harness import create_bench_app
+from benchmarks.scenarios import SCENARIOS, run_scenario
+
+def _generate(args):
+    products, users = SIZES[args.size]
+    args.products = args.products or products
+    args.users = args.users or users
+    app = create_bench_app(args.database_url)
+    with app.app_context():
+        generate(products=args.products, categories=args.categories, users=args.users,
+                 orders_per_user=args.orders_per_user, seed=args.seed, chunk_size=args.chunk_size)
+    print('Benchmark data ready')
+
+def _setting(value):
+    key, sep, raw = value.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError(f'expected KEY=VALUE, got {value!r}')
+    for parse in (int, float):
+        try:
+            return key, parse(raw)
+        except ValueError:
+            pass
+    return key, raw
+
+def _run(args):
+    settings = dict(args.settings)
+    app = create_bench_app(args.database_url, settings)
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenario(s): {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+    
+    results = {}
+    for name in names:
+        if args.warmup:
+            run_scenario(app, name, args.warmup, args.concurrency, args.mode, args.seed + 1)
+        samples, wall, extra = run_scenario(app, name, args.iterations, args.concurrency, args.mode, args.seed)
+        results[name] = report.summarize(samples, wall, extra)
+    
+    print(report.format_report(results))
+    
+    if args.json:
+        report.save(args.json, results, {
+            'mode': args.mode, 'iterations': args.iterations, 'concurrency': args.concurrency,
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1],
+            'settings': settings
+        })
+    
+    if args.baseline:
+        baseline = report.load(args.baseline)
+        lines = report.compare(results, baseline, args.threshold)
+        print('\nAgainst baseline:')
+        if baseline.get('meta', {}).get('mode') != args.mode:
+            print(f"(baseline ran in {baseline.get('meta', {}).get('mode')} mode; latencies are not comparable)")
+        print('\n'.join(lines) or 'No matching scenarios')
+        if args.fail_on_regression and any(line.endswith('REGRESSION') for line in lines):
+            sys.exit(1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Load-test the shop.')
+    parser.add_argument('--database-url', help='Defaults to BENCH_DATABASE_URL or sqlite:///bench.db')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    gen = commands.add_parser('generate', help='Replace the benchmark database with synthetic data')
+    gen.add_argument('--size', choices=SIZES, default='10k', help='Catalog and user count preset')
+    gen.add_argument('--products', type=int, help='Overrides the --size preset')
+    gen.add_argument('--categories', type=int, default=20)
+    gen.add_argument('--users', type=int, help='Overrides the --size preset')
+    gen.add_argument('--orders-per-user', type=int, default=5, help='Average; actual counts vary 0-2x')
+    gen.add_argument('--seed', type=int, default=1)
+    gen.add_argument('--chunk-size', type=int, default=5000)
+    gen.set_defaults(handler=_generate)
+    
+    run = commands.add_parser('run', help='Run scenarios and report latency percentiles')
+    run.add_argument('--scenarios', help=f"Comma-separated; default all of: {', '.join(SCENARIOS)}")
+    run.add_argument('--iterations', type=int, default=200, help='Scenario steps per scenario')
+    run.add_argument('--warmup', type=int, default=20, help='Untimed steps before each scenario')
+    run.add_argument('--concurrency', type=int, default=4)
+    run.add_argument('--mode', choices=('client', 'wsgi'), default='client')
+    run.add_argument('--seed', type=int, default=1)
+    run.add_argument('--set', dest='settings', type=_setting, action='append', default=[], metavar='KEY=VALUE',
+                     help='Override an app setting, e.g. --set SQLITE_JOURNAL_MODE=delete (repeatable)')
+    run.add_argument('--json', help='Write results to this file')
+    run.add_argument('--baseline', help='Compare against a previous --json result')
+    run.add_argument('--threshold', type=float, default=10.0, help='Percent change flagged as a regression')
+    run.add_argument('--fail-on-regression', action='store_true')
+    run.set_defaults(handler=_run)
+    
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from sqlalchemy import insert, text
+from app import db
+from app.models import Category, Product, User, Order, OrderItem
+from app.services.order_summary import rebuild_order_summaries
+from app.services.passwords import get_password_hasher
+from app.services.recommendations import rebuild_recommendations
+from app.services.search import init_search_index, reindex_products
+
+PASSWORD = 'bench'
+ADJECTIVES = ['blue', 'red', 'compact', 'wireless', 'organic', 'classic', 'smart', 'vintage',
+              'portable', 'premium', 'ergonomic', 'waterproof', 'bamboo', 'leather', 'steel', 'cotton']
+NOUNS = ['headphones', 'backpack', 'lamp', 'kettle', 'sneakers', 'watch', 'notebook', 'blender',
+         'jacket', 'speaker', 'mug', 'yoga mat', 'keyboard', 'chair', 'bottle', 'camera']
+# Rough production mix of order states
+STATUS_WEIGHTS = {'delivered': 45, 'paid': 20, 'shipped': 15, 'cancelled': 10, 'pending': 7, 'failed': 3}
+
+# --size presets: (products, users)
+SIZES = {'10k': (10000, 500), '100k': (100000, 2000), '1m': (1000000, 5000)}
+
+def user_email(n):
+    return f'user{n}@bench.test'
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _bulk_insert(model, rows, chunk_size, label, echo):
+    started = time.perf_counter()
+    count = 0
+    for chunk in _chunks(rows, chunk_size):
+        db.session.execute(insert(model), chunk)
+        db.session.commit()
+        count += len(chunk)
+    elapsed = time.perf_counter() - started
+    echo(f'  {label}: {count} in {elapsed:.1f}s')
+    return count
+
+def generate(products=1000, categories=20, users=100, orders_per_user=5, seed=1,
+             chunk_size=5000, echo=print):
+    """Replace the database contents with a synthetic catalog and order history.
+    
+    Runs inside an app context. Rows are written with chunked Core inserts,
+    so a million-product catalog takes memory proportional to chunk_size.
+    Ids are assigned explicitly from 1, which the scenarios rely on. Every
+    user's password is PASSWORD.
+    """
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    
+    echo('Resetting schema...')
+    db.drop_all()
+    db.create_all()
+    
+    _bulk_insert(Category, (
+        {'id': i, 'name': f'Category {i}', 'slug': f'cat-{i}'} for i in range(1, categories + 1)
+    ), chunk_size, 'categories', echo)
+    
+    prices = {}
+    
+    def product_rows():
+        for i in range(1, products + 1):
+            price = rng.randint(199, 49999)
+            prices[i] = price
+            name = f'{rng.choice(ADJECTIVES).title()} {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}'
+            yield {
+                'id': i,
+                'name': name,
+                'slug': f'bench-{i}',
+                'description': f'A {name.lower()} made for everyday use. ' * 3,
+                'price_cents': price,
+                # Enough stock that checkout runs never sell out
+                'stock': 10 ** 9,
+                'category_id': rng.randint(1, categories),
+                'created_at': now - timedelta(minutes=rng.randint(0, 525600)),
+                'is_active': rng.random() > 0.02
+            }
+    
+    _bulk_insert(Product, product_rows(), chunk_size, 'products', echo)
+    
+    # Hashing is deliberately slow; one hash serves every synthetic user
+    password_hash = get_password_hasher().hash(PASSWORD)
+    _bulk_insert(User, (
+        {'id': n, 'username': f'user{n}', 'email': user_email(n), 'password_hash': password_hash,
+         'created_at': now} for n in range(1, users + 1)
+    ), chunk_size, 'users', echo)
+    
+    items = []
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    
+    def order_rows():
+        order_id = 0
+        for user_id in range(1, users + 1):
+            for _ in range(rng.randint(0, orders_per_user * 2)):
+                order_id += 1
+                total = 0
+                for product_id in rng.sample(range(1, products + 1), min(rng.randint(1, 4), products)):
+                    quantity = rng.randint(1, 3)
+                    total += prices[product_id] * quantity
+                    items.append({'order_id': order_id, 'product_id': product_id,
+                                  'quantity': quantity, 'price_cents': prices[product_id]})
+                yield {
+                    'id': order_id,
+                    'user_id': user_id,
+                    'total_cents': total,
+                    'status': rng.choices(statuses, weights)[0],
+                    'payment_method': rng.choice(('stripe', 'mpesa')),
+                    'created_at': now - timedelta(minutes=rng.randint(0, 525600))
+                }
+    
+    def drain_items():
+        # Orders are generated lazily; hand over their items chunk by chunk
+        for chunk in _chunks(order_rows(), chunk_size):
+            db.session.execute(insert(Order), chunk)
+            yield from items
+            items.clear()
+    
+    _bulk_insert(OrderItem, drain_items(), chunk_size, 'order items', echo)
+    
+    echo('Building order summaries, recommendations and search index...')
+    rebuild_order_summaries()
+    rebuild_recommendations()
+    db.session.commit()
+    init_search_index(db.engine)
+    reindex_products()
+    db.session.commit()
+    
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            connection.execute(text('ANALYZE'))
@@ -0,0 +1,29 @@
+import os
+from flask import g
+from config import Config
+from app import create_app
+
+class BenchConfig(Config):
+    # A separate database so benchmark data never mixes with development data
+    SQLALCHEMY_DATABASE_URI = os.environ.get('BENCH_DATABASE_URL', 'sqlite:///bench.db')
+    # The webhook-flood scenario drains the queue itself and times it
+    WEBHOOK_WORKER_THREADS = 0
+    # Turns on per-request statement counting without ever tripping it
+    QUERY_BUDGET = 10 ** 9
+
+def create_bench_app(database_url=None, settings=None):
+    """Build the app against the benchmark database, reporting queries per request.
+    
+    settings overrides config values, e.g. {'SQLITE_JOURNAL_MODE': 'delete'}.
+    """
+    overrides = dict(settings or {})
+    if database_url:
+        overrides['SQLALCHEMY_DATABASE_URI'] = database_url
+    app = create_app(type('BenchConfig', (BenchConfig,), overrides))
+    
+    @app.after_request
+    def expose_query_count(response):
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        return response
+    
+    return app
@@ -0,0 +1,81 @@
+import json
+import math
+import platform
+from datetime import datetime
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+def _stats(samples, wall):
+    latencies = sorted(s.seconds for s in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if s.status >= 500),
+        'throughput': len(samples) / wall if wall else 0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'queries_per_request': sum(s.queries for s in samples) / len(samples) if samples else 0
+    }
+
+def summarize(samples, wall, extra=None):
+    """Overall and per-endpoint statistics for one scenario run"""
+    endpoints = {}
+    for sample in samples:
+        endpoints.setdefault(sample.label, []).append(sample)
+    return {
+        **_stats(samples, wall),
+        **(extra or {}),
+        'wall_s': wall,
+        'endpoints': {label: _stats(group, wall) for label, group in sorted(endpoints.items())}
+    }
+
+def format_report(results):
+    """Render summaries as a plain-text table"""
+    header = f"{'scenario / endpoint':<32}{'reqs':>7}{'err':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'q/req':>7}"
+    lines = [header, '-' * len(header)]
+    
+    def row(name, s):
+        return (f"{name:<32}{s['requests']:>7}{s['errors']:>5}{s['throughput']:>9.1f}"
+                f"{s['p50_ms']:>9.2f}{s['p95_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['queries_per_request']:>7.1f}")
+    
+    for name, summary in results.items():
+        lines.append(row(name, summary))
+        for label, stats in summary['endpoints'].items():
+            lines.append(row(f'  {label}', stats))
+        if 'drain_events_per_s' in summary:
+            lines.append(f"  drained {summary['drained_events']} webhook events at "
+                         f"{summary['drain_events_per_s']:.0f} events/s")
+    return '\n'.join(lines)
+
+def compare(results, baseline, threshold=10.0):
+    """Lines describing p95 and queries-per-request changes against a baseline.
+    
+    Changes above threshold percent are flagged as regressions.
+    """
+    lines = []
+    for name, summary in results.items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        for metric in ('p95_ms', 'queries_per_request'):
+            old, new = before[metric], summary[metric]
+            change = (new - old) / old * 100 if old else 0.0
+            flag = '  REGRESSION' if change > threshold else ''
+            lines.append(f'{name:<16}{metric:<22}{old:>10.2f} -> {new:>10.2f} ({change:+.1f}%){flag}')
+    return lines
+
+def save(path, results, meta):
+    with open(path, 'w') as f:
+        json.dump({
+            'meta': {**meta, 'python': platform.python_version(), 'created_at': datetime.utcnow().isoformat()},
+            'scenarios': results
+        }, f, indent=2)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
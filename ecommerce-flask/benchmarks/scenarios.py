@@ -0,0 +1,323 @@
+import itertools
+import random
+import threading
+import time
+import uuid
+from sqlalchemy import func, insert
+from app import db
+from app.models import Category, Product, User, Order, StockReservation
+from app.blueprints.products import PER_PAGE
+from app.services.search import like_search, search_products
+from app.services.webhooks import drain_webhook_events
+from benchmarks.datagen import ADJECTIVES, NOUNS, PASSWORD, user_email
+
+# Units on sale in the last-units scenario; every other attempt must fail
+LAST_UNITS = 5
+
+class Sample:
+    """One timed request"""
+    __slots__ = ('label', 'seconds', 'status', 'queries')
+    
+    def __init__(self, label, seconds, status, queries):
+        self.label = label
+        self.seconds = seconds
+        self.status = status
+        self.queries = queries
+
+class TestClientDriver:
+    """Issues requests in-process through Flask's test client"""
+    
+    def __init__(self, app):
+        self.client = app.test_client()
+    
+    def request(self, method, url, data=None, json=None, params=None):
+        response = self.client.open(url, method=method, data=data, json=json, query_string=params)
+        return response.status_code, response.headers
+    
+    def close(self):
+        pass
+
+class HttpDriver:
+    """Issues requests over HTTP to a running server"""
+    
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url
+        self.session = requests.Session()
+    
+    def request(self, method, url, data=None, json=None, params=None):
+        response = self.session.request(method, self.base_url + url, data=data, json=json,
+                                        params=params, allow_redirects=False)
+        return response.status_code, response.headers
+    
+    def close(self):
+        self.session.close()
+
+class Recorder:
+    """Times every request a scenario makes through a driver"""
+    
+    def __init__(self, driver, samples):
+        self.driver = driver
+        self.samples = samples
+    
+    def call(self, label, method, url, **kwargs):
+        started = time.perf_counter()
+        status, headers = self.driver.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        self.samples.append(Sample(label, elapsed, status, int(headers.get('X-Query-Count', 0))))
+        return status
+    
+    def get(self, label, url, **kwargs):
+        return self.call(label, 'GET', url, **kwargs)
+    
+    def post(self, label, url, **kwargs):
+        return self.call(label, 'POST', url, **kwargs)
+    
+    def time(self, label, fn, queries=1):
+        """Time an in-process call that runs `queries` SQL statements"""
+        started = time.perf_counter()
+        fn()
+        self.samples.append(Sample(label, time.perf_counter() - started, 200, queries))
+
+class Context:
+    """Sizes of the generated data set, read once before a run"""
+    
+    def __init__(self, app):
+        self.app = app
+        with app.app_context():
+            self.products = db.session.query(func.max(Product.id)).scalar() or 0
+            self.categories = db.session.query(func.max(Category.id)).scalar() or 0
+            self.users = db.session.query(func.max(User.id)).scalar() or 0
+        self.terms = ADJECTIVES + [noun.split()[0] for noun in NOUNS]
+        self.webhook_keys = []
+        self._next_key = itertools.count()
+        self.last_units = None  # (product id, starting stock)
+    
+    def product(self, rng):
+        return rng.randint(1, self.products)
+    
+    def next_webhook_key(self):
+        return self.webhook_keys[next(self._next_key) % len(self.webhook_keys)]
+
+def browse(client, rng, ctx):
+    client.get('home', '/')
+    params = {'sort': rng.choice(('newest', 'price_low', 'price_high'))}
+    if rng.random() < 0.5:
+        params['category'] = f'cat-{rng.randint(1, ctx.categories)}'
+    client.get('product_list', '/products/', params=params)
+    client.get('product_detail', f'/products/bench-{ctx.product(rng)}')
+
+def search(client, rng, ctx):
+    terms = ' '.join(rng.sample(ctx.terms, rng.randint(1, 2)))
+    client.get('search', '/products/', params={'search': terms})
+
+def _search_page(ctx, terms, fulltext):
+    with ctx.app.app_context():
+        query = Product.query.filter_by(is_active=True)
+        if fulltext:
+            query, rank = search_products(query, terms)
+            order = (rank, Product.id) if rank is not None else (Product.created_at.desc(), Product.id.desc())
+        else:
+            query = like_search(query, terms)
+            order = (Product.created_at.desc(), Product.id.desc())
+        return query.order_by(*order).limit(PER_PAGE).all(), query.order_by(None).count()
+
+def search_compare(client, rng, ctx):
+    """One search's first page and match count, through the full-text index and through LIKE.
+    
+    Runs the queries in-process, so both paths see the same terms and
+    request overhead does not blur the difference.
+    """
+    terms = ' '.join(rng.sample(ctx.terms, rng.randint(1, 2)))
+    client.time('fulltext', lambda: _search_page(ctx, terms, True), queries=2)
+    client.time('like', lambda: _search_page(ctx, terms, False), queries=2)
+
+def typeahead(client, rng, ctx):
+    """A shopper typing a search term, one suggestion request per keystroke"""
+    term = ' '.join(rng.sample(ctx.terms, rng.randint(1, 2)))
+    for length in range(1, len(term) + 1):
+        client.get('suggest', '/products/suggest', params={'q': term[:length]})
+
+def cart(client, rng, ctx):
+    product_id = ctx.product(rng)
+    client.post('cart_add', f'/cart/add/{product_id}', data={'quantity': 1})
+    client.post('cart_update', f'/cart/update/{product_id}', data={'quantity': rng.randint(1, 5)})
+    client.get('cart_view', '/cart/')
+
+def checkout(client, rng, ctx):
+    for _ in range(rng.randint(1, 3)):
+        client.post('cart_add', f'/cart/add/{ctx.product(rng)}', data={'quantity': 1})
+    client.get('checkout_form', '/cart/checkout')
+    client.post('checkout_submit', '/payments/process', data={
+        'payment_method': 'mpesa', 'phone': '254700000000', 'shipping_address': 'Bench Street 1'
+    })
+
+def account(client, rng, ctx):
+    """A signed-in shopper's page views; base.html fetches the cart count on each"""
+    client.get('home', '/')
+    client.get('cart_count', '/cart/count')
+    client.get('product_detail', f'/products/bench-{ctx.product(rng)}')
+    client.get('cart_count', '/cart/count')
+    client.get('profile', '/auth/profile')
+
+def login_storm(client, rng, ctx):
+    """Sign-ins competing with anonymous browsing on the same workers"""
+    if rng.random() < 0.3:
+        user = rng.randint(1, ctx.users)
+        client.post('login', '/auth/login', data={'email': user_email(user), 'password': PASSWORD})
+        client.get('logout', '/auth/logout')
+    else:
+        client.get('product_detail', f'/products/bench-{ctx.product(rng)}')
+        client.get('cart_count', '/cart/count')
+
+def mixed(client, rng, ctx):
+    """Shoppers browsing while others check out: concurrent reads against writes"""
+    if rng.random() < 0.2:
+        checkout(client, rng, ctx)
+    else:
+        browse(client, rng, ctx)
+
+def last_units(client, rng, ctx):
+    """Every thread trying to buy one of the last few units of the same product"""
+    product_id, _ = ctx.last_units
+    client.post('cart_clear', '/cart/clear')
+    client.post('cart_add', f'/cart/add/{product_id}', data={'quantity': 1})
+    client.post('checkout_submit', '/payments/process', data={
+        'payment_method': 'mpesa', 'phone': '254700000000', 'shipping_address': 'Bench Street 1'
+    })
+
+def _setup_last_units(app, ctx, iterations):
+    """Add a product with fewer units than the run will try to buy"""
+    run = uuid.uuid4().hex[:8]
+    stock = min(LAST_UNITS, iterations)
+    with app.app_context():
+        product = Product(name=f'Last Units {run}', slug=f'bench-last-{run}', price_cents=1000,
+                          stock=stock, category_id=1)
+        db.session.add(product)
+        db.session.commit()
+        ctx.last_units = (product.id, stock)
+
+def _check_last_units(app, ctx):
+    """Fail the run if the product was oversold or a unit was lost"""
+    product_id, stock = ctx.last_units
+    with app.app_context():
+        left = db.session.get(Product, product_id).stock
+        # Every order buys one unit, so one reservation per unit sold
+        reserved = db.session.query(func.count(StockReservation.id)).filter(
+            StockReservation.product_id == product_id,
+            StockReservation.status.in_(('held', 'committed'))
+        ).scalar()
+    if left < 0 or reserved != stock:
+        raise AssertionError(f'last-units: started with {stock}, made {reserved} reservations, {left} left in stock')
+    return {'units': stock, 'reservations': reserved}
+
+def webhook_flood(client, rng, ctx):
+    key = ctx.next_webhook_key()
+    client.post('mpesa_callback', '/payments/mpesa/callback', json={'Body': {'stkCallback': {
+        'ResultCode': 0 if rng.random() < 0.9 else 1,
+        'CheckoutRequestID': key,
+        'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': f'R{key[-10:]}'}]}
+    }}})
+
+def _setup_webhook_flood(app, ctx, iterations):
+    """Create one pending order per callback the run will send"""
+    run = uuid.uuid4().hex[:8]
+    ctx.webhook_keys = [f'bench-ws-{run}-{i}' for i in range(iterations)]
+    with app.app_context():
+        db.session.execute(insert(Order), [{
+            'user_id': (i % ctx.users) + 1, 'total_cents': 1000, 'status': 'pending',
+            'payment_method': 'mpesa', 'payment_id': key
+        } for i, key in enumerate(ctx.webhook_keys)])
+        db.session.commit()
+
+def _drain_webhooks(app, ctx):
+    """Apply the queued callbacks and report how fast the workers get through them"""
+    with app.app_context():
+        started = time.perf_counter()
+        handled = drain_webhook_events()
+        elapsed = time.perf_counter() - started
+    return {'drained_events': handled, 'drain_events_per_s': handled / elapsed if elapsed else 0}
+
+class Scenario:
+    def __init__(self, step, login=False, setup=None, teardown=None):
+        self.step = step
+        self.login = login
+        self.setup = setup
+        self.teardown = teardown
+
+SCENARIOS = {
+    'browse': Scenario(browse),
+    'search': Scenario(search),
+    'search-compare': Scenario(search_compare),
+    'typeahead': Scenario(typeahead),
+    'cart': Scenario(cart),
+    'checkout': Scenario(checkout, login=True),
+    'account': Scenario(account, login=True),
+    'mixed': Scenario(mixed, login=True),
+    'last-units': Scenario(last_units, login=True, setup=_setup_last_units, teardown=_check_last_units),
+    'login-storm': Scenario(login_storm),
+    'webhook-flood': Scenario(webhook_flood, setup=_setup_webhook_flood, teardown=_drain_webhooks),
+}
+
+def _start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+    
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def run_scenario(app, name, iterations=200, concurrency=4, mode='client', seed=1):
+    """Run a scenario's step `iterations` times spread over `concurrency` threads.
+    
+    mode is 'client' (Flask test client, no network) or 'wsgi' (a local
+    threaded WSGI server driven over HTTP). Returns (samples, wall seconds,
+    extra metrics).
+    """
+    scenario = SCENARIOS[name]
+    ctx = Context(app)
+    if not ctx.products or not ctx.users:
+        raise RuntimeError('No benchmark data; run `python -m benchmarks generate` first')
+    if scenario.setup:
+        scenario.setup(app, ctx, iterations)
+    
+    server, base_url = _start_server(app) if mode == 'wsgi' else (None, None)
+    samples = []
+    errors = []
+    
+    def worker(index, count):
+        rng = random.Random(seed * 1000 + index)
+        driver = HttpDriver(base_url) if server else TestClientDriver(app)
+        if scenario.login:
+            user = (index % ctx.users) + 1
+            driver.request('POST', '/auth/login', data={'email': user_email(user), 'password': PASSWORD})
+        client = Recorder(driver, [])
+        try:
+            for _ in range(count):
+                scenario.step(client, rng, ctx)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            driver.close()
+            samples.extend(client.samples)
+    
+    shares = [iterations // concurrency + (1 if i < iterations % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(i, n)) for i, n in enumerate(shares) if n]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    
+    if server:
+        server.shutdown()
+    if errors:
+        raise errors[0]
+    
+    extra = scenario.teardown(app, ctx) if scenario.teardown else {}
+    return samples, wall, extra
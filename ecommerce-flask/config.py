@@ -8,6 +8,123 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///ecommerce.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool sizing, per process. Recycle, pre-ping and the statement
+    # timeout (PostgreSQL and MySQL, 0 disables) do not apply to SQLite.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    
+    # Pragmas run on every SQLite connection; an empty value keeps SQLite's
+    # default. WAL lets readers proceed while a write commits, which matters
+    # once several workers share one database file.
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'wal')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'normal')
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    
+    # Optional read replicas (comma-separated URLs). SELECTs in GET requests
+    # are spread over those lagging at most DB_REPLICA_MAX_LAG_SECONDS; after
+    # a write the user reads from the primary for DB_STICKY_SECONDS.
+    REPLICA_DATABASE_URLS = [u for u in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if u]
+    DB_REPLICA_MAX_LAG_SECONDS = float(os.environ.get('DB_REPLICA_MAX_LAG_SECONDS', 5))
+    DB_REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('DB_REPLICA_LAG_CHECK_SECONDS', 5))
+    DB_STICKY_SECONDS = int(os.environ.get('DB_STICKY_SECONDS', 10))
+    
+    # Seconds a pending order holds its stock before the sweeper releases it
+    STOCK_RESERVATION_TTL = int(os.environ.get('STOCK_RESERVATION_TTL', 1800))
+    
+    # Cart storage: 'session' (the signed session cookie), 'redis' (shared,
+    # carts follow signed-in users across devices) or 'memory' (per-process
+    # LRU, only for a single worker: carts are lost on restart and invisible
+    # to other workers)
+    CART_STORE = os.environ.get('CART_STORE', 'session')
+    CART_REDIS_URL = os.environ.get('CART_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    CART_TTL = int(os.environ.get('CART_TTL', 60 * 60 * 24 * 30))
+    CART_MEMORY_MAX_CARTS = int(os.environ.get('CART_MEMORY_MAX_CARTS', 10000))
+    
+    # Product listings: 'keyset' (cursor) or 'offset' (numbered pages)
+    PRODUCT_PAGINATION = os.environ.get('PRODUCT_PAGINATION', 'keyset')
+    
+    # Listing filters and counts come from in-memory bitmaps of the active
+    # products, rebuilt when the catalog changes and every FACET_INDEX_TTL
+    # seconds. Price filter buckets are split at these prices, in cents
+    FACET_PRICE_BUCKETS = [int(p) for p in os.environ.get('FACET_PRICE_BUCKETS', '2500,5000,10000,25000').split(',') if p]
+    FACET_INDEX_TTL = int(os.environ.get('FACET_INDEX_TTL', 300))
+    
+    # Search-box suggestions at /products/suggest come from an in-memory
+    # index of product and category names. ORM changes apply immediately;
+    # the index is rebuilt with fresh popularity every SUGGEST_INDEX_TTL seconds
+    SUGGEST_INDEX_TTL = int(os.environ.get('SUGGEST_INDEX_TTL', 300))
+    SUGGEST_LIMIT = int(os.environ.get('SUGGEST_LIMIT', 8))
+    
+    # Catalog read cache: 'memory' (per-process), 'redis' (shared) or 'null'
+    CATALOG_CACHE = os.environ.get('CATALOG_CACHE', 'memory')
+    CATALOG_CACHE_REDIS_URL = os.environ.get('CATALOG_CACHE_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    CATALOG_CACHE_TTL = int(os.environ.get('CATALOG_CACHE_TTL', 300))
+    CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 1024))
+    
+    # Signed-in user cache behind Flask-Login: 'memory' (per process), 'redis'
+    # (shared, fronted by a per-process copy kept USER_CACHE_LOCAL_TTL
+    # seconds) or 'null' to load the user from the database on every request
+    USER_CACHE = os.environ.get('USER_CACHE', 'memory')
+    USER_CACHE_REDIS_URL = os.environ.get('USER_CACHE_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+    USER_CACHE_LOCAL_TTL = int(os.environ.get('USER_CACHE_LOCAL_TTL', 30))
+    USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+    
+    # Passwords are hashed on a pool of PASSWORD_HASH_WORKERS processes (0
+    # hashes inline). Logins beyond PASSWORD_HASH_QUEUE_DEPTH queued hashes
+    # get a 503. Hashes made with another method are upgraded on the next
+    # login; `flask passwords calibrate` suggests parameters for this machine.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_DEPTH = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    
+    # Payment webhooks are queued and applied by worker threads. Set to 0 and
+    # run `flask webhooks work` to process them outside the web workers.
+    WEBHOOK_WORKER_THREADS = int(os.environ.get('WEBHOOK_WORKER_THREADS', 1))
+    
+    # Order status notifications for waiting checkout pages: 'memory' only
+    # reaches clients on the process that applied the update, so it is only
+    # the default while webhooks are applied in-process; use 'redis' when
+    # running several processes
+    ORDER_EVENTS_BACKEND = os.environ.get('ORDER_EVENTS_BACKEND', 'memory' if WEBHOOK_WORKER_THREADS else 'redis')
+    ORDER_EVENTS_REDIS_URL = os.environ.get('ORDER_EVENTS_REDIS_URL') or os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    ORDER_STATUS_WAIT_TIMEOUT = int(os.environ.get('ORDER_STATUS_WAIT_TIMEOUT', 25))
+    
+    # Log a warning when a request runs more SQL statements than this
+    # (0 disables counting)
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 0))
+    
+    # Prometheus metrics at /metrics, kept per process. Scrapers send
+    # METRICS_TOKEN as a bearer token; without one the endpoint is only
+    # served in debug mode. Requests slower than SLOW_REQUEST_MS are logged
+    # with their slowest SQL statements (0 disables the log)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+    
+    # Sampling profiler: sample stacks for this fraction of requests (0
+    # disables), limited to PROFILE_ENDPOINTS if set. Requests whose X-Profile
+    # header carries a token from `flask profile token` are always sampled;
+    # the same token reads the results under /admin/profile
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_ENDPOINTS = [e for e in os.environ.get('PROFILE_ENDPOINTS', '').split(',') if e]
+    PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+    PROFILE_TOKEN_MAX_AGE = int(os.environ.get('PROFILE_TOKEN_MAX_AGE', 3600))
+    
+    # Related products on the product page come from the RECOMMENDATIONS_TOP_K
+    # products most often bought together with it. Run `flask recommendations
+    # refresh` from cron to fold in newly paid orders
+    RECOMMENDATIONS_TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', 10))
+    
+    # Order history page size
+    ORDERS_PER_PAGE = int(os.environ.get('ORDERS_PER_PAGE', 10))
+    
     # Stripe Configuration
     STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY')
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
@@ -20,3 +137,6 @@ class Config:
     MPESA_PASSKEY = os.environ.get('MPESA_PASSKEY')
     MPESA_CALLBACK_URL = os.environ.get('MPESA_CALLBACK_URL')
     MPESA_ENVIRONMENT = os.environ.get('MPESA_ENVIRONMENT', 'sandbox')  # sandbox or production
+    MPESA_BASE_URL = os.environ.get('MPESA_BASE_URL')  # overrides the environment's API host
+    MPESA_TIMEOUT = float(os.environ.get('MPESA_TIMEOUT', 10))
+    MPESA_RETRIES = int(os.environ.get('MPESA_RETRIES', 3))
@@ -0,0 +1,57 @@
+"""integer money columns
+
+Revision ID: 14f73566d075
+Revises: 7d2b7eb3b5d6
+Create Date: 2026-10-18 06:41:09.328815
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '14f73566d075'
+down_revision = '7d2b7eb3b5d6'
+branch_labels = None
+depends_on = None
+
+# (table, float column, integer minor-unit column)
+MONEY_COLUMNS = [
+    ('product', 'price', 'price_cents'),
+    ('order', 'total', 'total_cents'),
+    ('order_item', 'price', 'price_cents'),
+    ('order_summary', 'total_spent', 'total_spent_cents'),
+]
+
+PRICE_INDEXES = [
+    ('ix_product_active_price', ['is_active', '{}', 'id']),
+    ('ix_product_active_category_price', ['is_active', 'category_id', '{}', 'id']),
+]
+
+
+def _convert(table, old, new, new_type, expression):
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        batch_op.add_column(sa.Column(new, new_type, nullable=True))
+
+    op.execute(f'UPDATE "{table}" SET {new} = {expression.format(old)}')
+
+    with op.batch_alter_table(table, schema=None) as batch_op:
+        if table == 'product':
+            for name, _ in PRICE_INDEXES:
+                batch_op.drop_index(name)
+        batch_op.drop_column(old)
+        batch_op.alter_column(new, existing_type=new_type, nullable=False)
+        if table == 'product':
+            for name, columns in PRICE_INDEXES:
+                batch_op.create_index(name, [c.format(new) for c in columns], unique=False)
+
+
+def upgrade():
+    # Round rather than truncate so 19.99 stored as 19.989999... becomes 1999
+    for table, old, new in MONEY_COLUMNS:
+        _convert(table, old, new, sa.Integer(), 'CAST(ROUND({} * 100) AS INTEGER)')
+
+
+def downgrade():
+    for table, old, new in MONEY_COLUMNS:
+        _convert(table, new, old, sa.Float(), '{} / 100.0')
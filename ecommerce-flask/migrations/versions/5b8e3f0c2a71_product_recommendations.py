@@ -0,0 +1,39 @@
+"""product recommendations
+
+Revision ID: 5b8e3f0c2a71
+Revises: 14f73566d075
+Create Date: 2026-10-18 09:12:44.208531
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e3f0c2a71'
+down_revision = '14f73566d075'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('product_recommendation',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('recommended_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.ForeignKeyConstraint(['recommended_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('product_id', 'rank')
+    )
+    op.create_table('recommendation_queue',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('queued_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+    sa.PrimaryKeyConstraint('order_id')
+    )
+
+
+def downgrade():
+    op.drop_table('recommendation_queue')
+    op.drop_table('product_recommendation')
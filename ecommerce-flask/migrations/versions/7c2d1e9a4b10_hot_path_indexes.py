@@ -0,0 +1,60 @@
+"""hot path indexes
+
+Revision ID: 7c2d1e9a4b10
+Revises: 9e41c7b2d5a3
+Create Date: 2026-10-18 04:10:12.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d1e9a4b10'
+down_revision = '9e41c7b2d5a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Listings and related products: active products, optionally by
+    # category, ordered newest first or by price
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_active_created', ['is_active', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_product_active_price', ['is_active', 'price', 'id'], unique=False)
+        batch_op.create_index('ix_product_active_category_created', ['is_active', 'category_id', 'created_at', 'id'], unique=False)
+        batch_op.create_index('ix_product_active_category_price', ['is_active', 'category_id', 'price', 'id'], unique=False)
+
+    # Order history and payment callback lookups
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_user_created', ['user_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_order_payment_id', ['payment_id'], unique=False)
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_order_item_order_id'), ['order_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_order_item_product_id'), ['product_id'], unique=False)
+
+    # Reservation sweeper: held reservations past their expiry
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stock_reservation_expires_at'))
+        batch_op.create_index('ix_stock_reservation_status_expires', ['status', 'expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_reservation_status_expires')
+        batch_op.create_index(batch_op.f('ix_stock_reservation_expires_at'), ['expires_at'], unique=False)
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_order_item_product_id'))
+        batch_op.drop_index(batch_op.f('ix_order_item_order_id'))
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_payment_id')
+        batch_op.drop_index('ix_order_user_created')
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_active_category_price')
+        batch_op.drop_index('ix_product_active_category_created')
+        batch_op.drop_index('ix_product_active_price')
+        batch_op.drop_index('ix_product_active_created')
@@ -0,0 +1,55 @@
+"""order summaries
+
+Revision ID: 7d2b7eb3b5d6
+Revises: 16ebe24f7390
+Create Date: 2026-10-18 06:02:37.514108
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2b7eb3b5d6'
+down_revision = '16ebe24f7390'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('order_summary',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('order_count', sa.Integer(), nullable=False),
+    sa.Column('total_spent', sa.Float(), nullable=False),
+    sa.Column('last_order_at', sa.DateTime(), nullable=True),
+    sa.Column('pending_count', sa.Integer(), nullable=False),
+    sa.Column('paid_count', sa.Integer(), nullable=False),
+    sa.Column('shipped_count', sa.Integer(), nullable=False),
+    sa.Column('delivered_count', sa.Integer(), nullable=False),
+    sa.Column('cancelled_count', sa.Integer(), nullable=False),
+    sa.Column('failed_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+    # Backfill from existing orders; the app keeps the table current from here on
+    op.execute('''
+        INSERT INTO order_summary (user_id, order_count, total_spent, last_order_at,
+            pending_count, paid_count, shipped_count, delivered_count, cancelled_count, failed_count)
+        SELECT user_id, COUNT(id),
+            COALESCE(SUM(CASE WHEN status IN ('paid', 'shipped', 'delivered') THEN total ELSE 0 END), 0),
+            MAX(created_at),
+            SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'paid' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'shipped' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'delivered' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END)
+        FROM "order"
+        WHERE user_id IS NOT NULL
+        GROUP BY user_id
+    ''')
+
+
+def downgrade():
+    op.drop_table('order_summary')
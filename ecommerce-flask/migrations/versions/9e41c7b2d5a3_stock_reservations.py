@@ -0,0 +1,43 @@
+"""stock reservations
+
+Revision ID: 9e41c7b2d5a3
+Revises: 3a4f49b5f881
+Create Date: 2026-10-18 04:02:17.530914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e41c7b2d5a3'
+down_revision = '3a4f49b5f881'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases made with db.create_all() after reservations were added, and
+    # then stamped at the initial schema, already have the table
+    if sa.inspect(op.get_bind()).has_table('stock_reservation'):
+        return
+
+    op.create_table('stock_reservation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('order_id', sa.Integer(), nullable=True),
+    sa.Column('product_id', sa.Integer(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stock_reservation_order_id'), ['order_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_stock_reservation_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_table('stock_reservation')
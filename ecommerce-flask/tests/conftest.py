@@ -0,0 +1,85 @@
+import os
+from contextlib import contextmanager
+import pytest
+from flask_migrate import upgrade
+from config import Config
+from app import create_app, db
+from app.models import Category, Product, User
+from app.services.query_budget import QueryCounter
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test-secret-key'
+    WEBHOOK_WORKER_THREADS = 0
+    # Hash inline with a cheap method so logins stay fast
+    PASSWORD_HASH_WORKERS = 0
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+    REPLICA_DATABASE_URLS = []
+    METRICS_ENABLED = False
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Build an app on a migrated SQLite database; keyword arguments override config"""
+    apps = []
+    
+    def factory(**settings):
+        settings.setdefault('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / f'test{len(apps)}.db'}")
+        app = create_app(type('TestConfig', (TestConfig,), settings))
+        with app.app_context():
+            upgrade(directory=MIGRATIONS)
+        apps.append(app)
+        return app
+    
+    yield factory
+    
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+def create_user(email='shopper@example.com', password='secret', username=None):
+    user = User(username=username or email.split('@')[0], email=email)
+    user.set_password(password)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def create_products(count, category=None, price_cents=1000, stock=100, name='Widget'):
+    """Add count active products named '<name> <n>' to a category, created if not given"""
+    if category is None:
+        category = Category(name=f'{name}s', slug=f'{name.lower()}s')
+        db.session.add(category)
+        db.session.flush()
+    products = [
+        Product(name=f'{name} {i}', slug=f'{name.lower()}-{i}', price_cents=price_cents,
+                stock=stock, category_id=category.id)
+        for i in range(count)
+    ]
+    db.session.add_all(products)
+    db.session.commit()
+    return products
+
+def login(client, email='shopper@example.com', password='secret'):
+    response = client.post('/auth/login', data={'email': email, 'password': password})
+    assert response.status_code == 302
+    return response
+
+@contextmanager
+def max_queries(app, limit):
+    """Fail if the block runs more than limit SQL statements"""
+    with app.app_context():
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        yield counter
+    assert counter.count <= limit, f'{counter.count} queries (budget {limit}):\n' + '\n'.join(counter.statements)
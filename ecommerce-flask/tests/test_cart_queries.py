@@ -0,0 +1,39 @@
+from app import db
+from app.services.query_budget import QueryCounter
+from tests.conftest import create_products, create_user, login
+
+CART_SIZES = (1, 5, 25)
+# Statements per request, whatever the cart size
+EXPECTED = {'view_cart': 1, 'checkout': 1, 'process_payment': 8}
+
+def _count(app, request):
+    with app.app_context():
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        response = request()
+    assert response.status_code in (200, 302)
+    return counter.count
+
+def _cart_queries(app, size):
+    client = app.test_client()
+    with app.app_context():
+        email = f'cart{size}@example.com'
+        create_user(email=email)
+        product_ids = [p.id for p in create_products(size, name=f'Size{size}')]
+    login(client, email=email)
+    for product_id in product_ids:
+        client.post(f'/cart/add/{product_id}', data={'quantity': 1})
+    # Warm the per-process caches (signed-in user, catalog) so only cart work is counted
+    client.get('/cart/')
+    
+    return {
+        'view_cart': _count(app, lambda: client.get('/cart/')),
+        'checkout': _count(app, lambda: client.get('/cart/checkout')),
+        'process_payment': _count(app, lambda: client.post('/payments/process', data={
+            'payment_method': 'mpesa', 'shipping_address': '1 Main Street'
+        })),
+    }
+
+def test_cart_query_counts_do_not_grow_with_the_cart(app):
+    for size in CART_SIZES:
+        assert _cart_queries(app, size) == EXPECTED, f'{size} line cart'
@@ -0,0 +1,87 @@
+import fakeredis
+import pytest
+from app import db
+from app.models import Order, Product
+from app.services.cart_store import MemoryCartStore, RedisCartStore, SessionCartStore
+from tests.conftest import create_products, create_user, login
+
+def test_session_store_keeps_lines_and_count(app):
+    store = SessionCartStore()
+    with app.test_request_context():
+        assert store.add('guest:a', 7, 2) == 2
+        assert store.add('guest:a', 7, 1) == 3
+        store.set('guest:a', 8, 4)
+        assert store.get('guest:a') == {'7': 3, '8': 4}
+        assert store.count('guest:a') == 7
+        
+        store.remove('guest:a', 7)
+        assert store.count('guest:a') == 4
+        store.clear('guest:a')
+        assert store.get('guest:a') == {} and store.count('guest:a') == 0
+
+def test_session_store_is_a_no_op_outside_requests(app):
+    store = SessionCartStore()
+    with app.app_context():
+        store.add('user:1', 7, 2)
+        store.clear('user:1')
+        assert store.get('user:1') == {} and store.count('user:1') == 0
+
+def test_session_cart_is_seen_by_every_worker(make_app):
+    first = make_app()
+    # A second process on the same database and secret key, e.g. another
+    # gunicorn worker or the same one after a restart
+    second = make_app(SQLALCHEMY_DATABASE_URI=first.config['SQLALCHEMY_DATABASE_URI'])
+    with first.app_context():
+        product_id = create_products(1)[0].id
+    
+    client = first.test_client()
+    client.post(f'/cart/add/{product_id}', data={'quantity': 2})
+    other = second.test_client()
+    other.set_cookie('session', client.get_cookie('session').value)
+    
+    assert other.get('/cart/count').json == {'count': 2}
+
+def test_guest_cart_is_merged_on_login(app, client):
+    with app.app_context():
+        create_user()
+        first, second = (p.id for p in create_products(2))
+    client.post(f'/cart/add/{first}', data={'quantity': 1})
+    login(client)
+    client.post(f'/cart/add/{second}', data={'quantity': 2})
+    
+    assert client.get('/cart/count').json == {'count': 3}
+
+def test_memory_store_evicts_least_recently_used_carts():
+    store = MemoryCartStore(max_carts=2)
+    store.add('a', 1, 1)
+    store.add('b', 1, 1)
+    store.get('a')
+    store.add('c', 1, 1)
+    assert store.count('a') == 1 and store.count('b') == 0 and store.count('c') == 1
+
+@pytest.mark.parametrize('make_store', [SessionCartStore, MemoryCartStore, lambda: RedisCartStore(fakeredis.FakeRedis())],
+                         ids=['session', 'memory', 'redis'])
+@pytest.mark.parametrize('quantity', [0, -1])
+def test_stores_refuse_non_positive_quantities(app, make_store, quantity):
+    store = make_store()
+    with app.test_request_context():
+        store.add('guest:a', 7, 2)
+        with pytest.raises(ValueError):
+            store.add('guest:a', 7, quantity)
+        assert store.get('guest:a') == {'7': 2} and store.count('guest:a') == 2
+
+def test_negative_lines_cannot_lower_the_order_total(app, client):
+    with app.app_context():
+        create_user()
+        first = create_products(1, price_cents=10000, stock=5, name='Kettle')[0].id
+        second = create_products(1, price_cents=9000, stock=5, name='Toaster')[0].id
+    login(client)
+    client.post(f'/cart/add/{first}', data={'quantity': 1})
+    response = client.post(f'/cart/add/{second}', data={'quantity': -1},
+                           headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert response.status_code == 400
+    client.post('/payments/process', data={'payment_method': 'mpesa', 'shipping_address': '1 Main Street'})
+    
+    with app.app_context():
+        assert [order.total_cents for order in Order.query] == [10000]
+        assert db.session.get(Product, second).stock == 5
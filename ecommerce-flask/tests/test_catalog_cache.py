@@ -0,0 +1,71 @@
+import fakeredis
+from app import db
+from app.models import Category, Product
+from app.services.cache import RedisCache
+from app.services.catalog import CatalogCache, get_catalog_cache, get_categories, get_product_by_slug
+from app.services.query_budget import QueryCounter
+from tests.conftest import create_products
+
+def _names(categories):
+    return [c.name for c in categories]
+
+def _queries(load):
+    with QueryCounter(db.engine) as counter:
+        result = load()
+    return result, counter.count
+
+def test_cached_reads_skip_the_database(app):
+    with app.app_context():
+        create_products(1)
+        assert _queries(get_categories)[1] == 1
+        categories, queries = _queries(get_categories)
+        assert (_names(categories), queries) == (['Widgets'], 0)
+        assert get_catalog_cache().stats()['categories'] == {'hits': 1, 'misses': 1}
+
+def test_committed_catalog_changes_invalidate(app):
+    with app.app_context():
+        create_products(1)
+        get_categories()
+        version = get_catalog_cache().version()
+        
+        db.session.add(Category(name='Gadgets', slug='gadgets'))
+        db.session.flush()
+        assert _names(get_categories()) == ['Widgets'], 'invalidated before the commit'
+        db.session.commit()
+        assert get_catalog_cache().version() == version + 1
+        assert _names(get_categories()) == ['Widgets', 'Gadgets']
+
+def test_rolled_back_changes_keep_the_cache(app):
+    with app.app_context():
+        create_products(1)
+        get_categories()
+        version = get_catalog_cache().version()
+        db.session.add(Category(name='Gadgets', slug='gadgets'))
+        db.session.flush()
+        db.session.rollback()
+        assert get_catalog_cache().version() == version
+        assert _queries(get_categories)[1] == 0
+
+def test_unknown_slugs_are_cached_too(app):
+    with app.app_context():
+        assert get_product_by_slug('missing') is None
+        assert _queries(lambda: get_product_by_slug('missing')) == (None, 0)
+
+def test_product_pages_show_committed_edits(app, client):
+    with app.app_context():
+        product_id = create_products(1)[0].id
+    assert b'Widget 0' in client.get('/products/widget-0').data
+    with app.app_context():
+        db.session.get(Product, product_id).name = 'Renamed Widget'
+        db.session.commit()
+    assert b'Renamed Widget' in client.get('/products/widget-0').data
+
+def test_one_bump_invalidates_every_worker_on_a_shared_backend():
+    shared = fakeredis.FakeRedis()
+    first = CatalogCache(RedisCache(shared, prefix='test:'))
+    second = CatalogCache(RedisCache(shared, prefix='test:'))
+    first.set('categories', 'all', ['Widgets'])
+    assert second.get('categories', 'all') == ['Widgets']
+    
+    second.invalidate()
+    assert first.get('categories', 'all') is None
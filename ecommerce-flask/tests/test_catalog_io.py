@@ -0,0 +1,98 @@
+import io
+import pytest
+from app import db
+from app.models import Category, Product
+from app.services.catalog import get_catalog_cache
+from app.services.catalog_io import export_catalog, import_catalog
+from app.services.search import init_search_index, search_products
+from tests.conftest import create_products
+
+def _catalog():
+    return [
+        (p.slug, p.name, p.description, p.price_cents, p.image_url, p.stock,
+         p.category.slug if p.category else None, p.is_active)
+        for p in Product.query.order_by(Product.slug)
+    ]
+
+def _seed():
+    tools = Category(name='Tools', slug='tools')
+    db.session.add(tools)
+    db.session.flush()
+    db.session.add_all([
+        Product(name='Hammer, claw', slug='hammer', description='Forged "steel"\nhead', price_cents=1999,
+                image_url='https://img.example/hammer.png', stock=7, category_id=tools.id),
+        Product(name='Nail', slug='nail', price_cents=5, stock=0, category_id=tools.id, is_active=False),
+        Product(name='Gift card', slug='gift-card', price_cents=250000, stock=3),
+    ])
+    db.session.commit()
+
+def _export(fmt, chunk_size=1000):
+    stream = io.StringIO()
+    count = export_catalog(stream, fmt, chunk_size)
+    stream.seek(0)
+    return count, stream
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_export_then_import_reproduces_the_catalog(make_app, fmt):
+    source, target = make_app(), make_app()
+    with source.app_context():
+        _seed()
+        expected = _catalog()
+        count, stream = _export(fmt, chunk_size=2)
+    assert count == 3
+    
+    with target.app_context():
+        db.session.add(Category(name='Tools', slug='tools'))
+        db.session.commit()
+        result = import_catalog(stream, fmt, chunk_size=2)
+        
+        assert (result.rows, result.upserted, result.skipped) == (3, 3, 0)
+        assert _catalog() == expected
+
+@pytest.mark.parametrize('fmt', ['csv', 'jsonl'])
+def test_importing_an_export_again_changes_nothing(app, fmt):
+    with app.app_context():
+        _seed()
+        before = _catalog()
+        created = {p.slug: p.created_at for p in Product.query}
+        _, stream = _export(fmt)
+        
+        import_catalog(stream, fmt)
+        
+        assert _catalog() == before
+        assert {p.slug: p.created_at for p in Product.query} == created
+        assert Product.query.count() == 3
+
+def test_import_updates_by_slug_and_reports_bad_rows(app):
+    with app.app_context():
+        create_products(1, name='Widget', price_cents=1000)
+        stream = io.StringIO(
+            'slug,name,price,stock,category,is_active\n'
+            'widget-0,Widget deluxe,12.50,4,,yes\n'
+            'bolt,Bolt,0.10,100,,\n'
+            ',Nameless,1.00,1,,\n'
+            'screw,Screw,abc,1,,\n'
+            'nut,Nut,0.20,1,nowhere,\n'
+            'bolt,Bolt (box),2.00,10,,no\n'
+        )
+        
+        result = import_catalog(stream, 'csv', chunk_size=10)
+        
+        assert (result.rows, result.upserted, result.skipped) == (6, 2, 3)
+        assert [line for line, _ in result.errors] == [4, 5, 6]
+        assert "unknown category 'nowhere'" in result.errors[2][1]
+        products = {p.slug: (p.name, p.price_cents, p.stock, p.is_active) for p in Product.query}
+        # The last occurrence of a slug within a chunk wins
+        assert products == {'widget-0': ('Widget deluxe', 1250, 4, True), 'bolt': ('Bolt (box)', 200, 10, False)}
+
+def test_import_refreshes_search_and_the_catalog_cache(app):
+    with app.app_context():
+        init_search_index(db.engine)
+        version = get_catalog_cache().version()
+        stream = io.StringIO('{"slug": "lamp", "name": "Reading lamp", "price_cents": 4500}\n\n')
+        
+        import_catalog(stream, 'jsonl')
+        
+        query, _ = search_products(Product.query, 'lamp')
+        assert [p.slug for p in query] == ['lamp']
+        assert get_catalog_cache().version() != version
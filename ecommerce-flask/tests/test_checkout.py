@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import stripe
+from app import db
+from app.models import Order, Product
+from app.services.inventory import sweep_expired_reservations
+from tests.conftest import create_products, create_user, login
+
+def test_checkout_returns_to_cart_when_its_products_are_gone(app, client):
+    with app.app_context():
+        create_user()
+        product_id = create_products(1)[0].id
+    login(client)
+    client.post(f'/cart/add/{product_id}', data={'quantity': 1})
+    with app.app_context():
+        db.session.delete(db.session.get(Product, product_id))
+        db.session.commit()
+    
+    response = client.post('/payments/process', data={'payment_method': 'stripe'})
+    
+    assert response.status_code == 302
+    assert response.location.endswith('/cart/')
+    with app.app_context():
+        assert Order.query.count() == 0
+
+def _place_order(app, client, quantity=2, stock=2):
+    with app.app_context():
+        create_user()
+        product_id = create_products(1, stock=stock)[0].id
+    login(client)
+    client.post(f'/cart/add/{product_id}', data={'quantity': quantity})
+    client.post('/payments/process', data={'payment_method': 'stripe', 'shipping_address': '1 Main Street'})
+    with app.app_context():
+        return Order.query.one().id, product_id
+
+def _stripe_reports_paid(monkeypatch):
+    session = SimpleNamespace(payment_status='paid', payment_intent='pi_123')
+    monkeypatch.setattr(stripe.checkout.Session, 'retrieve', lambda session_id: session)
+
+def _state(app, order_id, product_id):
+    with app.app_context():
+        order = db.session.get(Order, order_id)
+        statuses = sorted(r.status for r in order.reservations)
+        return order.status, order.payment_id, db.session.get(Product, product_id).stock, statuses
+
+def test_stripe_success_settles_a_pending_order(app, client, monkeypatch):
+    order_id, product_id = _place_order(app, client)
+    _stripe_reports_paid(monkeypatch)
+    
+    client.get(f'/payments/success/{order_id}?session_id=cs_1')
+    
+    assert _state(app, order_id, product_id) == ('paid', 'pi_123', 0, ['committed'])
+
+def test_stripe_success_reserves_again_after_a_sweep(app, client, monkeypatch):
+    order_id, product_id = _place_order(app, client)
+    with app.app_context():
+        assert sweep_expired_reservations(now=datetime.utcnow() + timedelta(days=1)) == 1
+    _stripe_reports_paid(monkeypatch)
+    
+    client.get(f'/payments/success/{order_id}?session_id=cs_1')
+    
+    assert _state(app, order_id, product_id) == ('paid', 'pi_123', 0, ['committed', 'released'])
+
+def test_stripe_success_does_not_oversell_a_swept_order(app, client, monkeypatch):
+    order_id, product_id = _place_order(app, client)
+    with app.app_context():
+        sweep_expired_reservations(now=datetime.utcnow() + timedelta(days=1))
+        # Someone else buys the released stock before the payment lands
+        db.session.get(Product, product_id).stock = 1
+        db.session.commit()
+    _stripe_reports_paid(monkeypatch)
+    
+    client.get(f'/payments/success/{order_id}?session_id=cs_1')
+    
+    assert _state(app, order_id, product_id) == ('cancelled', 'pi_123', 1, ['released'])
+
+def test_stripe_success_leaves_a_settled_order_alone(app, client, monkeypatch):
+    order_id, product_id = _place_order(app, client)
+    with app.app_context():
+        order = db.session.get(Order, order_id)
+        order.status = 'shipped'
+        db.session.commit()
+    _stripe_reports_paid(monkeypatch)
+    
+    client.get(f'/payments/success/{order_id}?session_id=cs_1')
+    
+    assert _state(app, order_id, product_id) == ('shipped', None, 0, ['held'])
@@ -0,0 +1,99 @@
+import pytest
+from sqlalchemy import text
+from app import db
+from app.models import Category, WebhookEvent
+from app.services.database import configure_database, engine_options, replica_binds, upsert_rows
+from tests.conftest import TestConfig
+
+def _config(**settings):
+    config = {k: getattr(TestConfig, k) for k in dir(TestConfig) if k.isupper()}
+    config.update(settings)
+    return config
+
+def test_sqlite_files_get_a_sized_pool_without_server_options():
+    options = engine_options('sqlite:///shop.db', _config(DB_POOL_SIZE=3, DB_MAX_OVERFLOW=2))
+    assert options == {'pool_size': 3, 'max_overflow': 2, 'pool_timeout': TestConfig.DB_POOL_TIMEOUT}
+
+def test_in_memory_sqlite_gets_no_pool_options():
+    assert engine_options('sqlite://', _config()) == {}
+    assert engine_options('sqlite:///:memory:', _config()) == {}
+
+def test_postgresql_gets_recycle_pre_ping_and_statement_timeout():
+    options = engine_options('postgresql://shop@db/shop', _config(DB_STATEMENT_TIMEOUT_MS=2000))
+    assert options['pool_recycle'] == TestConfig.DB_POOL_RECYCLE
+    assert options['pool_pre_ping'] == TestConfig.DB_POOL_PRE_PING
+    assert options['connect_args'] == {'options': '-c statement_timeout=2000'}
+
+def test_explicit_engine_options_win_and_replicas_get_binds():
+    config = _config(
+        SQLALCHEMY_DATABASE_URI='sqlite:///shop.db',
+        SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 1},
+        REPLICA_DATABASE_URLS=['postgresql://shop@replica1/shop', 'postgresql://shop@replica2/shop']
+    )
+    configure_database(config)
+    
+    assert config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size'] == 1
+    assert config['SQLALCHEMY_ENGINE_OPTIONS']['max_overflow'] == TestConfig.DB_MAX_OVERFLOW
+    assert replica_binds(config) == ['replica_1', 'replica_2']
+    assert config['SQLALCHEMY_BINDS']['replica_2']['url'] == 'postgresql://shop@replica2/shop'
+    assert config['SQLALCHEMY_BINDS']['replica_2']['pool_pre_ping'] == TestConfig.DB_POOL_PRE_PING
+
+def _pragma(name):
+    return db.session.execute(text(f'PRAGMA {name}')).scalar()
+
+def test_sqlite_connections_run_the_configured_pragmas(make_app):
+    with make_app(SQLITE_BUSY_TIMEOUT_MS=1234, SQLITE_MMAP_SIZE=4096).app_context():
+        assert _pragma('journal_mode') == 'wal'
+        assert _pragma('synchronous') == 1  # normal
+        assert _pragma('busy_timeout') == 1234
+        assert _pragma('mmap_size') == 4096
+
+def test_empty_pragma_settings_keep_sqlite_defaults(make_app):
+    with make_app(SQLITE_JOURNAL_MODE='', SQLITE_SYNCHRONOUS='').app_context():
+        assert _pragma('journal_mode') == 'delete'
+        assert _pragma('synchronous') == 2  # full
+
+# None runs the native ON CONFLICT path; any other name takes the generic fallback
+DIALECTS = [None, 'generic']
+
+def _connection(monkeypatch, dialect):
+    connection = db.session.connection()
+    if dialect:
+        monkeypatch.setattr(connection.dialect, 'name', dialect)
+    return connection
+
+def _categories():
+    return [(c.slug, c.name) for c in Category.query.order_by(Category.slug)]
+
+@pytest.mark.parametrize('dialect', DIALECTS)
+def test_upsert_rows_skips_existing_keys(app, monkeypatch, dialect):
+    with app.app_context():
+        db.session.add(Category(name='Tools', slug='tools'))
+        db.session.commit()
+        rows = [{'name': 'Hand tools', 'slug': 'tools'}, {'name': 'Toys', 'slug': 'toys'}]
+        
+        assert upsert_rows(_connection(monkeypatch, dialect), Category.__table__, rows, ['slug']) == 1
+        assert _categories() == [('tools', 'Tools'), ('toys', 'Toys')]
+
+@pytest.mark.parametrize('dialect', DIALECTS)
+def test_upsert_rows_updates_existing_keys_when_asked(app, monkeypatch, dialect):
+    with app.app_context():
+        db.session.add(Category(name='Tools', slug='tools'))
+        db.session.commit()
+        rows = [{'name': 'Hand tools', 'slug': 'tools'}, {'name': 'Toys', 'slug': 'toys'}]
+        
+        upsert_rows(_connection(monkeypatch, dialect), Category.__table__, rows, ['slug'], ['name'])
+        assert _categories() == [('tools', 'Hand tools'), ('toys', 'Toys')]
+
+@pytest.mark.parametrize('dialect', DIALECTS)
+def test_upsert_rows_matches_composite_keys(app, monkeypatch, dialect):
+    with app.app_context():
+        event = {'provider': 'mpesa', 'event_key': 'ws_CO_1', 'payload': '{}', 'status': 'pending'}
+        db.session.add(WebhookEvent(**event))
+        db.session.commit()
+        rows = [event, {**event, 'provider': 'stripe'}, {**event, 'event_key': 'ws_CO_2'}]
+        
+        written = upsert_rows(_connection(monkeypatch, dialect), WebhookEvent.__table__, rows,
+                              ['provider', 'event_key'])
+        assert written == 2
+        assert WebhookEvent.query.count() == 3
@@ -0,0 +1,120 @@
+import itertools
+import random
+import threading
+import pytest
+from app import db
+from app.models import Category, Product
+from app.services.catalog import get_catalog_cache
+from app.services.facets import get_facet_index, price_buckets
+from app.services.search import init_search_index, search_products
+
+NAMES = ['Red Shirt', 'Blue Shirt', 'Red Hat', 'Green Scarf', 'Blue Jeans', 'Wool Hat']
+
+def _catalog(count=120, seed=3):
+    rng = random.Random(seed)
+    categories = [Category(name=name, slug=name.lower()) for name in ('Tops', 'Hats', 'Sale')]
+    db.session.add_all(categories)
+    db.session.flush()
+    db.session.add_all(
+        Product(
+            name=f'{rng.choice(NAMES)} {i}', slug=f'product-{i}',
+            price_cents=rng.choice([999, 2500, 4999, 5000, 12000, 30000]),
+            stock=rng.choice([0, 3]),
+            category_id=rng.choice(categories).id,
+            is_active=rng.random() > 0.1
+        )
+        for i in range(count)
+    )
+    db.session.commit()
+    return [c.id for c in categories]
+
+def _wait_for_rebuild():
+    for thread in threading.enumerate():
+        if thread.name == 'facet-index':
+            thread.join(timeout=10)
+
+def _sql_count(category_id=None, bucket=None, in_stock=False, search=None):
+    query = Product.query.filter_by(is_active=True)
+    if category_id is not None:
+        query = query.filter(Product.category_id == category_id)
+    if bucket is not None:
+        _, low, high = bucket
+        query = query.filter(Product.price_cents >= low)
+        if high is not None:
+            query = query.filter(Product.price_cents < high)
+    if in_stock:
+        query = query.filter(Product.stock > 0)
+    if search:
+        query, _ = search_products(query, search)
+    return query.count()
+
+def test_price_buckets_split_at_the_bounds():
+    assert price_buckets([5000, 2500]) == [('0-2500', 0, 2500), ('2500-5000', 2500, 5000), ('5000-', 5000, None)]
+
+@pytest.mark.parametrize('full_text', [False, True])
+def test_counts_match_sql_for_every_filter(app, full_text):
+    with app.app_context():
+        if full_text:
+            assert init_search_index(db.engine)
+        category_ids = _catalog()
+        index = get_facet_index()
+        buckets = {key: (key, low, high) for key, low, high in index.buckets}
+        
+        for category_id, price, in_stock, search in itertools.product(
+            [None, *category_ids], [None, '2500-5000', '25000-'], [False, True], [None, 'red', 'hat']
+        ):
+            bucket = buckets.get(price)
+            counts = index.counts(category_id=category_id, price=price, in_stock=in_stock, search=search)
+            filters = (category_id, price, in_stock, search)
+            
+            assert counts['total'] == _sql_count(category_id, bucket, in_stock, search), filters
+            assert counts['in_stock'] == _sql_count(category_id, bucket, True, search), filters
+            for cid in category_ids:
+                assert counts['categories'][cid] == _sql_count(cid, bucket, in_stock, search), filters
+            for key, other in buckets.items():
+                assert counts['prices'][key] == _sql_count(category_id, other, in_stock, search), filters
+
+def test_counts_follow_catalog_changes(app):
+    with app.app_context():
+        _catalog()
+        index = get_facet_index()
+        before = index.counts()['total']
+        
+        product = Product.query.filter_by(is_active=True).first()
+        product.is_active = False
+        db.session.commit()
+        # The stale snapshot keeps serving while the new one is built
+        assert index.counts()['total'] == before
+        _wait_for_rebuild()
+        assert index.counts()['total'] == before - 1
+
+def test_a_failed_rebuild_keeps_the_previous_snapshot(app, monkeypatch):
+    with app.app_context():
+        _catalog()
+        index = get_facet_index()
+        snapshot = index.snapshot()
+        
+        def broken(version):
+            raise RuntimeError('replica went away')
+        
+        monkeypatch.setattr(index, '_build', broken)
+        get_catalog_cache().invalidate()
+        assert index.snapshot() is snapshot
+        _wait_for_rebuild()
+        
+        assert index.snapshot() is snapshot
+        _wait_for_rebuild()
+        monkeypatch.undo()
+        assert index.snapshot() is snapshot
+        _wait_for_rebuild()
+        assert index.snapshot() is not snapshot
+
+def test_listing_api_reports_facets_by_slug(app, client):
+    with app.app_context():
+        _catalog()
+        expected = {c.slug: _sql_count(c.id, in_stock=True) for c in Category.query}
+        total = _sql_count(in_stock=True)
+    
+    payload = client.get('/products/api/list?in_stock=1&include_total=1&include_facets=1').get_json()
+    assert payload['total'] == total
+    assert payload['facets']['categories'] == expected
@@ -0,0 +1,64 @@
+from app import db
+from app.models import Product
+from app.services.query_budget import QueryCounter
+from tests.conftest import create_products, create_user, login
+
+def _get(app, client, url, **kwargs):
+    with app.app_context():
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        response = client.get(url, **kwargs)
+    return response, counter.count
+
+def test_anonymous_pages_revalidate_with_a_strong_etag(app, client):
+    with app.app_context():
+        create_products(3)
+    first = client.get('/products/')
+    etag = first.headers['ETag']
+    assert not etag.startswith('W/')
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert 'Cookie' in first.headers['Vary']
+    
+    response, queries = _get(app, client, '/products/', headers={'If-None-Match': etag})
+    assert (response.status_code, response.data, queries) == (304, b'', 0)
+
+def test_query_args_are_normalized(app, client):
+    with app.app_context():
+        create_products(3)
+    first = client.get('/products/?sort=price_low&in_stock=1&search=')
+    response, queries = _get(app, client, '/products/?in_stock=1&sort=price_low')
+    assert response.headers['ETag'] == first.headers['ETag'] and queries == 0
+
+def test_catalog_commits_change_the_etag(app, client):
+    with app.app_context():
+        product_id = create_products(1)[0].id
+    etag = client.get('/products/widget-0').headers['ETag']
+    with app.app_context():
+        db.session.get(Product, product_id).name = 'Renamed Widget'
+        db.session.commit()
+    
+    response = client.get('/products/widget-0', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert b'Renamed Widget' in response.data
+
+def test_signed_in_users_and_flashes_get_fresh_pages(app, client):
+    with app.app_context():
+        create_user()
+        create_products(1)
+    client.get('/products/')
+    
+    with client.session_transaction() as session:
+        session['_flashes'] = [('success', 'Added to cart')]
+    response = client.get('/products/')
+    assert 'ETag' not in response.headers and b'Added to cart' in response.data
+    
+    login(client)
+    client.get('/')
+    response = client.get('/products/')
+    assert 'ETag' not in response.headers
+
+def test_errors_are_not_cached(app, client):
+    for _ in range(2):
+        response = client.get('/products/missing')
+        assert response.status_code == 404 and 'ETag' not in response.headers
@@ -0,0 +1,62 @@
+import pickle
+import fakeredis
+from app import db
+from app.models import User
+from app.services.cache import MemoryCache, RedisCache
+from app.services.identity import IdentityCache, UserSnapshot, get_identity_cache, load_user
+from app.services.query_budget import QueryCounter
+from tests.conftest import create_user
+
+def _queries(load):
+    with QueryCounter(db.engine) as counter:
+        result = load()
+    return result, counter.count
+
+def test_signed_in_users_are_loaded_once(app):
+    with app.app_context():
+        user_id = create_user().id
+        first, queries = _queries(lambda: load_user(str(user_id)))
+        assert (first.email, queries) == ('shopper@example.com', 1)
+        again, queries = _queries(lambda: load_user(str(user_id)))
+        assert (again.email, queries) == ('shopper@example.com', 0)
+
+def test_snapshots_leave_out_the_password_hash_and_pickle(app):
+    with app.app_context():
+        snapshot = UserSnapshot(create_user())
+    assert not hasattr(snapshot, 'password_hash')
+    copy = pickle.loads(pickle.dumps(snapshot))
+    assert (copy.get_id(), copy.email, copy.is_authenticated) == (snapshot.get_id(), snapshot.email, True)
+
+def test_committed_changes_evict_the_user(app):
+    with app.app_context():
+        user_id = create_user().id
+        load_user(user_id)
+        
+        user = db.session.get(User, user_id)
+        user.email = 'moved@example.com'
+        db.session.flush()
+        assert get_identity_cache().get(user_id) is not None, 'evicted before the commit'
+        db.session.commit()
+        assert get_identity_cache().get(user_id) is None
+        assert load_user(user_id).email == 'moved@example.com'
+
+def test_rolled_back_changes_keep_the_user(app):
+    with app.app_context():
+        user_id = create_user().id
+        load_user(user_id)
+        db.session.get(User, user_id).email = 'moved@example.com'
+        db.session.flush()
+        db.session.rollback()
+        assert get_identity_cache().get(user_id).email == 'shopper@example.com'
+
+def test_a_new_process_fills_its_local_copy_from_the_shared_tier():
+    shared = RedisCache(fakeredis.FakeRedis(), prefix='test:')
+    first = IdentityCache(MemoryCache(), shared)
+    second = IdentityCache(MemoryCache(), shared)
+    first.set(7, 'snapshot')
+    
+    assert second.get(7) == 'snapshot'
+    assert second.local.get('user:7') == 'snapshot'
+    first.invalidate([7])
+    assert shared.get('user:7') is None
+    assert second.get(7) == 'snapshot', 'other processes keep their copy until it expires'
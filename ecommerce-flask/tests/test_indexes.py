@@ -0,0 +1,56 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import select
+from app import db
+from app.models import Order, OrderItem, Product, StockReservation
+from app.services.pagination import _seek
+
+NOW = datetime(2026, 1, 1)
+NEWEST = [(Product.created_at, True), (Product.id, True)]
+CHEAPEST = [(Product.price_cents, False), (Product.id, False)]
+ORDERS_NEWEST = [(Order.created_at, True), (Order.id, True)]
+
+def _ordered(stmt, order):
+    return stmt.order_by(*[column.desc() if descending else column.asc() for column, descending in order]).limit(12)
+
+def _active(*criteria):
+    return select(Product).where(Product.is_active == True, *criteria)
+
+# (query shape, statement, index its plan must use)
+HOT_QUERIES = [
+    ('newest products', lambda: _ordered(_active(), NEWEST), 'ix_product_active_created'),
+    ('newest products, next page', lambda: _ordered(_active(_seek(NEWEST, [NOW, 10], False)), NEWEST),
+     'ix_product_active_created'),
+    ('cheapest products', lambda: _ordered(_active(), CHEAPEST), 'ix_product_active_price'),
+    ('category, newest', lambda: _ordered(_active(Product.category_id == 1), NEWEST),
+     'ix_product_active_category_created'),
+    ('category, cheapest, next page',
+     lambda: _ordered(_active(Product.category_id == 1, _seek(CHEAPEST, [500, 10], False)), CHEAPEST),
+     'ix_product_active_category_price'),
+    ('order history', lambda: _ordered(select(Order).where(Order.user_id == 1), ORDERS_NEWEST),
+     'ix_order_user_created'),
+    ('payment callback', lambda: select(Order).where(Order.payment_id == 'ws_CO_1'), 'ix_order_payment_id'),
+    ('order items', lambda: select(OrderItem).where(OrderItem.order_id.in_([1, 2, 3])), 'ix_order_item_order_id'),
+    ('sold products', lambda: select(OrderItem.order_id).where(OrderItem.product_id == 1), 'ix_order_item_product_id'),
+    ('expired reservations', lambda: select(StockReservation).where(
+        StockReservation.status == 'held', StockReservation.expires_at < NOW
+    ), 'ix_stock_reservation_status_expires'),
+]
+
+def _query_plan(stmt):
+    compiled = stmt.compile(db.engine, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+    return [row[-1] for row in rows]
+
+@pytest.mark.parametrize('shape, build, index', HOT_QUERIES, ids=[q[0] for q in HOT_QUERIES])
+def test_hot_queries_use_their_index(app, shape, build, index):
+    with app.app_context():
+        plan = _query_plan(build())
+    
+    assert any(index in step for step in plan), plan
+    # SCAN without an index reads the whole table; a temp B-tree means the
+    # index does not cover the sort and every match is sorted first
+    assert not any(step.startswith('SCAN') and 'INDEX' not in step for step in plan), plan
+    assert not any('TEMP B-TREE' in step for step in plan), plan
@@ -0,0 +1,39 @@
+import pytest
+from app import db
+from app.models import Order, Product, StockReservation
+from app.services.inventory import InsufficientStockError, reserve_stock
+from tests.conftest import create_products, create_user
+
+def _order(user_id):
+    order = Order(user_id=user_id, total_cents=0, payment_method='mpesa')
+    db.session.add(order)
+    db.session.flush()
+    return order
+
+def test_reserving_takes_stock_and_records_the_hold(app):
+    with app.app_context():
+        product = create_products(1, stock=5)[0]
+        order = _order(create_user().id)
+        reserve_stock(order, [{'product': product, 'quantity': 2}, {'product': product, 'quantity': 1}])
+        db.session.commit()
+        
+        assert db.session.get(Product, product.id).stock == 2
+        assert [(r.product_id, r.quantity) for r in StockReservation.query] == [(product.id, 3)]
+
+def test_reserving_more_than_is_left_takes_nothing(app):
+    with app.app_context():
+        product = create_products(1, stock=1)[0]
+        with pytest.raises(InsufficientStockError):
+            reserve_stock(_order(create_user().id), [{'product': product, 'quantity': 2}])
+        db.session.rollback()
+        assert db.session.get(Product, product.id).stock == 1
+
+@pytest.mark.parametrize('quantity', [0, -1])
+def test_non_positive_quantities_are_refused(app, quantity):
+    with app.app_context():
+        widget, gadget = create_products(2, stock=5)
+        lines = [{'product': widget, 'quantity': 1}, {'product': gadget, 'quantity': quantity}]
+        with pytest.raises(ValueError):
+            reserve_stock(_order(create_user().id), lines)
+        db.session.rollback()
+        assert [p.stock for p in Product.query.order_by(Product.id)] == [5, 5]
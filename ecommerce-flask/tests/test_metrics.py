@@ -0,0 +1,65 @@
+import pytest
+from app.services.metrics import MetricsRegistry, track_http
+
+def test_histograms_render_cumulative_buckets():
+    registry = MetricsRegistry()
+    for value in (0.003, 0.02, 0.02, 3):
+        registry.observe('http_request_duration_seconds', {'endpoint': 'main.index', 'method': 'GET'}, value)
+    lines = registry.render()
+    
+    labels = 'endpoint="main.index",method="GET"'
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.005"}} 1' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="0.025"}} 3' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="2.5"}} 3' in lines
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 4' in lines
+    assert f'http_request_duration_seconds_count{{{labels}}} 4' in lines
+
+def test_counters_add_up_per_label_set_and_escape_values():
+    registry = MetricsRegistry()
+    registry.inc('db_queries_total', {'endpoint': 'cart.view_cart', 'method': 'GET'}, 3)
+    registry.inc('db_queries_total', {'method': 'GET', 'endpoint': 'cart.view_cart'}, 2)
+    registry.inc('db_queries_total', {'endpoint': 'say "hi"\n', 'method': 'GET'})
+    lines = registry.render()
+    
+    assert lines.count('# HELP db_queries_total SQL statements run inside requests') == 1
+    assert 'db_queries_total{endpoint="cart.view_cart",method="GET"} 5' in lines
+    assert 'db_queries_total{endpoint="say \\"hi\\"\\n",method="GET"} 1' in lines
+
+def test_requests_are_recorded_per_endpoint(make_app):
+    app = make_app(METRICS_ENABLED=True, METRICS_TOKEN='s3cret')
+    client = app.test_client()
+    client.get('/')
+    client.get('/')
+    
+    body = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).get_data(as_text=True)
+    assert 'http_requests_total{endpoint="main.index",method="GET",status="200"} 2' in body
+    assert 'db_queries_per_request_count{endpoint="main.index",method="GET"} 2' in body
+
+def test_metrics_require_the_token_when_set(make_app):
+    client = make_app(METRICS_ENABLED=True, METRICS_TOKEN='s3cret').test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).status_code == 200
+
+def test_metrics_without_a_token_are_only_served_in_debug(make_app):
+    app = make_app(METRICS_ENABLED=True)
+    assert app.test_client().get('/metrics').status_code == 404
+    
+    app.debug = True
+    assert app.test_client().get('/metrics').status_code == 200
+
+def test_metrics_can_be_disabled(client):
+    assert client.get('/metrics').status_code == 404
+
+def test_outbound_calls_are_timed_by_outcome(make_app):
+    app = make_app(METRICS_ENABLED=True)
+    with app.app_context():
+        with track_http('stripe'):
+            pass
+        with pytest.raises(RuntimeError):
+            with track_http('daraja'):
+                raise RuntimeError('timed out')
+        lines = app.extensions['metrics'].render()
+    assert 'outbound_http_duration_seconds_count{outcome="ok",service="stripe"} 1' in lines
+    assert 'outbound_http_duration_seconds_count{outcome="error",service="daraja"} 1' in lines
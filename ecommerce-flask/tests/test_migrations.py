@@ -0,0 +1,89 @@
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import downgrade, stamp, upgrade
+from sqlalchemy import inspect, text
+from app import create_app, db
+from tests.conftest import MIGRATIONS, TestConfig
+
+INITIAL = '3a4f49b5f881'
+BEFORE_INTEGER_MONEY = '7d2b7eb3b5d6'
+INTEGER_MONEY = '14f73566d075'
+
+@pytest.fixture
+def bare_app(tmp_path):
+    """An app whose database has no schema yet"""
+    app = create_app(type('TestConfig', (TestConfig,), {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'bare.db'}"}))
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+def _indexes(table):
+    return {index['name'] for index in inspect(db.engine).get_indexes(table)}
+
+def test_a_database_from_before_migrations_upgrades(bare_app):
+    # The initial revision is the schema db.create_all() made before migrations
+    upgrade(directory=MIGRATIONS, revision=INITIAL)
+    assert not inspect(db.engine).has_table('stock_reservation')
+    
+    upgrade(directory=MIGRATIONS)
+    assert 'ix_stock_reservation_status_expires' in _indexes('stock_reservation')
+
+def test_a_database_that_already_has_reservations_upgrades(bare_app):
+    upgrade(directory=MIGRATIONS, revision=INITIAL)
+    with db.engine.begin() as connection:
+        # What db.create_all() made once stock reservations existed
+        connection.execute(text(
+            'CREATE TABLE stock_reservation (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER, '
+            'quantity INTEGER NOT NULL, status VARCHAR(20), expires_at DATETIME NOT NULL, created_at DATETIME)'
+        ))
+        connection.execute(text('CREATE INDEX ix_stock_reservation_order_id ON stock_reservation (order_id)'))
+        connection.execute(text('CREATE INDEX ix_stock_reservation_expires_at ON stock_reservation (expires_at)'))
+    stamp(directory=MIGRATIONS, revision=INITIAL)
+    
+    upgrade(directory=MIGRATIONS)
+    assert _indexes('stock_reservation') == {'ix_stock_reservation_order_id', 'ix_stock_reservation_status_expires'}
+
+def _money(suffix):
+    """The one money value in each money table; suffix picks the column generation"""
+    with db.engine.connect() as connection:
+        return [connection.execute(text(f'SELECT {column}{suffix} FROM {table}')).scalar() for table, column in (
+            ('product', 'price'), ('"order"', 'total'), ('order_item', 'price'), ('order_summary', 'total_spent')
+        )]
+
+def test_float_money_converts_to_minor_units_and_back(bare_app):
+    upgrade(directory=MIGRATIONS, revision=BEFORE_INTEGER_MONEY)
+    with db.engine.begin() as connection:
+        connection.execute(text("INSERT INTO user (id, username, email) VALUES (1, 'ann', 'ann@example.com')"))
+        connection.execute(text("INSERT INTO category (id, name, slug) VALUES (1, 'Tools', 'tools')"))
+        # 0.29 * 100 is 28.999999999999996 in floating point
+        connection.execute(text(
+            "INSERT INTO product (id, name, slug, price, stock, category_id, is_active) "
+            "VALUES (1, 'Nail', 'nail', 0.29, 5, 1, 1)"
+        ))
+        connection.execute(text('INSERT INTO "order" (id, user_id, total, status) VALUES (1, 1, 19.99, :status)'),
+                           {'status': 'paid'})
+        connection.execute(text('INSERT INTO order_item (order_id, product_id, quantity, price) VALUES (1, 1, 1, 0.29)'))
+        connection.execute(text(
+            'INSERT INTO order_summary (user_id, order_count, total_spent, pending_count, paid_count, '
+            'shipped_count, delivered_count, cancelled_count, failed_count) VALUES (1, 1, 19.99, 0, 1, 0, 0, 0, 0)'
+        ))
+    
+    upgrade(directory=MIGRATIONS, revision=INTEGER_MONEY)
+    assert _money('_cents') == [29, 1999, 29, 1999]
+    assert all(isinstance(value, int) for value in _money('_cents'))
+    price_indexes = {index['name']: index['column_names'] for index in inspect(db.engine).get_indexes('product')}
+    assert price_indexes['ix_product_active_price'] == ['is_active', 'price_cents', 'id']
+    
+    downgrade(directory=MIGRATIONS, revision=BEFORE_INTEGER_MONEY)
+    assert _money('') == [0.29, 19.99, 0.29, 19.99]
+
+def test_migrations_build_the_schema_the_models_describe(bare_app):
+    upgrade(directory=MIGRATIONS)
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={
+            # The full-text index is managed by app.services.search, not the models
+            'include_name': lambda name, type_, parent: not (name or '').startswith('product_search')
+        })
+        assert compare_metadata(context, db.metadata) == []
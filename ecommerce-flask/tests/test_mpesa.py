@@ -0,0 +1,206 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from httpcore._backends.auto import AutoBackend
+from app.services import mpesa
+from app.services.mpesa import (BASE_URLS, STK_PUSH_PATH, TOKEN_PATH, AsyncDarajaClient, DarajaClient,
+                                DarajaError, normalize_phone)
+
+def _client(**kwargs):
+    return DarajaClient('key', 'secret', '174379', 'passkey', **kwargs)
+
+@pytest.mark.parametrize('environment, base_url', [
+    ('production', BASE_URLS['production']),
+    ('sandbox', BASE_URLS['sandbox']),
+    ('Sandbox', BASE_URLS['sandbox']),
+    ('staging', BASE_URLS['sandbox']),
+    (None, BASE_URLS['sandbox']),
+])
+def test_anything_but_production_uses_the_sandbox(environment, base_url):
+    assert _client(environment=environment).base_url == base_url
+
+def test_base_url_overrides_the_environment():
+    assert _client(environment='production', base_url='http://127.0.0.1:9000/').base_url == 'http://127.0.0.1:9000'
+
+def test_app_starts_with_any_environment_value(make_app):
+    app = make_app(MPESA_ENVIRONMENT='Sandbox')
+    assert app.extensions['mpesa'].base_url == BASE_URLS['sandbox']
+
+@pytest.mark.parametrize('phone', ['0712345678', '+254712345678', '254712345678', '712345678'])
+def test_phone_numbers_are_normalized(phone):
+    assert normalize_phone(phone) == '254712345678'
+
+class DarajaStandIn(ThreadingHTTPServer):
+    """A local stand-in for the Daraja API that records what it is sent"""
+    
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _DarajaHandler)
+        self.requests = []
+        self.token_failures = 0  # 503s returned before a token is issued
+        self.token_delay = 0
+        self.expires_in = 3599
+        self.stk_status = 200
+        self.tokens_issued = 0
+    
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+    
+    def count(self, path):
+        return sum(1 for _, p, _ in self.requests if p.startswith(path.split('?')[0]))
+
+class _DarajaHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+    
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def do_GET(self):
+        server = self.server
+        server.requests.append(('GET', self.path, self.headers.get('Authorization')))
+        if server.token_failures:
+            server.token_failures -= 1
+            return self._reply(503, {'errorMessage': 'Service unavailable'})
+        time.sleep(server.token_delay)
+        server.tokens_issued += 1
+        self._reply(200, {'access_token': f'token-{server.tokens_issued}', 'expires_in': str(server.expires_in)})
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append(('POST', self.path, self.headers.get('Authorization')))
+        self._reply(self.server.stk_status, {'ResponseCode': '0', 'CheckoutRequestID': 'ws_CO_1'})
+
+@pytest.fixture
+def daraja():
+    server = DarajaStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(mpesa.time, 'monotonic', lambda: now[0])
+    return now
+
+def _closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f'http://127.0.0.1:{sock.getsockname()[1]}'
+
+def _push(client):
+    return client.stk_push('0712345678', 10, 'Order 1', 'Payment', 'https://shop.test/callback')
+
+def test_the_token_is_fetched_once_and_reused(daraja):
+    client = _client(base_url=daraja.url)
+    _push(client)
+    _push(client)
+    assert [(method, auth) for method, _, auth in daraja.requests] == [
+        ('GET', client._basic_auth()['Authorization']), ('POST', 'Bearer token-1'), ('POST', 'Bearer token-1')
+    ]
+
+def test_the_token_is_refreshed_token_skew_seconds_early(daraja, clock):
+    daraja.expires_in = 100
+    client = _client(base_url=daraja.url, token_skew=60)
+    assert client.access_token() == 'token-1'
+    clock[0] += 39
+    assert client.access_token() == 'token-1'
+    clock[0] += 2
+    assert client.access_token() == 'token-2'
+
+def test_concurrent_callers_share_one_token_refresh(daraja):
+    daraja.token_delay = 0.2
+    client = _client(base_url=daraja.url)
+    with ThreadPoolExecutor(8) as pool:
+        tokens = list(pool.map(lambda _: client.access_token(), range(8)))
+    assert tokens == ['token-1'] * 8
+    assert daraja.count(TOKEN_PATH) == 1
+
+def test_token_requests_are_retried_with_backoff(daraja):
+    daraja.token_failures = 2
+    client = _client(base_url=daraja.url, retries=3, backoff=0.01)
+    assert client.access_token() == 'token-1'
+    assert daraja.count(TOKEN_PATH) == 3
+
+def test_token_retries_give_up(daraja):
+    daraja.token_failures = 10
+    client = _client(base_url=daraja.url, retries=2, backoff=0.01)
+    with pytest.raises(DarajaError):
+        client.access_token()
+    assert daraja.count(TOKEN_PATH) == 3
+
+def test_stk_pushes_are_not_retried_once_sent(daraja):
+    daraja.stk_status = 503
+    client = _client(base_url=daraja.url, backoff=0.01)
+    assert _push(client)['CheckoutRequestID'] == 'ws_CO_1'
+    assert daraja.count(STK_PUSH_PATH) == 1
+
+def test_unreachable_daraja_raises(daraja):
+    client = _client(base_url=_closed_port_url(), retries=1, backoff=0.01)
+    with pytest.raises(DarajaError):
+        _push(client)
+
+def _async_client(**kwargs):
+    return AsyncDarajaClient('key', 'secret', '174379', 'passkey', **kwargs)
+
+def _run(client, coroutine):
+    async def run():
+        try:
+            return await coroutine
+        finally:
+            await client.aclose()
+    return asyncio.run(run())
+
+def test_async_callers_share_one_token_and_retry_it(daraja):
+    daraja.token_failures = 1
+    daraja.token_delay = 0.1
+    client = _async_client(base_url=daraja.url, backoff=0.01)
+    
+    async def calls():
+        tokens = await asyncio.gather(*[client.access_token() for _ in range(5)])
+        await _push(client)
+        return tokens
+    assert _run(client, calls()) == ['token-1'] * 5
+    assert daraja.count(TOKEN_PATH) == 2
+    assert daraja.requests[-1] == ('POST', STK_PUSH_PATH, 'Bearer token-1')
+
+def test_async_stk_pushes_are_not_retried_once_sent(daraja):
+    daraja.stk_status = 503
+    client = _async_client(base_url=daraja.url, backoff=0.01)
+    assert _run(client, _push(client))['CheckoutRequestID'] == 'ws_CO_1'
+    assert daraja.count(STK_PUSH_PATH) == 1
+
+def test_async_connect_errors_are_retried_by_one_layer(monkeypatch):
+    connect_tcp = AutoBackend.connect_tcp
+    attempts = []
+    
+    async def counting_connect(self, *args, **kwargs):
+        attempts.append(args)
+        return await connect_tcp(self, *args, **kwargs)
+    monkeypatch.setattr(AutoBackend, 'connect_tcp', counting_connect)
+    
+    client = _async_client(base_url=_closed_port_url(), retries=2, backoff=0.01)
+    with pytest.raises(DarajaError):
+        _run(client, client.access_token())
+    assert len(attempts) == 3
+    
+    attempts.clear()
+    client = _async_client(base_url=_closed_port_url(), retries=2, backoff=0.01)
+    # With a cached token only the STK push itself hits the closed port
+    client._token, client._token_expires = 'token', float('inf')
+    with pytest.raises(DarajaError):
+        _run(client, _push(client))
+    assert len(attempts) == 3
@@ -0,0 +1,45 @@
+import pytest
+import stripe
+from app import db
+from app.models import Order, OrderItem
+from tests.conftest import create_products, create_user, login, max_queries
+
+ORDER_COUNTS = (1, 5, 10)
+ITEMS_PER_ORDER = 3
+# Statements per request, whatever the number of orders and items
+BUDGETS = {'order_history': 5, 'order_history_json': 5, 'order_detail': 4, 'stripe_checkout': 4}
+
+def _place_orders(count):
+    user = create_user(email=f'orders{count}@example.com')
+    products = create_products(ITEMS_PER_ORDER, name=f'Orders{count}')
+    orders = []
+    for _ in range(count):
+        order = Order(user_id=user.id, total_cents=ITEMS_PER_ORDER * 1000, payment_method='stripe')
+        order.items = [OrderItem(product_id=p.id, quantity=1, price_cents=p.price_cents) for p in products]
+        orders.append(order)
+    db.session.add_all(orders)
+    db.session.commit()
+    return orders[-1].id
+
+@pytest.fixture
+def stripe_session(monkeypatch):
+    session = stripe.checkout.Session.construct_from({'url': 'https://checkout.stripe.test/session'}, 'sk_test')
+    monkeypatch.setattr(stripe.checkout.Session, 'create', lambda **kwargs: session)
+
+@pytest.mark.parametrize('count', ORDER_COUNTS)
+def test_order_pages_stay_within_budget(app, stripe_session, count):
+    client = app.test_client()
+    with app.app_context():
+        order_id = _place_orders(count)
+    login(client, email=f'orders{count}@example.com')
+    
+    pages = {
+        'order_history': '/payments/orders',
+        'order_history_json': '/payments/api/orders',
+        'order_detail': f'/payments/orders/{order_id}',
+        'stripe_checkout': f'/payments/stripe/checkout/{order_id}',
+    }
+    for view, url in pages.items():
+        with max_queries(app, BUDGETS[view]):
+            response = client.get(url)
+        assert response.status_code in (200, 302), view
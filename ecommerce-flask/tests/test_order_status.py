@@ -0,0 +1,84 @@
+import json
+from app import db
+from app.models import Order
+from app.services.notifications import get_pubsub, order_status_token, publish_order_status
+from app.services.webhooks import process_webhook_batch, record_webhook_event
+from tests.conftest import create_user, login
+
+class FakeDaraja:
+    def __init__(self):
+        self.pushes = 0
+    
+    def stk_push(self, **kwargs):
+        self.pushes += 1
+        return {'ResponseCode': '0', 'CheckoutRequestID': f'ws_CO_{self.pushes}'}
+
+def _order(app, client, status='pending'):
+    """A signed-in user's M-Pesa order; returns (order id, status token)"""
+    with app.app_context():
+        user_id = create_user().id
+        order = Order(user_id=user_id, total_cents=1000, payment_method='mpesa', status=status)
+        db.session.add(order)
+        db.session.commit()
+        order_id, token = order.id, order_status_token(order)
+    login(client)
+    return order_id, token
+
+def _wait(client, order_id, token, since, timeout=0):
+    response = client.get(f'/payments/orders/{order_id}/wait-status',
+                          query_string={'token': token, 'since': since, 'timeout': timeout})
+    assert response.status_code == 200
+    return response.get_json()
+
+def _set_status(app, order_id, status):
+    with app.app_context():
+        db.session.get(Order, order_id).status = status
+        db.session.commit()
+
+def test_wait_returns_a_published_change(app, client):
+    order_id, token = _order(app, client)
+    with app.app_context():
+        publish_order_status(order_id, 'paid')
+    
+    assert _wait(client, order_id, token, 'pending') == {'status': 'paid', 'paid': True, 'timeout': False}
+
+def test_wait_times_out_when_nothing_changed(app, client):
+    order_id, token = _order(app, client)
+    
+    assert _wait(client, order_id, token, 'pending') == {'status': 'pending', 'paid': False, 'timeout': True}
+
+def test_wait_reads_the_order_when_the_change_was_not_heard(app, client):
+    order_id, token = _order(app, client)
+    # Settled by another process, whose notification never reaches this one
+    _set_status(app, order_id, 'paid')
+    
+    assert _wait(client, order_id, token, 'pending') == {'status': 'paid', 'paid': True, 'timeout': False}
+
+def test_wait_rejects_a_token_for_another_order(app, client):
+    order_id, token = _order(app, client)
+    
+    response = client.get(f'/payments/orders/{order_id + 1}/wait-status', query_string={'token': token})
+    assert response.status_code == 403
+
+def test_a_retry_that_fails_again_is_published(app, client):
+    order_id, token = _order(app, client, status='failed')
+    app.extensions['mpesa'] = FakeDaraja()
+    
+    response = client.post('/payments/mpesa/stk-push', data={'order_id': order_id, 'phone': '0712345678'})
+    assert response.get_json()['status'] == 'pending'
+    with app.app_context():
+        assert get_pubsub().last(f'order:{order_id}') == {'status': 'pending'}
+        callback = {'CheckoutRequestID': 'ws_CO_1', 'ResultCode': 1032}
+        record_webhook_event('mpesa', 'ws_CO_1', json.dumps({'Body': {'stkCallback': callback}}))
+        process_webhook_batch()
+        assert get_pubsub().last(f'order:{order_id}') == {'status': 'failed'}
+    
+    assert _wait(client, order_id, token, 'pending') == {'status': 'failed', 'paid': False, 'timeout': False}
+
+def test_out_of_process_workers_need_a_shared_backend(make_app):
+    app = make_app(ORDER_EVENTS_BACKEND='memory')
+    
+    result = app.test_cli_runner().invoke(args=['webhooks', 'work'])
+    
+    assert result.exit_code == 1
+    assert 'ORDER_EVENTS_BACKEND' in result.output
@@ -0,0 +1,79 @@
+from datetime import datetime
+from app import db
+from app.models import Order, OrderSummary
+from app.services.order_summary import STATUSES, apply_order_changes, get_order_summary, rebuild_order_summaries
+from tests.conftest import create_user, max_queries
+
+def _place(user_id, total_cents, status='pending', created_at=None):
+    order = Order(user_id=user_id, total_cents=total_cents, status=status,
+                  created_at=created_at or datetime.utcnow())
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+def _summary(user_id):
+    summary = get_order_summary(user_id)
+    counts = {s: getattr(summary, f'{s}_count') for s in STATUSES if getattr(summary, f'{s}_count')}
+    return summary.order_count, summary.total_spent_cents, counts
+
+def _all_summaries():
+    return {s.user_id: _summary(s.user_id) for s in OrderSummary.query}
+
+def test_placing_orders_counts_them_without_spend(app):
+    with app.app_context():
+        user_id = create_user().id
+        assert _summary(user_id) == (0, 0, {})
+        
+        _place(user_id, 1000, created_at=datetime(2026, 1, 2))
+        _place(user_id, 500, created_at=datetime(2026, 1, 1))
+        
+        assert _summary(user_id) == (2, 0, {'pending': 2})
+        # The newest order wins even when an older one is recorded later
+        assert get_order_summary(user_id).last_order_at == datetime(2026, 1, 2)
+
+def test_status_changes_move_orders_between_counters(app):
+    with app.app_context():
+        user_id = create_user().id
+        first = _place(user_id, 1000)
+        second = _place(user_id, 500)
+        
+        first.status = 'paid'
+        second.status = 'failed'
+        db.session.commit()
+        assert _summary(user_id) == (2, 1000, {'paid': 1, 'failed': 1})
+        
+        first.status = 'shipped'
+        db.session.commit()
+        assert _summary(user_id) == (2, 1000, {'shipped': 1, 'failed': 1})
+        
+        # Spend only covers orders that stay paid for
+        first.status = 'cancelled'
+        db.session.commit()
+        assert _summary(user_id) == (2, 0, {'cancelled': 1, 'failed': 1})
+
+def test_bulk_changes_for_many_users_take_two_statements(app):
+    with app.app_context():
+        users = [create_user(email=f'user{i}@example.com').id for i in range(5)]
+        orders = [_place(user_id, 100 * (i + 1)) for i, user_id in enumerate(users)]
+        changes = [(o.user_id, 'pending', 'paid', o.total_cents, o.created_at) for o in orders]
+        
+        with max_queries(app, 2):
+            apply_order_changes(changes)
+        db.session.commit()
+        
+        assert [_summary(user_id)[1] for user_id in users] == [100, 200, 300, 400, 500]
+
+def test_incremental_summaries_match_a_rebuild(app):
+    with app.app_context():
+        alice, bob = create_user(email='alice@example.com').id, create_user(email='bob@example.com').id
+        orders = [_place(alice, 1000), _place(alice, 250), _place(bob, 700)]
+        orders[0].status = 'paid'
+        orders[2].status = 'delivered'
+        db.session.commit()
+        incremental = _all_summaries()
+        
+        rebuild_order_summaries()
+        db.session.commit()
+        
+        assert _all_summaries() == incremental
+        assert incremental[alice] == (2, 1000, {'paid': 1, 'pending': 1})
@@ -0,0 +1,85 @@
+from datetime import datetime
+import pytest
+from app import db
+from app.models import Product
+from app.services.pagination import decode_cursor, encode_cursor, keyset_paginate
+from tests.conftest import create_products
+
+NEWEST = [(Product.created_at, True), (Product.id, True)]
+
+def _walk(fetch, cursor=None, direction='next_cursor'):
+    pages = []
+    while True:
+        page = fetch(cursor)
+        pages.append([p.id for p in page.items])
+        cursor = getattr(page, direction)
+        if cursor is None:
+            return pages
+
+def test_pages_cover_every_row_once_in_order(app):
+    with app.app_context():
+        products = create_products(25)
+        # Ties on created_at are broken by id
+        db.session.execute(Product.__table__.update().values(created_at=datetime(2024, 1, 1)))
+        expected = sorted((p.id for p in products), reverse=True)
+        
+        with app.test_request_context():
+            pages = _walk(lambda cursor: keyset_paginate(Product.query, NEWEST, cursor, per_page=10))
+        assert [len(page) for page in pages] == [10, 10, 5]
+        assert sum(pages, []) == expected
+
+def test_prev_cursors_walk_back_to_the_first_page(app):
+    with app.app_context():
+        create_products(25)
+        with app.test_request_context():
+            fetch = lambda cursor: keyset_paginate(Product.query, NEWEST, cursor, per_page=10)
+            first = fetch(None)
+            last = fetch(fetch(first.next_cursor).next_cursor)
+            assert not first.has_prev and not last.has_next
+            
+            back = _walk(fetch, last.prev_cursor, 'prev_cursor')
+        assert back[-1] == [p.id for p in first.items]
+        assert len(back) == 2
+
+def test_price_order_pages_by_price_then_id(app):
+    with app.app_context():
+        for n, price in enumerate((500, 300, 300, 900, 100)):
+            create_products(1, price_cents=price, name=f'Item{n}')
+        order = [(Product.price_cents, False), (Product.id, False)]
+        with app.test_request_context():
+            pages = _walk(lambda cursor: keyset_paginate(Product.query, order, cursor, per_page=2))
+        prices = [db.session.get(Product, id).price_cents for id in sum(pages, [])]
+        assert prices == [100, 300, 300, 500, 900]
+
+@pytest.mark.parametrize('tamper', [
+    lambda token: token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB'),
+    lambda token: 'not-a-cursor',
+    lambda token: '',
+])
+def test_tampered_cursors_are_ignored(app, tamper):
+    with app.test_request_context():
+        token = encode_cursor('newest', [5], 'next')
+        assert decode_cursor(token, 'newest') == ([5], 'next')
+        assert decode_cursor(tamper(token), 'newest') is None
+
+def test_cursors_from_another_sort_or_secret_are_ignored(make_app):
+    app = make_app()
+    with app.test_request_context():
+        token = encode_cursor('price_low', [datetime(2024, 1, 1), 5], 'prev')
+        assert decode_cursor(token, 'price_low') == ([datetime(2024, 1, 1), 5], 'prev')
+        assert decode_cursor(token, 'newest') is None
+    with make_app(SECRET_KEY='another-secret').test_request_context():
+        assert decode_cursor(token, 'price_low') is None
+
+def test_listing_api_restarts_on_a_bad_cursor(app, client):
+    with app.app_context():
+        create_products(15)
+    first = client.get('/products/api/list').get_json()
+    second = client.get(f"/products/api/list?cursor={first['next_cursor']}").get_json()
+    assert len(first['products']) == 12 and len(second['products']) == 3
+    assert not {p['id'] for p in first['products']} & {p['id'] for p in second['products']}
+    
+    tampered = client.get(f"/products/api/list?cursor={first['next_cursor']}x").get_json()
+    assert tampered['products'] == first['products']
+    other_sort = client.get(f"/products/api/list?sort=price_low&cursor={first['next_cursor']}").get_json()
+    assert other_sort['prev_cursor'] is None
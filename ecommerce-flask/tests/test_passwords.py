@@ -0,0 +1,60 @@
+import os
+import pytest
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User
+from app.services.passwords import HasherBusyError, PasswordHasher, hash_method
+from tests.conftest import create_user, login
+
+METHOD = 'pbkdf2:sha256:1000'
+
+def test_hashes_made_with_other_parameters_need_rehashing():
+    hasher = PasswordHasher(METHOD, workers=0)
+    assert hash_method(generate_password_hash('secret', METHOD)) == METHOD
+    assert not hasher.needs_rehash(generate_password_hash('secret', METHOD))
+    assert hasher.needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:2000'))
+    assert hasher.needs_rehash(None)
+
+def test_verify_rejects_wrong_and_missing_passwords():
+    hasher = PasswordHasher(METHOD, workers=0)
+    pwhash = hasher.hash('secret')
+    assert hasher.verify(pwhash, 'secret')
+    assert not hasher.verify(pwhash, 'guess')
+    assert not hasher.verify(None, 'secret')
+
+def test_login_upgrades_an_outdated_hash(app, client):
+    with app.app_context():
+        user = create_user()
+        user.password_hash = generate_password_hash('secret', 'pbkdf2:sha256:2000')
+        db.session.commit()
+        user_id = user.id
+    login(client)
+    with app.app_context():
+        assert hash_method(db.session.get(User, user_id).password_hash) == METHOD
+
+def test_hashes_beyond_the_queue_are_refused():
+    hasher = PasswordHasher(METHOD, workers=1, queue_depth=0)
+    hasher._slots.acquire()
+    with pytest.raises(HasherBusyError):
+        hasher.hash('secret')
+
+def test_a_dead_worker_fails_one_hash_and_the_pool_recovers():
+    hasher = PasswordHasher(METHOD, workers=1, timeout=30)
+    try:
+        with pytest.raises(HasherBusyError):
+            hasher._run(os._exit, 1)
+        assert hasher.verify(hasher.hash('secret'), 'secret')
+    finally:
+        hasher.shutdown()
+
+def test_a_pool_that_is_already_broken_is_replaced(monkeypatch):
+    hasher = PasswordHasher(METHOD, workers=1, timeout=30)
+    try:
+        broken = hasher._executor()
+        monkeypatch.setattr(broken, '_broken', 'a worker died')
+        with pytest.raises(HasherBusyError):
+            hasher.hash('secret')
+        assert hasher._executor() is not broken
+        assert hasher.verify(hasher.hash('secret'), 'secret')
+    finally:
+        hasher.shutdown()
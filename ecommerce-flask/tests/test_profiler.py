@@ -0,0 +1,63 @@
+import pytest
+from app.services import profiler
+from app.services.profiler import (OVERFLOW_STACK, PROFILE_HEADER, StackSampler, _should_profile,
+                                   check_profile_token, create_profile_token)
+
+def test_profile_tokens_are_signed_with_the_app_secret(make_app):
+    app = make_app()
+    with app.app_context():
+        token = create_profile_token()
+        assert check_profile_token(token)
+        assert not check_profile_token(token + 'x')
+        assert not check_profile_token(None)
+    with make_app(SECRET_KEY='another-secret').app_context():
+        assert not check_profile_token(token)
+
+def test_profile_tokens_expire(make_app):
+    with make_app(PROFILE_TOKEN_MAX_AGE=-1).app_context():
+        assert not check_profile_token(create_profile_token())
+
+@pytest.mark.parametrize('settings, path, roll, expected', [
+    ({}, '/', 0.0, False),
+    ({'PROFILE_SAMPLE_RATE': 0.1}, '/', 0.05, True),
+    ({'PROFILE_SAMPLE_RATE': 0.1}, '/', 0.5, False),
+    ({'PROFILE_SAMPLE_RATE': 1, 'PROFILE_ENDPOINTS': ['cart.view_cart']}, '/', 0.0, False),
+    ({'PROFILE_SAMPLE_RATE': 1, 'PROFILE_ENDPOINTS': ['main.index']}, '/', 0.0, True),
+    ({'PROFILE_SAMPLE_RATE': 1}, '/no-such-page', 0.0, False),
+])
+def test_requests_are_sampled_at_the_configured_rate(make_app, monkeypatch, settings, path, roll, expected):
+    app = make_app(**settings)
+    monkeypatch.setattr(profiler.random, 'random', lambda: roll)
+    with app.test_request_context(path):
+        assert _should_profile(app) is expected
+
+def test_a_profile_token_header_forces_sampling(make_app):
+    app = make_app()
+    with app.app_context():
+        token = create_profile_token()
+    with app.test_request_context('/', headers={PROFILE_HEADER: token}):
+        assert _should_profile(app)
+    with app.test_request_context('/', headers={PROFILE_HEADER: 'forged'}):
+        assert not _should_profile(app)
+
+def test_rare_stacks_beyond_the_limit_are_lumped_together():
+    sampler = StackSampler(max_stacks=2)
+    for stack in ('a;b', 'a;c', 'a;d', 'a;b', 'a;e'):
+        sampler._record('main.index', stack)
+    assert sampler.stacks['main.index'] == {'a;b': 2, 'a;c': 1, OVERFLOW_STACK: 2}
+    assert sampler.collapsed('main.index')[0] == 'a;b 2'
+    assert 'main.index;a;c 1' in sampler.collapsed()
+
+def test_admin_endpoints_require_a_profile_token(make_app):
+    app = make_app()
+    client = app.test_client()
+    with app.app_context():
+        token = create_profile_token()
+    
+    assert client.get('/admin/profile').status_code == 401
+    assert client.get('/admin/profile', headers={'Authorization': 'Bearer forged'}).status_code == 401
+    
+    client.get('/', headers={PROFILE_HEADER: token})
+    response = client.get('/admin/profile', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.get_json()['main.index']['requests'] == 1
@@ -0,0 +1,117 @@
+import random
+import pytest
+from sqlalchemy import select
+from app import db
+from app.models import Order, OrderItem, Product, ProductRecommendation, RecommendationQueue
+from app.services.catalog import get_catalog_cache, get_categories, get_related_products
+from app.services.query_budget import QueryCounter
+from app.services.recommendations import (count_copurchases_python, count_copurchases_sparse,
+                                          queue_recommendation_refresh, rebuild_recommendations,
+                                          refresh_recommendations)
+from tests.conftest import create_products, create_user
+
+def _rows(baskets):
+    return [(order_id, product_id) for order_id, basket in enumerate(baskets, 1) for product_id in basket]
+
+def test_pairs_are_counted_once_per_order_and_ranked():
+    baskets = [[1, 2, 2, 3], [1, 2], [1, 3], [1, 4], [4]]
+    expected = {
+        1: [(2, 2), (3, 2), (4, 1)],
+        2: [(1, 2), (3, 1)],
+        3: [(1, 2), (2, 1)],
+        4: [(1, 1)],
+    }
+    for count in (count_copurchases_sparse, count_copurchases_python):
+        assert count(_rows(baskets), None, 3) == expected
+        assert count(_rows(baskets), [1, 4], 2) == {1: [(2, 2), (3, 2)], 4: [(1, 1)]}
+
+@pytest.mark.parametrize('seed', range(5))
+def test_sparse_and_python_counts_agree(seed):
+    rng = random.Random(seed)
+    baskets = [rng.sample(range(1, 60), rng.randint(1, 6)) for _ in range(400)]
+    targets = rng.sample(range(1, 60), 10)
+    for chosen in (None, targets):
+        assert count_copurchases_sparse(_rows(baskets), chosen, 5) == count_copurchases_python(_rows(baskets), chosen, 5)
+
+def _pay(user_id, products, status='paid'):
+    order = Order(user_id=user_id, total_cents=0, status=status, payment_method='mpesa')
+    order.items = [OrderItem(product_id=p.id, quantity=1, price_cents=p.price_cents) for p in products]
+    db.session.add(order)
+    db.session.flush()
+    queue_recommendation_refresh([order.id])
+    return order
+
+def _stored():
+    return db.session.execute(select(
+        ProductRecommendation.product_id, ProductRecommendation.rank,
+        ProductRecommendation.recommended_id, ProductRecommendation.score
+    ).order_by(ProductRecommendation.product_id, ProductRecommendation.rank)).all()
+
+def test_refreshing_queued_orders_matches_a_full_rebuild(app):
+    rng = random.Random(1)
+    with app.app_context():
+        user_id = create_user().id
+        products = create_products(30)
+        for _ in range(60):
+            _pay(user_id, rng.sample(products, rng.randint(1, 5)))
+        db.session.commit()
+        rebuild_recommendations(top_k=4)
+        
+        for _ in range(15):
+            _pay(user_id, rng.sample(products, rng.randint(1, 5)))
+        _pay(user_id, products[:5], status='pending')
+        db.session.commit()
+        assert refresh_recommendations(top_k=4) > 0
+        db.session.commit()
+        refreshed = _stored()
+        
+        assert db.session.scalars(select(RecommendationQueue.order_id)).all() == []
+        rebuild_recommendations(top_k=4)
+        db.session.commit()
+        assert refreshed == _stored()
+
+def test_queueing_an_order_twice_keeps_one_entry(app):
+    with app.app_context():
+        order = _pay(create_user().id, create_products(2))
+        queue_recommendation_refresh([order.id])
+        db.session.commit()
+        assert db.session.scalars(select(RecommendationQueue.order_id)).all() == [order.id]
+
+def test_related_products_are_topped_up_from_the_category(app):
+    with app.app_context():
+        user_id = create_user().id
+        shirt, socks, hat, scarf, gloves = create_products(5)
+        for basket in ([shirt, socks], [shirt, socks], [shirt, hat]):
+            _pay(user_id, basket)
+        db.session.commit()
+        rebuild_recommendations()
+        db.session.commit()
+        
+        related = [p.id for p in get_related_products(shirt, limit=4)]
+        assert related[:2] == [socks.id, hat.id]
+        assert sorted(related[2:]) == [scarf.id, gloves.id]
+
+def test_refreshing_drops_only_the_cached_related_products(app, client):
+    with app.app_context():
+        user_id = create_user().id
+        shirt, socks, hat = create_products(3)
+        shirt_id, hat_id, slug = shirt.id, hat.id, shirt.slug
+        cache = get_catalog_cache()
+        get_categories()
+        # Cached before the refresh: topped up from the category, socks first
+        assert [p.id for p in get_related_products(shirt, limit=1)] == [socks.id]
+        version = cache.version()
+        _pay(user_id, [shirt, hat])
+        db.session.commit()
+    etag = client.get(f'/products/{slug}').headers['ETag']
+    
+    with app.app_context():
+        refresh_recommendations()
+        db.session.commit()
+        
+        assert cache.version() == version
+        with QueryCounter(db.engine) as counter:
+            get_categories()
+        assert counter.count == 0
+        assert [p.id for p in get_related_products(db.session.get(Product, shirt_id), limit=1)] == [hat_id]
+    assert client.get(f'/products/{slug}').headers['ETag'] != etag
@@ -0,0 +1,115 @@
+import time
+import pytest
+from flask import session
+from sqlalchemy import select, update
+from app import db
+from app.models import Product
+from app.services import database
+from app.services.catalog import get_categories, get_product_by_slug
+from app.services.database import STICKY_SESSION_KEY, ReplicaRouter, reading_primary
+from app.services.facets import get_facet_index
+from app.services.suggest import get_suggest_index
+from app.services.query_budget import QueryCounter
+from tests.conftest import create_products, create_user, login
+
+@pytest.fixture
+def replica_app(make_app, tmp_path):
+    # The replica is a second engine on the primary's own file, so both see
+    # the same rows and only the engine a statement runs on differs
+    url = f"sqlite:///{tmp_path / 'shop.db'}"
+    return make_app(SQLALCHEMY_DATABASE_URI=url, REPLICA_DATABASE_URLS=[url])
+
+def _bind(statement=None):
+    return db.session.get_bind(clause=statement if statement is not None else select(Product))
+
+def test_selects_in_read_requests_use_the_replica(replica_app):
+    for method in ('GET', 'HEAD'):
+        with replica_app.test_request_context('/', method=method):
+            assert _bind() is db.engines['replica_1']
+
+def test_write_requests_and_writes_use_the_primary(replica_app):
+    with replica_app.test_request_context('/', method='POST'):
+        assert _bind() is db.engines[None]
+    with replica_app.test_request_context('/'):
+        assert db.session.get_bind(clause=update(Product).values(stock=0)) is db.engines[None]
+    with replica_app.app_context():
+        assert _bind() is db.engines[None]
+
+def test_a_request_reads_from_the_primary_once_it_writes(replica_app):
+    with replica_app.test_request_context('/'):
+        assert _bind() is db.engines['replica_1']
+        create_products(1)
+        assert _bind() is db.engines[None]
+
+def test_users_who_just_wrote_read_from_the_primary(replica_app):
+    with replica_app.test_request_context('/'):
+        session[STICKY_SESSION_KEY] = time.time() + 10
+        assert _bind() is db.engines[None]
+    with replica_app.test_request_context('/'):
+        session[STICKY_SESSION_KEY] = time.time() - 1
+        assert _bind() is db.engines['replica_1']
+
+@pytest.mark.parametrize('lag', [30, RuntimeError('replica down')])
+def test_lagging_or_unreachable_replicas_are_skipped(replica_app, monkeypatch, lag):
+    def replica_lag(engine):
+        if isinstance(lag, Exception):
+            raise lag
+        return lag
+    monkeypatch.setattr(database, 'replica_lag', replica_lag)
+    with replica_app.test_request_context('/'):
+        assert _bind() is db.engines[None]
+
+def test_replica_lag_is_probed_once_per_check_interval(monkeypatch):
+    probes = []
+    monkeypatch.setattr(database, 'replica_lag', lambda engine: probes.append(engine) or 0)
+    router = ReplicaRouter(['replica_1'], max_lag=5, check_interval=60)
+    engines = {'replica_1': object()}
+    assert router.choose(engines) is engines['replica_1']
+    assert router.choose(engines) is engines['replica_1']
+    assert len(probes) == 1
+
+def test_payment_pages_read_from_the_primary(replica_app):
+    client = replica_app.test_client()
+    with replica_app.app_context():
+        create_user()
+        slug = create_products(1)[0].slug
+        replica = db.engines['replica_1']
+    login(client)
+    
+    with QueryCounter(replica) as counter:
+        client.get(f'/products/{slug}')
+    assert counter.count > 0
+    with QueryCounter(replica) as counter:
+        assert client.get('/payments/orders').status_code == 200
+    assert counter.count == 0
+
+def test_reading_primary_restores_the_request_routing(replica_app):
+    with replica_app.test_request_context('/'):
+        assert _bind() is db.engines['replica_1']
+        with reading_primary():
+            assert _bind() is db.engines[None]
+        assert _bind() is db.engines['replica_1']
+
+def test_catalog_caches_and_indexes_fill_from_the_primary(replica_app):
+    with replica_app.app_context():
+        slug = create_products(3)[0].slug
+        replica = db.engines['replica_1']
+    
+    with replica_app.test_request_context('/'), QueryCounter(replica) as counter:
+        assert get_product_by_slug(slug).slug == slug
+        assert len(get_categories()) == 1
+        assert get_facet_index().counts(search='widget')['total'] == 3
+        assert [entry.slug for entry in get_suggest_index().suggest('widget 0')] == [slug]
+        # Reads outside the fills still go to the replica
+        assert _bind() is db.engines['replica_1']
+    assert counter.count == 0
+
+def test_cached_pages_render_from_the_primary(replica_app):
+    with replica_app.app_context():
+        create_products(3)
+        replica = db.engines['replica_1']
+    client = replica_app.test_client()
+    
+    with QueryCounter(replica) as counter:
+        assert client.get('/products/').status_code == 200
+    assert counter.count == 0
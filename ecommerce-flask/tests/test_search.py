@@ -0,0 +1,74 @@
+from app import db
+from app.models import Category, Product
+from app.services.search import init_search_index, reindex_products, search_products
+
+def _search(text):
+    query, rank = search_products(Product.query, text)
+    if rank is not None:
+        query = query.order_by(rank, Product.id)
+    return [p.name for p in query]
+
+def _add(name, description='', category=None):
+    product = Product(name=name, slug=name.lower().replace(' ', '-'), description=description,
+                      price_cents=1000, stock=1, category_id=category.id if category else None)
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+def test_existing_products_are_backfilled(app):
+    with app.app_context():
+        _add('Wireless Headphones')
+        assert init_search_index(db.engine)
+        assert _search('headphones') == ['Wireless Headphones']
+
+def test_name_matches_rank_above_description_matches(app):
+    with app.app_context():
+        init_search_index(db.engine)
+        _add('Travel Mug', description='Keeps coffee hot on the road')
+        _add('Coffee Grinder', description='Burr grinder')
+        _add('Kettle', description='For tea')
+        assert _search('coffee') == ['Coffee Grinder', 'Travel Mug']
+
+def test_terms_match_word_prefixes_and_ignore_accents(app):
+    with app.app_context():
+        init_search_index(db.engine)
+        _add('Café Crème Beans')
+        _add('Bluetooth Headphones')
+        _add('Blue Hat')
+        assert _search('cafe') == ['Café Crème Beans']
+        assert _search('head blue') == ['Bluetooth Headphones']
+        assert sorted(_search('blu')) == ['Blue Hat', 'Bluetooth Headphones']
+        assert _search('"; DROP TABLE product; --') == []
+
+def test_the_index_follows_product_and_category_changes(app):
+    with app.app_context():
+        init_search_index(db.engine)
+        tools = Category(name='Tools', slug='tools')
+        db.session.add(tools)
+        db.session.commit()
+        hammer = _add('Claw Hammer', category=tools)
+        saw = _add('Hand Saw')
+        assert _search('tools') == ['Claw Hammer']
+        
+        hammer.name = 'Rubber Mallet'
+        tools.name = 'Workshop'
+        db.session.delete(saw)
+        db.session.commit()
+        assert _search('hammer') == [] and _search('saw') == []
+        assert _search('mallet workshop') == ['Rubber Mallet']
+
+def test_bulk_changes_are_picked_up_by_a_reindex(app):
+    with app.app_context():
+        init_search_index(db.engine)
+        lamp = _add('Desk Lamp')
+        db.session.execute(Product.__table__.update().values(name='Floor Lamp'))
+        assert _search('floor') == []
+        reindex_products([lamp.id])
+        assert _search('floor') == ['Floor Lamp']
+
+def test_like_matching_is_used_without_an_index(app):
+    with app.app_context():
+        _add('Desk Lamp', description='Warm light')
+        query, rank = search_products(Product.query, 'light')
+        assert rank is None
+        assert [p.name for p in query] == ['Desk Lamp']
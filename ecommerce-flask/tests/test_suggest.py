@@ -0,0 +1,95 @@
+import random
+import pytest
+from app import db
+from app.models import Product
+from app.services.query_budget import QueryCounter
+from app.services.suggest import Suggestion, SuggestIndex, tokenize
+from tests.conftest import create_products
+
+WORDS = ['red', 'blue', 'bluetooth', 'head', 'headphones', 'shirt', 'short', 'cafe', 'cable', 'hat']
+
+def _index(products, popularity=None, limit=5):
+    """An index over {id: name} products without a database"""
+    index = SuggestIndex(limit=limit)
+    index._popularity = popularity or {}
+    index.built_at = 0
+    index.apply({('product', id): (name, f'p{id}', 100) for id, name in products.items()})
+    return index
+
+def _names(entries):
+    return [entry.name for entry in entries]
+
+def test_best_sellers_come_first_then_names():
+    index = _index({1: 'Red Hat', 2: 'Red Shirt', 3: 'Radio'}, popularity={2: 9})
+    assert _names(index.suggest('r')) == ['Red Shirt', 'Radio', 'Red Hat']
+    assert _names(index.suggest('re')) == ['Red Shirt', 'Red Hat']
+    assert _names(index.suggest('red', limit=1)) == ['Red Shirt']
+
+def test_every_typed_word_must_start_a_word_of_the_name():
+    index = _index({1: 'Bluetooth Headphones', 2: 'Blue Hat', 3: 'Red Headband', 4: 'Café Crème'})
+    assert _names(index.suggest('blue he')) == ['Bluetooth Headphones']
+    assert _names(index.suggest('he blu')) == ['Bluetooth Headphones']
+    assert _names(index.suggest('hat blue')) == ['Blue Hat']
+    assert _names(index.suggest('cafe creme')) == ['Café Crème']
+    assert index.suggest('blue x') == []
+    assert index.suggest('  ') == []
+
+@pytest.mark.parametrize('seed', range(3))
+def test_suggestions_match_a_brute_force_scan(seed):
+    rng = random.Random(seed)
+    products = {id: ' '.join(rng.sample(WORDS, rng.randint(1, 3))) for id in range(1, 400)}
+    popularity = {id: rng.randint(0, 20) for id in products}
+    index = _index(products, popularity, limit=8)
+    
+    for query in ['b', 'bl', 'blue', 'he', 'head', 'c', 'ca', 'blue he', 'hat cab', 'r s', 'sh bl he']:
+        prefixes = tokenize(query)
+        expected = sorted(
+            (Suggestion('product', id, name, f'p{id}', 100, popularity[id]) for id, name in products.items()
+             if all(any(word.startswith(p) for word in tokenize(name)) for p in prefixes)),
+            key=lambda entry: entry.rank
+        )[:8]
+        assert [e.id for e in index.suggest(query)] == [e.id for e in expected], query
+
+def test_changes_are_applied_in_place():
+    index = _index({1: 'Red Hat', 2: 'Blue Hat'})
+    assert _names(index.suggest('ha')) == ['Blue Hat', 'Red Hat']
+    
+    index.apply({('product', 1): ('Green Hat', 'p1', 100), ('product', 3): ('Hammer', 'p3', 100)})
+    assert _names(index.suggest('ha')) == ['Blue Hat', 'Green Hat', 'Hammer']
+    assert index.suggest('red') == []
+    
+    index.apply({('product', 2): None, ('category', 7): ('Hats', 'hats', None)})
+    assert [(e.kind, e.name) for e in index.suggest('hat')] == [('product', 'Green Hat'), ('category', 'Hats')]
+
+def test_changes_committed_during_a_rebuild_are_replayed(monkeypatch):
+    index = _index({1: 'Red Hat'})
+    loaded = [Suggestion('product', 1, 'Red Hat', 'p1', 100)]
+    
+    def load():
+        # A rename commits after the rebuild read the old row
+        index.apply({('product', 1): ('Blue Hat', 'p1', 100)})
+        return loaded, {}
+    monkeypatch.setattr(index, '_load', load)
+    index.rebuild()
+    assert _names(index.suggest('hat')) == ['Blue Hat']
+
+def test_committed_products_update_the_index_without_sql(app, client):
+    with app.app_context():
+        create_products(3, name='Lamp')
+        suggestions = client.get('/products/suggest?q=lam').get_json()['suggestions']
+        assert [s['name'] for s in suggestions] == ['Lamp 0', 'Lamp 1', 'Lamp 2', 'Lamps']
+        
+        lamp = Product.query.filter_by(slug='lamp-0').one()
+        lamp.name = 'Desk Lamp'
+        db.session.commit()
+        Product.query.filter_by(slug='lamp-1').one().is_active = False
+        db.session.commit()
+        engine = db.engine
+    
+    with QueryCounter(engine) as counter:
+        suggestions = client.get('/products/suggest?q=lamp').get_json()['suggestions']
+    assert counter.count == 0
+    assert [(s['type'], s['name']) for s in suggestions] == [
+        ('product', 'Desk Lamp'), ('product', 'Lamp 2'), ('category', 'Lamps')
+    ]
+    assert suggestions[0]['url'] == '/products/lamp-0'
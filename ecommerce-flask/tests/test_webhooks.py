@@ -0,0 +1,163 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from app import db
+from app.models import Order, OrderItem, Product, WebhookEvent
+from app.services import webhooks
+from app.services.inventory import reserve_stock, sweep_expired_reservations
+from app.services.webhooks import MAX_ATTEMPTS, process_webhook_batch, record_webhook_event
+from tests.conftest import create_products, create_user
+
+def _place_orders(app, count=1, stock=2, quantity=2):
+    """Pending M-Pesa orders with stock held, as checkout leaves them; returns (order ids, product id)"""
+    with app.app_context():
+        user_id = create_user().id
+        product = create_products(1, stock=stock * count)[0]
+        order_ids = []
+        for i in range(count):
+            order = Order(user_id=user_id, total_cents=product.price_cents * quantity,
+                          payment_method='mpesa', payment_id=f'ws_CO_{i}')
+            db.session.add(order)
+            db.session.flush()
+            db.session.add(OrderItem(order_id=order.id, product_id=product.id, quantity=quantity,
+                                     price_cents=product.price_cents))
+            reserve_stock(order, [{'product': product, 'quantity': quantity}])
+            order_ids.append(order.id)
+        db.session.commit()
+        return order_ids, product.id
+
+def _mpesa_callback(checkout_id, paid=True, receipt='RCP1'):
+    callback = {'CheckoutRequestID': checkout_id, 'ResultCode': 0 if paid else 1032}
+    if paid:
+        callback['CallbackMetadata'] = {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': receipt}]}
+    return json.dumps({'Body': {'stkCallback': callback}})
+
+def _deliver(app, checkout_id, paid=True, receipt='RCP1', event_key=None):
+    with app.app_context():
+        payload = _mpesa_callback(checkout_id, paid, receipt)
+        return record_webhook_event('mpesa', event_key or f'{checkout_id}:{receipt}:{paid}', payload)
+
+def _orders(app, order_ids):
+    with app.app_context():
+        return [(o.status, o.payment_id) for o in (db.session.get(Order, oid) for oid in order_ids)]
+
+def _events(app):
+    with app.app_context():
+        return [(e.status, e.attempts) for e in WebhookEvent.query.order_by(WebhookEvent.id)]
+
+def _reservations(app, order_id):
+    with app.app_context():
+        return sorted(r.status for r in db.session.get(Order, order_id).reservations)
+
+def _sweep(app):
+    with app.app_context():
+        sweep_expired_reservations(now=datetime.utcnow() + timedelta(days=1))
+
+def test_duplicate_deliveries_are_recorded_once(app):
+    assert _deliver(app, 'ws_CO_0', event_key='ws_CO_0') is True
+    assert _deliver(app, 'ws_CO_0', event_key='ws_CO_0') is False
+    
+    with app.app_context():
+        assert WebhookEvent.query.count() == 1
+        # The key is per provider
+        assert record_webhook_event('stripe', 'ws_CO_0', '{}') is True
+
+def test_a_batch_settles_pending_and_failed_orders(app):
+    (pending, failed), product_id = _place_orders(app, count=2)
+    _deliver(app, 'ws_CO_1', paid=False)
+    with app.app_context():
+        assert process_webhook_batch() == 1
+    assert _orders(app, [failed]) == [('failed', 'ws_CO_1')]
+    
+    # A retried STK push that succeeds settles the failed order too
+    _deliver(app, 'ws_CO_0', receipt='RCP0')
+    _deliver(app, 'ws_CO_1', receipt='RCP1')
+    with app.app_context():
+        assert process_webhook_batch() == 2
+    
+    assert _orders(app, [pending, failed]) == [('paid', 'RCP0'), ('paid', 'RCP1')]
+    assert _reservations(app, pending) == _reservations(app, failed) == ['committed']
+    assert [status for status, _ in _events(app)] == ['processed'] * 3
+
+def test_events_that_change_nothing_are_ignored(app):
+    (order_id,), _ = _place_orders(app)
+    _deliver(app, 'ws_CO_0', receipt='RCP0')
+    # A failure reported after the payment, and a callback for no known order
+    _deliver(app, 'ws_CO_0', paid=False)
+    _deliver(app, 'ws_CO_unknown')
+    with app.app_context():
+        record_webhook_event('stripe', 'evt_1', json.dumps({'type': 'charge.refunded'}))
+        assert process_webhook_batch() == 4
+    
+    assert _orders(app, [order_id]) == [('paid', 'RCP0')]
+    assert [status for status, _ in _events(app)] == ['processed', 'ignored', 'ignored', 'ignored']
+
+def test_payment_after_a_sweep_reserves_the_stock_again(app):
+    (order_id,), product_id = _place_orders(app)
+    _sweep(app)
+    _deliver(app, 'ws_CO_0', receipt='RCP0')
+    with app.app_context():
+        process_webhook_batch()
+        assert db.session.get(Product, product_id).stock == 0
+    
+    assert _orders(app, [order_id]) == [('paid', 'RCP0')]
+    assert _reservations(app, order_id) == ['committed', 'released']
+    assert _events(app) == [('processed', 1)]
+
+def test_payment_after_a_sweep_flags_sold_out_orders_for_a_refund(app, caplog, monkeypatch):
+    # Running migrations in-process disables loggers that already exist
+    monkeypatch.setattr(app.logger, 'disabled', False)
+    (order_id,), product_id = _place_orders(app)
+    _sweep(app)
+    with app.app_context():
+        # Someone else buys the released stock before the payment lands
+        db.session.get(Product, product_id).stock = 1
+        db.session.commit()
+    _deliver(app, 'ws_CO_0', receipt='RCP0')
+    
+    with app.app_context():
+        process_webhook_batch()
+        assert db.session.get(Product, product_id).stock == 1
+        assert 'needs a refund' in WebhookEvent.query.one().error
+    
+    assert _orders(app, [order_id]) == [('cancelled', 'RCP0')]
+    assert _reservations(app, order_id) == ['released']
+    assert _events(app) == [('processed', 1)]
+    assert f'Order {order_id} was paid after its stock was released' in caplog.text
+
+def test_a_failed_batch_is_requeued_and_retried(app, monkeypatch):
+    (order_id,), _ = _place_orders(app)
+    _deliver(app, 'ws_CO_0', receipt='RCP0')
+    
+    def broken(changes):
+        raise RuntimeError('summary table is locked')
+    
+    monkeypatch.setattr(webhooks, 'apply_order_changes', broken)
+    with app.app_context(), pytest.raises(RuntimeError):
+        process_webhook_batch()
+    assert _orders(app, [order_id]) == [('pending', 'ws_CO_0')]
+    assert _events(app) == [('pending', 1)]
+    
+    monkeypatch.undo()
+    with app.app_context():
+        assert process_webhook_batch() == 1
+    assert _orders(app, [order_id]) == [('paid', 'RCP0')]
+    assert _events(app) == [('processed', 2)]
+
+def test_events_that_keep_failing_are_parked(app, monkeypatch):
+    _place_orders(app)
+    _deliver(app, 'ws_CO_0')
+    with app.app_context():
+        WebhookEvent.query.update({'attempts': MAX_ATTEMPTS - 1})
+        db.session.commit()
+    
+    def broken(changes):
+        raise RuntimeError('summary table is locked')
+    
+    monkeypatch.setattr(webhooks, 'apply_order_changes', broken)
+    with app.app_context(), pytest.raises(RuntimeError):
+        process_webhook_batch()
+    
+    assert _events(app) == [('failed', MAX_ATTEMPTS)]
+    with app.app_context():
+        assert process_webhook_batch() == 0